@@ -10,7 +10,7 @@ from django.contrib import messages
 from django.contrib.admin.models import LogEntry
 from django.contrib.auth.models import User, Group
 from django.db import transaction, models
-from django.db.models import F, OuterRef, Subquery, Sum, Count, When, Value, Case, ExpressionWrapper
+from django.db.models import F, OuterRef, Subquery, Sum, When, Value, Case, ExpressionWrapper, Exists
 from django.db.models import Q
 from django.db.transaction import atomic
 from django.http import HttpResponse
@@ -25,6 +25,7 @@ from rest_framework.exceptions import ValidationError
 from admin_rest import restful_admin as api_admin
 from admin_rest.fields import BooleanReadOnlyField, WithdrawalSmsConfirmationField, serial_field, \
     CurrencySerialRestField
+from admin_rest.mixins import ExportMixin
 from admin_rest.mixins import JsonListApiViewMixin
 from admin_rest.mixins import NoDeleteMixin, NoCreateMixin
 from admin_rest.mixins import ReadOnlyMixin
@@ -40,6 +41,7 @@ from admin_rest.permissions import IsSuperAdminUser
 from admin_rest.restful_admin import DefaultApiAdmin
 from admin_rest.restful_admin import RestFulModelAdmin
 from admin_rest.utils import get_bots_ids
+from admin_rest.utils import user_rows_count
 from core.balance_manager import BalanceManager
 from core.consts.inouts import DISABLE_COIN_STATES
 from core.consts.orders import SELL
@@ -406,7 +408,7 @@ class ExchangeApiAdmin(DefaultApiAdmin):
 
 
 @api_admin.register(ExecutionResult)
-class ExecutionResultApiAdmin(DefaultApiAdmin):
+class ExecutionResultApiAdmin(ExportMixin, DefaultApiAdmin):
     pass
 
 
@@ -453,7 +455,7 @@ class UserPairDailyStatApiAdmin(DefaultApiAdmin):
 
 
 @api_admin.register(WalletHistoryItem)
-class WalletHistoryItemApiAdmin(DefaultApiAdmin):
+class WalletHistoryItemApiAdmin(ExportMixin, DefaultApiAdmin):
     pass
 
 
@@ -512,14 +514,16 @@ class ExchangeUserApiAdmin(NoCreateMixin, DefaultApiAdmin):
 
     def get_queryset(self):
         qs = super(ExchangeUserApiAdmin, self).get_queryset()
-        return qs.annotate(
+        # no joins with one-to-many relations, so users are not grouped
+        return qs.select_related('profile').annotate(
             withdrawals_sms_confirmation=F("profile__withdrawals_sms_confirmation"),
-            withdrawals_count=Count('withdrawalrequest', distinct=True),
-            orders_count=Count('order', distinct=True),
-            two_fa=Case(
-                When(twofactorsecrettokens__secret__isnull=False, then=Value(True)),
-                default=Value(False),
-                output_field=models.BooleanField()
+            withdrawals_count=user_rows_count(WithdrawalRequest),
+            orders_count=user_rows_count(Order),
+            two_fa=Exists(
+                TwoFactorSecretTokens.objects.filter(
+                    user_id=OuterRef('id'),
+                    secret__isnull=False,
+                )
             ),
             kyc=Case(
                 When(Q(userkyc__forced_approve=True) | Q(userkyc__reviewAnswer=UserKYC.ANSWER_GREEN),
@@ -620,8 +624,9 @@ class ExchangeUserApiAdmin(NoCreateMixin, DefaultApiAdmin):
 
 
 @api_admin.register(Transaction)
-class TransactionApiAdmin(ReadOnlyMixin, DefaultApiAdmin):
+class TransactionApiAdmin(ExportMixin, ReadOnlyMixin, DefaultApiAdmin):
     list_display = ['user', 'created', 'reason', 'currency', 'amount', 'state']
+    export_fields = ['id', 'user__email', 'created', 'reason', 'currency', 'amount', 'state']
     filterset_fields = ['reason', 'currency', 'created', 'state',]
     search_fields = ['user__email']
     ordering = ('-created',)
@@ -645,10 +650,12 @@ class BalanceApiAdmin(ReadOnlyMixin, DefaultApiAdmin):
 
 
 @api_admin.register(AllOrder)
-class AllOrderApiAdmin(ReadOnlyMixin, DefaultApiAdmin):
+class AllOrderApiAdmin(ExportMixin, ReadOnlyMixin, DefaultApiAdmin):
     list_display = ['id', 'user', 'created', 'pair', 'operation', 'type', 'quantity',
                     'quantity_left', 'price', 'amount', 'fee', 'state', 'executed',
                     'state_changed_at']
+    export_fields = ['id', 'user__email', 'in_transaction__created', 'pair', 'operation', 'type', 'quantity',
+                     'quantity_left', 'price', 'amount', 'fee', 'state', 'executed', 'state_changed_at']
     fields = ['id', 'user', 'pair', 'state']
     ordering = ('-created',)
     filterset_fields = ['pair', 'operation', 'state', 'executed', 'created']
@@ -766,9 +773,11 @@ class TopupsApiAdmin(ReadOnlyMixin, DefaultApiAdmin):
 
 
 @api_admin.register(Match)
-class MatchApiAdmin(ReadOnlyMixin, DefaultApiAdmin):
+class MatchApiAdmin(ExportMixin, ReadOnlyMixin, DefaultApiAdmin):
     list_display = ['created', 'pair', 'user1', 'operation',
                     'user2', 'quantity', 'price', 'total', 'fee', ]
+    export_fields = ['id', 'created', 'pair', 'user1_name', 'operation',
+                     'user2_name', 'quantity', 'price', 'total', 'fee']
     filterset_fields = ['order__operation', 'pair', 'created']
     search_fields = ['order__user__email', 'matched_order__user__email']
     ordering = ('-created',)
@@ -1,9 +1,23 @@
+import os
 from decimal import Decimal
 
+from django.http import FileResponse
+from django.http import StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
+from admin_rest import restful_admin as api_admin
 from admin_rest.filters import GenericAllFieldsFilter
+from admin_rest.tasks import export_queryset_task
+from lib.export import EXPORT_FORMATS
+from lib.export import get_export_fields
+from lib.export import get_export_state
+from lib.export import iter_csv
+from lib.export import iter_rows
+from lib.export import new_export_id
+from lib.export import open_export
 
 
 class NoDeleteMixin:
@@ -88,3 +102,57 @@ class JsonListApiViewMixin(object):
 class NonPaginatedListMixin(object):
     """Removes pagination"""
     filter_backends = (GenericAllFieldsFilter, )
+
+
+class ExportMixin:
+    """
+    Exports filtered list to csv streamed from db cursor,
+    or to csv/xlsx file made by background task and downloaded later by export id
+    """
+    export_fields = None  # values_list lookups, concrete model fields by default
+    global_actions = {
+        'export_csv': [],
+        'export_file': [{'name': 'file_format', 'label': 'Format (csv or xlsx)'}],
+        'download_export': [
+            {'name': 'export_id', 'label': 'Export id'},
+            {'name': 'file_format', 'label': 'Format (csv or xlsx)'},
+        ],
+    }
+
+    def get_export_queryset(self):
+        return self.filter_queryset(self.get_queryset())
+
+    @api_admin.action(permissions=('view',), custom_response=True)
+    def export_csv(self, request, queryset):
+        queryset = self.get_export_queryset()
+        fields = get_export_fields(queryset.model, self.export_fields)
+        response = StreamingHttpResponse(iter_csv(fields, iter_rows(queryset, fields)), content_type='text/csv')
+        response['content-disposition'] = f'attachment; filename={queryset.model._meta.model_name}_{timezone.now():%Y%m%d%H%M%S}.csv'
+        return response
+    export_csv.short_description = 'Export CSV'
+
+    @api_admin.action(permissions=('view',))
+    def export_file(self, request, queryset):
+        file_format = request.data.get('file_format') or 'xlsx'
+        if file_format not in EXPORT_FORMATS:
+            raise ValidationError({'file_format': f'One of {", ".join(EXPORT_FORMATS)} expected'})
+        queryset = self.get_export_queryset()
+        fields = get_export_fields(queryset.model, self.export_fields)
+        export_id = new_export_id()
+        export_queryset_task.apply_async([queryset.model._meta.label, queryset.query, fields, file_format, export_id])
+        return {'export_id': export_id, 'file_format': file_format}
+    export_file.short_description = 'Export file in background'
+
+    @api_admin.action(permissions=('view',), custom_response=True)
+    def download_export(self, request, queryset):
+        try:
+            state, result = get_export_state(request.data.get('export_id') or '', request.data.get('file_format') or 'xlsx')
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+        if state == 'pending':
+            return Response({'state': state}, status=status.HTTP_202_ACCEPTED)
+        if state == 'failed':
+            return Response({'state': state, 'error': result}, status=status.HTTP_400_BAD_REQUEST)
+        return FileResponse(open_export(result), as_attachment=True, filename=os.path.basename(result))
+    download_export.short_description = 'Download exported file'
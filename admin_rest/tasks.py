@@ -0,0 +1,18 @@
+import logging
+
+from celery.app import shared_task
+from django.apps import apps
+
+from lib.export import cleanup_exports
+from lib.export import export_queryset
+
+log = logging.getLogger(__name__)
+
+
+@shared_task
+def export_queryset_task(model_label, query, fields, file_format, export_id):
+    cleanup_exports()
+    queryset = apps.get_model(model_label).objects.all()
+    queryset.query = query
+    name = export_queryset(queryset, fields, file_format, export_id)
+    log.info('Export %s saved to storage as %s', export_id, name)
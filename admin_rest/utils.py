@@ -7,7 +7,11 @@ from datetime import datetime
 from django.conf import settings
 from django.contrib.auth.models import User, Permission
 from django.core.files.storage import DefaultStorage
+from django.db.models import Count
+from django.db.models import OuterRef
 from django.db.models import Q
+from django.db.models import Subquery
+from django.db.models.functions import Coalesce
 from django.template.defaultfilters import slugify
 
 from lib.helpers import BOT_RE
@@ -22,6 +26,23 @@ def get_bots_ids():
     return list(User.objects.filter(username__iregex=BOT_RE).values_list('id', flat=True))
 
 
+def user_rows_count(model):
+    """
+    Correlated count of model rows for each selected user,
+    uses user_id index instead of grouping joined tables
+    """
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                user_id=OuterRef('id'),
+            ).order_by().values('user_id').annotate(
+                count=Count('id'),
+            ).values('count')
+        ),
+        0,
+    )
+
+
 def get_user_permissions(user):
     user_permissions = []
     if user.is_superuser:
@@ -4,16 +4,18 @@ import random
 import sys
 import time
 
+from django.conf import settings
 from django.utils import timezone
 
 from bots.cache import previous_ohlc_period_price_cache
 from bots.exceptions import BotExitCondition
 from bots.exchanges.binance import BinanceExchange
+from bots.exchanges.inprocess_exchange import InProcessExchange
 from bots.exchanges.main_exchange import MainExchange
 from bots.helpers import get_ranged_random
 from bots.models import BotConfig
 from bots.structs import OrderType, OrderSide, OrderStruct
-from core.cache import external_exchanges_pairs_price_cache
+from core.cache import get_external_pair_price
 from cryptocoins.tasks import update_crypto_external_prices
 from lib.helpers import pretty_decimal, to_decimal, to_decimal_pretty
 from lib.notifications import send_telegram_message
@@ -40,7 +42,8 @@ class Bot:
         self.user = self.bot_config.user
         self.pair = self.bot_config.pair
         self.log = log
-        self.main_exchange = MainExchange(bot_config, logger=self.log)
+        main_exchange_cls = InProcessExchange if settings.BOTS_IN_PROCESS_EXCHANGE else MainExchange
+        self.main_exchange = main_exchange_cls(bot_config, logger=self.log)
         self.binance = BinanceExchange(bot_config, login=False, logger=self.log)
 
     def run(self):
@@ -58,7 +61,10 @@ class Bot:
 
         self.log.info('Running strategy method %s', strategy_method_name)
         start_time = time.time()
-        strategy_method()
+        try:
+            strategy_method()
+        finally:
+            self.main_exchange.flush()
         self.log.info('Strategy execution time: %s s', f'{(time.time() - start_time):.3f}')
 
     @staticmethod
@@ -108,7 +114,7 @@ class Bot:
                 return
             external_pair_price = self.bot_config.custom_price
         else:
-            external_pair_price = external_exchanges_pairs_price_cache.get(self.pair)
+            external_pair_price = get_external_pair_price(self.pair)
 
         if external_pair_price is None:
             if update_price:
@@ -147,6 +153,7 @@ class Bot:
 
     def cancel_all_orders(self):
         self.main_exchange.cancel_all_orders()
+        self.main_exchange.flush()
 
     def check_low_orders_match(self):
         # Works only with mid_spreading and rand_limit
@@ -214,6 +221,7 @@ class Bot:
             side=OrderSide.SELL if target_order == highest_buy_order else OrderSide.BUY,
         )
         order = self.make_order(counter_order)
+        self.main_exchange.flush()
 
         time.sleep(2)
         self.cancel_order(order_id=order.id)
@@ -223,6 +231,7 @@ class Bot:
         self.log.info("Shutting down. All open orders will be cancelled.")
         try:
             self.main_exchange.cancel_all_orders()
+            self.main_exchange.flush()
         except Exception as e:
             self.log.exception("Unable to cancel orders: %s" % e)
         # cache.set(CACHED_BOT_ORDERS_KEYS + self.settings.name, self.orders, timeout=None)
@@ -248,6 +257,7 @@ class Bot:
         except Exception as e:
             self.log.exception(f'Bot Exception: {e}')
         finally:
+            self.main_exchange.flush()
             time.sleep(2)
             self.cancel_all_orders()
 
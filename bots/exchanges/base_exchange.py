@@ -44,6 +44,10 @@ class BaseExchange:
     def get_cached_orders(self):
         return cache.get(ORDERS_IDS_KEY_PREFIX + self.config.name, []) or []
 
+    def flush(self):
+        """Sends postponed commands, if exchange collects them"""
+        pass
+
     def get_pair(self):
         raise NotImplementedError
 
@@ -0,0 +1,207 @@
+from typing import List, Tuple
+
+from django.core import serializers
+from django.core.cache import cache
+
+from bots.exchanges.base_exchange import BaseExchange
+from bots.exchanges.base_exchange import ORDERS_IDS_KEY_PREFIX
+from bots.structs import OrderSide, OrderType, OrderBookEntryStruct, OrderStruct, AmountPriceStruct
+from core.consts.orders import BATCH_CANCEL, BATCH_PLACE
+from core.consts.orders import BUY, SELL
+from core.models.inouts.balance import Balance
+from core.models.orders import Order
+from core.orderbook.helpers import get_stack_by_pair
+from core.otcupdater import OtcOrdersUpdater
+from core.utils.facade import is_bot_user
+from core.utils.stats.daily import get_pair_last_price
+from lib.helpers import to_decimal, to_decimal_pretty
+from lib.notifications import send_telegram_message
+
+
+class InProcessExchange(BaseExchange):
+    """
+    Main exchange adapter working inside the exchange process.
+    Reads book and balances directly and sends collected place/cancel
+    commands to the pair orders queue as one task on flush()
+    """
+    NAME = 'Main Exchange (in-process)'
+
+    def __init__(self, config, login=True, logger=None):
+        self._commands = []
+        self._balances = None
+        super().__init__(config, login=login, logger=logger)
+
+    def get_pair(self):
+        return self.config.pair.code
+
+    def login(self):
+        self.log.info(f'{self.NAME} does not require login')
+
+    def make_order(self, order):
+        self.log.info(f'Make order: {order}')
+
+        new_order = Order(
+            user=self.config.user,
+            pair=self.config.pair,
+            operation=BUY if order.side == OrderSide.BUY else SELL,
+            quantity=to_decimal_pretty(order.quantity, self.base_symbol_precision),
+        )
+        if order.order_type == OrderType.LIMIT:
+            new_order.type = Order.ORDER_TYPE_LIMIT
+            new_order.price = to_decimal_pretty(order.price, self.quote_symbol_precision)
+        else:
+            new_order.type = Order.ORDER_TYPE_EXTERNAL
+            new_order.otc_limit = to_decimal(0.0001 if order.side == OrderSide.SELL else 100000)
+            new_order.otc_percent = to_decimal(order.otc_percent)
+            price = OtcOrdersUpdater.make_price(self.config.pair, new_order.otc_percent)
+            if order.side == OrderSide.BUY:
+                new_order.price = min(price, new_order.otc_limit)
+            else:
+                new_order.price = max(price, new_order.otc_limit)
+
+        new_order.save(place=False)
+        self._commands.append((BATCH_PLACE, serializers.serialize('json', [new_order])))
+        self.add_order_to_cache(new_order.id)
+        self._hold_local_balance(new_order)
+
+        return OrderStruct(
+            id=new_order.id,
+            price=new_order.price,
+            quantity=new_order.quantity,
+            quantity_left=new_order.quantity_left,
+            side=order.side,
+            order_type=order.order_type,
+            otc_percent=new_order.otc_percent or 0,
+        )
+
+    def cancel_order(self, order_id):
+        self.log.info(f'Cancelling order: {order_id}')
+        self._commands.append((BATCH_CANCEL, order_id))
+        self.remove_order_from_cache(order_id)
+
+    def cancel_all_orders(self):
+        self.log.info(f'Cancelling all orders: {self.orders_ids}')
+        for order in self.opened_orders():
+            self._commands.append((BATCH_CANCEL, order.id))
+        self.orders_ids = []
+        cache.set(ORDERS_IDS_KEY_PREFIX + self.config.name, [], timeout=None)
+
+    def flush(self):
+        """
+        Sends collected commands to the pair stack worker as one task
+        """
+        self._balances = None
+        if not self._commands:
+            return
+
+        from core.tasks.orders import process_orders_batch
+
+        commands, self._commands = self._commands, []
+        self.log.info(f'Sending {len(commands)} commands to {self.get_pair()} stack')
+        process_orders_batch.apply_async([self.get_pair(), commands], queue=f'orders.{self.get_pair().upper()}')
+
+    def _load_balances(self):
+        if self._balances is None:
+            self._balances = {
+                b['currency'].code: b for b in Balance.objects.filter(
+                    user_id=self.config.user_id,
+                ).values('currency', 'amount', 'amount_in_orders')
+            }
+        return self._balances
+
+    def _hold_local_balance(self, order: Order):
+        if self._balances is None:
+            return
+        if order.operation == SELL:
+            code, amount = order.pair.base.code, order.quantity
+        else:
+            code, amount = order.pair.quote.code, order.quantity * order.price
+
+        balance = self._balances.get(code)
+        if balance:
+            balance['amount'] -= amount
+            balance['amount_in_orders'] += amount
+
+    def balance(self):
+        self.log.info(f'Checking {self.NAME} balance')
+        return {code: float(b['amount'] + b['amount_in_orders']) for code, b in self._load_balances().items()}
+
+    def free_balance(self):
+        self.log.info(f'Checking {self.NAME} free balance')
+        return {code: float(b['amount']) for code, b in self._load_balances().items()}
+
+    def opened_orders(self):
+        orders = [OrderStruct(
+            price=o.price,
+            quantity=o.quantity,
+            quantity_left=o.quantity_left,
+            side=OrderSide.BUY if o.operation == Order.OPERATION_BUY else OrderSide.SELL,
+            order_type=OrderType.LIMIT if o.type == Order.ORDER_TYPE_LIMIT else OrderType.AUTO,
+            id=o.id
+        ) for o in Order.objects.filter(
+            id__in=self.orders_ids,
+            state=Order.STATE_OPENED,
+        ).only('id', 'price', 'quantity', 'quantity_left', 'operation', 'type')]
+
+        self.log.info(f'{self.NAME} opened orders: {orders}')
+        return orders
+
+    def price(self):
+        price = get_pair_last_price(self.config.pair)
+        if not price:
+            send_telegram_message(f'Bot {self.config.name} error:\nCant fetch ticker for {self.get_pair()}')
+            raise Exception(f'Cant fetch ticker for {self.get_pair()}')
+
+        price = float(price)
+        self.log.info(f'{self.NAME} ticker price: {price}')
+        return price
+
+    def orderbook(self) -> OrderBookEntryStruct:
+        data = get_stack_by_pair(self.config.pair)
+        buys = data.get('buys', [])
+        sells = data.get('sells', [])
+
+        highest_buy = AmountPriceStruct(
+            price=float(buys[0]['price'] or 0) if buys else 0,
+            amount=float(buys[0]['quantity'] or 0) if buys else 0,
+        )
+        lowest_sell = AmountPriceStruct(
+            price=float(sells[0]['price'] or 0) if sells else 0,
+            amount=float(sells[0]['quantity'] or 0) if sells else 0,
+        )
+
+        return OrderBookEntryStruct(
+            highest_buy=highest_buy,
+            lowest_sell=lowest_sell
+        )
+
+    def get_orders_stack(self) -> Tuple[List[OrderStruct], List[OrderStruct]]:
+        qs = Order.objects.filter(
+            pair=self.config.pair,
+            state=Order.STATE_OPENED,
+            in_stack=True,
+        ).order_by(
+            'price',
+        ).values_list(
+            'id', 'price', 'quantity_left', 'operation', 'user__username',
+        )
+
+        buy_orders = []
+        sell_orders = []
+
+        for order_id, price, quantity_left, operation, username in qs:
+            order_entry = OrderStruct(
+                id=order_id,
+                price=price,
+                quantity=quantity_left,
+                quantity_left=quantity_left,
+                side=OrderSide.BUY if operation == BUY else OrderSide.SELL,
+                is_bot=is_bot_user(username),
+            )
+            if order_entry.side == OrderSide.BUY:
+                buy_orders.append(order_entry)
+            else:
+                sell_orders.append(order_entry)
+
+        buy_orders.sort(reverse=True)
+        return buy_orders, sell_orders
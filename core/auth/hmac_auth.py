@@ -1,10 +1,14 @@
 import hashlib
 import hmac
 import logging
+import threading
 
 from asgiref.sync import sync_to_async
+from cachetools import TTLCache
 from channels.auth import AuthMiddlewareStack
+from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
 from rest_framework import authentication
 from rest_framework import exceptions
 
@@ -13,6 +17,78 @@ from lib.cache import redis_client as redis_c
 
 log = logging.getLogger(__name__)
 
+# checks that cached credentials are actual, then checks nonce and stores the new one in one call.
+# returns -1 if credentials version changed, nonce is not stored then
+NONCE_CHECK_SCRIPT = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[2] then
+    return -1
+end
+local last_nonce = tonumber(redis.call('GET', KEYS[1]) or '0')
+local nonce = tonumber(ARGV[1])
+if last_nonce > 0 and nonce + 3 <= last_nonce then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1])
+return 1
+"""
+
+nonce_check_script = redis_c.register_script(NONCE_CHECK_SCRIPT)
+
+
+class HMACCredentialsCache:
+    """
+    In-process api key => (secret key, user, version) cache.
+    Profile save (User save saves profile too) bumps credentials version of user in redis,
+    version is checked with the nonce, so stale entries are dropped in all processes on their next use
+    """
+    VERSION_KEY_PREFIX = 'hmac-credentials-version-'
+
+    def __init__(self, maxsize, ttl):
+        self._cache = TTLCache(maxsize, ttl)
+        self._api_keys = {}
+        self._lock = threading.Lock()
+
+    def make_version_key(self, user_id):
+        return f'{self.VERSION_KEY_PREFIX}{user_id}'
+
+    def get(self, api_key):
+        """
+        (secret key, user, version) or None
+        """
+        with self._lock:
+            credentials = self._cache.get(api_key)
+        if credentials is not None:
+            return credentials
+
+        profile = Profile.objects.filter(api_key=api_key).select_related('user').only(
+            'secret_key', 'user',
+        ).first()
+        if not profile:
+            return None
+
+        # version is read after profile, entry saved with stale data is dropped on next use
+        version = redis_c.get(self.make_version_key(profile.user_id))
+        credentials = (profile.secret_key, profile.user, version.decode() if version else '')
+        with self._lock:
+            self._cache[api_key] = credentials
+            self._api_keys[profile.user_id] = api_key
+        return credentials
+
+    def drop(self, api_key):
+        with self._lock:
+            self._cache.pop(api_key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            api_key = self._api_keys.pop(user_id, None)
+            if api_key:
+                self._cache.pop(api_key, None)
+        # other processes could load uncommitted data again, so version is bumped after commit
+        transaction.on_commit(lambda: redis_c.incr(self.make_version_key(user_id)))
+
+
+hmac_credentials_cache = HMACCredentialsCache(settings.HMAC_CREDENTIALS_CACHE_SIZE, settings.HMAC_CREDENTIALS_CACHE_TTL)
+
 
 class HMACAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
@@ -57,36 +133,46 @@ def HMACAuthMiddlewareStack(inner):
     return HMACAuthMiddleware(AuthMiddlewareStack(inner))
 
 
-def get_hmac_user(api_key, access_signature, nonce, salt=''):
+def get_hmac_user(api_key, access_signature, nonce, salt='', retry=True):
     try:
         nonce = int(nonce)
     except ValueError:
         raise exceptions.AuthenticationFailed('NONCE must be type of int')
 
-    redis_key = 'api_nonce_' + api_key + salt
-    last_nonce = int(redis_c.get(redis_key) or 0)
-    if last_nonce and nonce + 3 <= last_nonce:
-        raise exceptions.AuthenticationFailed('Incorrect NONCE header')
-
     # find profile
-    profile = Profile.objects.filter(api_key=api_key).first()
-    if not profile:
+    credentials = hmac_credentials_cache.get(api_key)
+    if not credentials:
         raise exceptions.AuthenticationFailed('APIKEY does not exists')
+    secret_key, user, version = credentials
 
     # gen signature
-    secret_key = profile.secret_key.encode('utf-8')
     message = api_key + str(nonce)
     signature = hmac.new(
-        secret_key,
+        secret_key.encode('utf-8'),
         message.encode('utf-8'),
         hashlib.sha256
     ).hexdigest().upper()
 
     # check signature
     if access_signature.upper() == signature.upper():
-        # add nonce to redis
-        redis_c.set(redis_key, nonce)
-        return profile.user
+        # check and add nonce to redis
+        redis_key = 'api_nonce_' + api_key + salt
+        result = nonce_check_script(
+            keys=[redis_key, hmac_credentials_cache.make_version_key(user.id)],
+            args=[nonce, version],
+        )
+        if result == -1:
+            # profile or user changed, check again with credentials from db
+            hmac_credentials_cache.drop(api_key)
+            if not retry:
+                raise exceptions.AuthenticationFailed('Credentials changed')
+            return get_hmac_user(api_key, access_signature, nonce, salt, retry=False)
+        if not result:
+            raise exceptions.AuthenticationFailed('Incorrect NONCE header')
+
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted')
+        return user
 
 
 def get_rest_authorization_header(request):
@@ -1,7 +1,10 @@
 import logging
 
+from django.db import transaction
 from django.db.models import F
 
+from core.cache import balance_cache
+from core.currency import Currency
 from core.exceptions.inouts import NotEnoughFunds
 from core.exceptions.inouts import NotEnoughHold
 from core.models.inouts.balance import Balance
@@ -13,6 +16,32 @@ log = logging.getLogger(__name__)
 
 class BalanceManager:
 
+    @staticmethod
+    def on_change(user_id, currency):
+        """
+        Writes new balance through to cache and notifies user after commit
+        """
+        def _on_commit():
+            try:
+                version = balance_cache.bump_version(user_id)
+                # read after commit and version bump, older writes are discarded by version
+                values = Balance.objects.filter(
+                    user_id=user_id,
+                    currency=currency,
+                ).values_list(
+                    'amount',
+                    'amount_in_orders',
+                ).first()
+                if values:
+                    balance_cache.set(user_id, Currency.get(currency).code, *values, version=version)
+                else:
+                    balance_cache.invalidate(user_id)
+            except Exception as e:
+                log.exception('Unable to update balance cache for user %s: %s', user_id, e)
+            balance_changed.send(sender=BalanceManager, user_id=user_id)
+
+        transaction.on_commit(_on_commit)
+
     @staticmethod
     def set_hold(user_id, currency, amount, amount_in_orders):
         """
@@ -32,7 +61,7 @@ class BalanceManager:
         if result != 1:
             raise NotEnoughFunds()
 
-        balance_changed.send(sender=BalanceManager, user_id=user_id)
+        BalanceManager.on_change(user_id, currency)
 
     @staticmethod
     def free_hold(user_id, currency, amount, amount_in_orders):
@@ -52,7 +81,34 @@ class BalanceManager:
         if result != 1:
             raise NotEnoughHold()
 
-        balance_changed.send(sender=BalanceManager, user_id=user_id)
+        BalanceManager.on_change(user_id, currency)
+
+    @staticmethod
+    def change_hold(user_id, currency, amount):
+        """
+        Moves amount from balance to hold (amount > 0) or back from hold to balance (amount < 0)
+        with one update
+        """
+        amount = to_decimal(amount)
+        if not amount:
+            return
+
+        qs = Balance.objects.filter(
+            user_id=user_id,
+            currency=currency,
+        )
+        if amount > 0:
+            qs = qs.filter(amount__gte=amount)
+
+        result = qs.update(
+            amount=F('amount') - amount,
+            amount_in_orders=F('amount_in_orders') + amount,
+        )
+
+        if result != 1:
+            raise NotEnoughFunds() if amount > 0 else NotEnoughHold()
+
+        BalanceManager.on_change(user_id, currency)
 
     @staticmethod
     def spend_hold(user_id, currency, amount):
@@ -71,7 +127,7 @@ class BalanceManager:
         if result != 1:
             raise NotEnoughHold()
 
-        balance_changed.send(sender=BalanceManager, user_id=user_id)
+        BalanceManager.on_change(user_id, currency)
 
     @staticmethod
     def increase_amount(user_id, currency, amount):
@@ -92,7 +148,7 @@ class BalanceManager:
                 currency=currency,
                 amount=amount,
             )
-        balance_changed.send(sender=BalanceManager, user_id=user_id)
+        BalanceManager.on_change(user_id, currency)
 
     @staticmethod
     def decrease_amount(user_id, currency, amount):
@@ -109,7 +165,7 @@ class BalanceManager:
         if result != 1:
             raise NotEnoughFunds()
 
-        balance_changed.send(sender=BalanceManager, user_id=user_id)
+        BalanceManager.on_change(user_id, currency)
 
     @staticmethod
     def get_amount(user_id, currency):
@@ -2,6 +2,8 @@ from cachetools import TTLCache
 from django.conf import settings
 
 from lib.cache import PrefixedRedisCache
+from lib.cache import redis_client
+from lib.helpers import to_decimal
 
 PAIRS_VOLUME_CACHE_KEY = 'pairs-volume'
 API_CALLBACK_CACHE_KEY = 'api-callback'
@@ -9,12 +11,14 @@ KEEPER_BALANCES_CACHE_KEY = 'keep_balances'
 RESEND_VERIFICATION_TOKEN_CACHE_KEY = 'resend-verification-token-'
 RESEND_VERIFICATION_TOKEN_REVERSED_CACHE_KEY = 'resend-verification-token-reversed-'
 COINS_STATIC_DATA_CACHE_KEY = 'coins-static-data-cache'
+EXTERNAL_PRICES_META_CACHE_KEY = 'prices-meta'
 
 orders_app_cache = PrefixedRedisCache.get_cache(prefix='orders-app-cache-')
 external_exchanges_pairs_price_cache = PrefixedRedisCache.get_cache(prefix='external-exchanges-pairs-price-')
 cryptocompare_pairs_price_cache = PrefixedRedisCache.get_cache(prefix='cryptocompare-pairs-price-')
 facade_cache = PrefixedRedisCache.get_cache(prefix='facade-app-cache-')
 last_pair_price_cache = PrefixedRedisCache.get_cache(prefix='last-pair-price-')
+dashboard_stats_cache = PrefixedRedisCache.get_cache(prefix='dashboard-stats-')
 
 
 maxsize = settings.SETTINGS_CACHE_MAXSIZE if hasattr(
@@ -22,3 +26,137 @@ maxsize = settings.SETTINGS_CACHE_MAXSIZE if hasattr(
 ttl = settings.SETTINGS_CACHE_TTL if hasattr(
     settings, 'SETTINGS_CACHE_TTL') else 60*60
 settings_cache = TTLCache(maxsize, ttl)
+
+external_prices_local_cache = TTLCache(1000, getattr(settings, 'EXTERNAL_PRICES_LOCAL_CACHE_TTL', 1))
+
+
+def get_external_pair_price(pair, default=None):
+    """
+    External pair price with short in-process cache in front of redis
+    """
+    key = str(pair)
+    price = external_prices_local_cache.get(key)
+    if price is None:
+        price = external_exchanges_pairs_price_cache.get(key)
+        if price is None:
+            return default
+        external_prices_local_cache[key] = price
+    return price
+
+
+def get_external_prices_meta() -> dict:
+    """
+    {pair_code: (updated timestamp, source name)} of external prices
+    """
+    return external_exchanges_pairs_price_cache.get(EXTERNAL_PRICES_META_CACHE_KEY) or {}
+
+
+class BalanceCache:
+    """
+    User balances as redis hash {currency code: "amount:amount_in_orders"} per user.
+    Hash is filled from db on first read and then written through by BalanceManager after commit.
+    Every change bumps user version, fill and write-through with older version are discarded
+    """
+    KEY_PREFIX = 'user-balance-'
+    VERSION_KEY_PREFIX = 'balance-version-'
+    LOADED_FIELD = '_loaded'
+
+    # fills hash only if no balance changed since version was read
+    FILL_SCRIPT = """
+    if (redis.call('GET', KEYS[2]) or '') ~= ARGV[1] then
+        return 0
+    end
+    redis.call('DEL', KEYS[1])
+    redis.call('HSET', KEYS[1], unpack(ARGV, 3))
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return 1
+    """
+
+    # write-through goes only to loaded hashes, cold ones are filled from db on read.
+    # newer change could be written already, so hash is dropped instead
+    SET_IF_LOADED_SCRIPT = """
+    if (redis.call('GET', KEYS[2]) or '') ~= ARGV[2] then
+        redis.call('DEL', KEYS[1])
+        return -1
+    end
+    if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+        redis.call('HSET', KEYS[1], ARGV[3], ARGV[4])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, client, ttl):
+        self.client = client
+        self.ttl = ttl
+        self.fill_script = client.register_script(self.FILL_SCRIPT)
+        self.set_if_loaded = client.register_script(self.SET_IF_LOADED_SCRIPT)
+
+    def make_key(self, user_id):
+        return f'{self.KEY_PREFIX}{user_id}'
+
+    def make_version_key(self, user_id):
+        return f'{self.VERSION_KEY_PREFIX}{user_id}'
+
+    @staticmethod
+    def pack(amount, amount_in_orders):
+        return f'{amount}:{amount_in_orders}'
+
+    @staticmethod
+    def unpack(value):
+        amount, amount_in_orders = value.decode().split(':')
+        return to_decimal(amount), to_decimal(amount_in_orders)
+
+    def get(self, user_id):
+        """
+        {currency code: (amount, amount_in_orders)} or None if not loaded
+        """
+        data = self.client.hgetall(self.make_key(user_id))
+        if not data or self.LOADED_FIELD.encode() not in data:
+            return None
+        return {
+            k.decode(): self.unpack(v) for k, v in data.items() if k.decode() != self.LOADED_FIELD
+        }
+
+    def get_version(self, user_id) -> str:
+        """
+        Read before balances are selected from db for fill
+        """
+        version = self.client.get(self.make_version_key(user_id))
+        return version.decode() if version else ''
+
+    def bump_version(self, user_id) -> str:
+        """
+        Called after balance change is committed, before new balance is read
+        """
+        key = self.make_version_key(user_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.incr(key)
+        pipe.expire(key, self.ttl * 2)
+        version, _ = pipe.execute()
+        return str(version)
+
+    def fill(self, user_id, balances, version) -> bool:
+        """
+        balances: {currency code: (amount, amount_in_orders)} selected after version was read
+        """
+        args = [version, self.ttl, self.LOADED_FIELD, 1]
+        for code, values in balances.items():
+            args.extend([code, self.pack(*values)])
+        return bool(self.fill_script(keys=[self.make_key(user_id), self.make_version_key(user_id)], args=args))
+
+    def set(self, user_id, currency_code, amount, amount_in_orders, version):
+        self.set_if_loaded(
+            keys=[self.make_key(user_id), self.make_version_key(user_id)],
+            args=[self.LOADED_FIELD, version, currency_code, self.pack(amount, amount_in_orders)],
+        )
+
+    def invalidate(self, user_id):
+        self.client.delete(self.make_key(user_id))
+
+    def iter_user_ids(self):
+        for key in self.client.scan_iter(match=f'{self.KEY_PREFIX}*', count=1000):
+            yield int(key.decode()[len(self.KEY_PREFIX):])
+
+
+balance_cache = BalanceCache(redis_client, settings.BALANCE_CACHE_TTL)
@@ -33,3 +33,7 @@ OPERATIONS = {
     BUY: 'Buy',
     SELL: 'Sell'
 }
+
+# stack batch commands
+BATCH_PLACE = 'place'
+BATCH_CANCEL = 'cancel'
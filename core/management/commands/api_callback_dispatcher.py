@@ -0,0 +1,16 @@
+import asyncio
+import logging
+
+from django.core.management.base import BaseCommand
+
+from core.utils.api_callbacks import run_api_callback_dispatcher
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Sends order changed callbacks to users api callback urls, must be kept running for callbacks to be delivered'
+
+    def handle(self, *args, **options):
+        log.info('Start api callback dispatcher')
+        asyncio.run(run_api_callback_dispatcher())
@@ -0,0 +1,66 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+
+from core.orderbook.benchmark import DatabaseRunner
+from core.orderbook.benchmark import MemoryRunner
+from core.orderbook.benchmark import PROFILES
+from core.orderbook.benchmark import find_regressions
+from core.orderbook.benchmark import load_baseline
+from core.orderbook.benchmark import measure_stack
+from core.orderbook.benchmark import save_baseline
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Measures matching engine throughput and latency with synthetic order flow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', action='append', choices=list(PROFILES),
+                            help='Order flow profile, all profiles by default')
+        parser.add_argument('--events', type=int, default=10000, help='Measured events for each profile')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--price', default='100', help='Start price of flow')
+        parser.add_argument('--pair', default='BTC-USDT')
+        parser.add_argument('--db', action='store_true',
+                            help='Also run with orders stored in database, changes are rolled back')
+        parser.add_argument('--stack-depth', type=int, default=20000)
+        parser.add_argument('--baseline', help='Baseline json to check regressions against')
+        parser.add_argument('--save-baseline', help='Path to store results as baseline')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed regression share')
+
+    def handle(self, *args, **options):
+        profiles = options['profile'] or list(PROFILES)
+        runners = [MemoryRunner]
+        if options['db']:
+            runners.append(DatabaseRunner)
+
+        reports = []
+        for runner_class in runners:
+            for profile in profiles:
+                log.info('Run %s %s benchmark', runner_class.mode, profile)
+                report = runner_class(options['pair']).run(
+                    profile,
+                    options['events'],
+                    seed=options['seed'],
+                    price=options['price'],
+                )
+                reports.append(report)
+                self.stdout.write(json.dumps(report, indent=2))
+
+        report = measure_stack(options['stack_depth'], options['events'], seed=options['seed'])
+        reports.append(report)
+        self.stdout.write(json.dumps(report, indent=2))
+
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], reports)
+            self.stdout.write(f'Baseline saved to {options["save_baseline"]}')
+
+        if options['baseline']:
+            regressions = find_regressions(reports, load_baseline(options['baseline']), options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions found:\n' + '\n'.join(regressions))
+            self.stdout.write('No regressions found')
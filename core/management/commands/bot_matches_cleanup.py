@@ -2,7 +2,7 @@ import logging
 
 from django.core.management.base import BaseCommand
 
-from core.utils.cleanup_utils import get_orders_to_delete_ids, strip_orders
+from core.utils.archive_utils import archive_bot_matches
 
 log = logging.getLogger(__name__)
 
@@ -10,10 +10,10 @@ log = logging.getLogger(__name__)
 class Command(BaseCommand):
     help = 'Cleanup bots orders and match data'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--only-backup', action='store_true', help='Archive rows without deleting them')
+
     def handle(self, *args, **options):
-        log.info('Get ids')
-        order_ids = get_orders_to_delete_ids()
         log.info('Start cleanup')
-        strip_orders(order_ids)
+        archive_bot_matches(only_backup=options['only_backup'])
         log.info('Done')
-
@@ -2,10 +2,8 @@ import logging.handlers
 import re
 
 from django.utils import translation
-from django_user_agents.utils import get_user_agent
 from ipware import get_client_ip
-from user_agents.parsers import UserAgent
-from core.models.facade import AccessLog
+from core.utils.access_logs import push_access_log
 
 # if not os.path.exists('logs'):
 #     os.mkdir('logs')
@@ -26,7 +24,7 @@ log = logging.getLogger(__name__)
 
 class AccessLogsMiddleware:
     # TODO? https://stackoverflow.com/questions/1275486/django-how-can-i-see-a-list-of-urlpatterns/23874019
-    """Writes django's access logs to table core.AccessLog"""
+    """Writes django's access logs to table core.AccessLog through redis queue"""
     def __init__(self, get_response):
         self.get_response = get_response
 
@@ -53,7 +51,7 @@ class AccessLogsMiddleware:
         if request.META.get('HTTP_CF_CONNECTING_IP'):
             remote_addr = request.META.get('HTTP_CF_CONNECTING_IP')
 
-        user_agent: UserAgent = get_user_agent(request)
+        user_agent = request.META.get('HTTP_USER_AGENT') or '-'
         referer = request.META.get('HTTP_REFERER', '-')
 
         query_string = '&'.join(
@@ -61,18 +59,15 @@ class AccessLogsMiddleware:
         )
         query_string = '?' + query_string if query_string else ''
 
-        try:
-            AccessLog.objects.create(
-                ip=remote_addr,
-                username=username,
-                method=request.method,
-                uri=request.path_info + query_string,
-                status=str(response.status_code),
-                referer=referer,
-                user_agent=user_agent.ua_string or '-',
-            )
-        except Exception as e:
-            log.error(str(e))
+        push_access_log(
+            ip=remote_addr,
+            username=username,
+            method=request.method,
+            uri=request.path_info + query_string,
+            status=str(response.status_code),
+            referer=referer,
+            user_agent=user_agent,
+        )
 
         # data = {
         #     'remote_addr': remote_addr,
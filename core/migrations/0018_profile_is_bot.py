@@ -0,0 +1,34 @@
+# Generated by Django 3.2.18 on 2023-08-21 10:12
+
+from django.db import migrations, models
+from django.db.models import Q
+
+BOT_RE = "^bot[0-9]+@bot.com$"
+USER_TYPE_BOT = 3
+
+
+def mark_bots(apps, schema_editor):
+    Profile = apps.get_model('core', 'Profile')
+    Profile.objects.filter(
+        Q(user__username__iregex=BOT_RE) | Q(user_type=USER_TYPE_BOT)
+    ).update(is_bot=True)
+
+
+def reverse(a, s):
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_new_pair_params'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='is_bot',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+        migrations.RunPython(mark_bots, reverse),
+    ]
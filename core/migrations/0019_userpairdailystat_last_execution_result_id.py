@@ -0,0 +1,18 @@
+# Generated by Django 3.2.18 on 2023-08-24 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_profile_is_bot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpairdailystat',
+            name='last_execution_result_id',
+            field=models.BigIntegerField(db_index=True, default=0),
+        ),
+    ]
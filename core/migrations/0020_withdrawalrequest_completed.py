@@ -0,0 +1,35 @@
+# Generated by Django 3.2.18 on 2023-08-28 11:05
+
+from django.db import migrations, models
+from django.db.models import F
+
+STATE_COMPLETED = 2
+
+
+def fill_completed(apps, schema_editor):
+    WithdrawalRequest = apps.get_model('core', 'WithdrawalRequest')
+    # completion time was not kept before, last update is the closest known one
+    WithdrawalRequest.objects.filter(
+        state=STATE_COMPLETED,
+        completed__isnull=True,
+    ).update(completed=F('updated'))
+
+
+def reverse(a, s):
+    return
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_userpairdailystat_last_execution_result_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='withdrawalrequest',
+            name='completed',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_completed, reverse),
+    ]
@@ -61,6 +61,7 @@ class Profile(BaseModel):
     USER_TYPES = UserTypeEnum.choices()
 
     user_type = models.IntegerField(default=USER_TYPE_DEFAULT, choices=USER_TYPES)
+    is_bot = models.BooleanField(default=False, db_index=True)
 
     user = models.OneToOneField(to=settings.AUTH_USER_MODEL,
                                 on_delete=models.CASCADE, unique=True, related_name='profile')
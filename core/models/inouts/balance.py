@@ -1,3 +1,6 @@
+from django.db import connection
+
+from core.cache import balance_cache
 from core.consts.currencies import ALL_CURRENCIES
 from core.consts.orders import SELL
 from core.currency import CurrencyModelField
@@ -48,10 +51,22 @@ class Balance(UserMixinModel):
             obj, _ = cls.objects.get_or_create(user=user, currency=currency, defaults={'amount': 0})
             return {'actual': obj.amount, 'orders': obj.amount_in_orders, 'currency': currency}
 
+        user_id = getattr(user, 'id', user)
+        balances = balance_cache.get(user_id)
+        if balances is None:
+            # balances changed after this are newer than selected ones, so fill is discarded
+            version = balance_cache.get_version(user_id)
+            balances = {
+                i.currency.code: (i.amount, i.amount_in_orders) for i in cls.objects.filter(user_id=user_id)
+            }
+            # uncommitted changes must not get to cache
+            if not connection.in_atomic_block:
+                balance_cache.fill(user_id, balances, version)
+
         result = {i.code: {'actual': 0, 'orders': 0} for i in ALL_CURRENCIES}
 
-        for i in cls.objects.filter(user=user).all():
-            result[i.currency.code] = {'actual': i.amount, 'orders': i.amount_in_orders}
+        for code, (amount, amount_in_orders) in balances.items():
+            result[code] = {'actual': amount, 'orders': amount_in_orders}
 
         return result
 
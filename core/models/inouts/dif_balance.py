@@ -1,7 +1,7 @@
-from datetime import datetime
-
+from django.db import connection
 from django.db import models
-from django.db.models import Sum, Q
+from django.db.transaction import atomic
+from django.utils import timezone
 
 from core.consts.dif_balance import TYPES, TYPE_BALANCE
 from core.currency import CurrencyModelField
@@ -10,7 +10,82 @@ from core.models.inouts.transaction import TRANSACTION_COMPLETED, TRANSACTION_PE
 from core.models.inouts.transaction import TRANSACTION_CANCELED, TRANSACTION_FAILED
 from exchange.models import UserMixinModel
 from lib.fields import MoneyField
-from lib.utils import suppress_autotime
+
+
+# for balance with previous snapshot:
+#   calc_balance = snapshot balance + completed/pending txs created since snapshot
+#                  - txs cancelled/failed since snapshot but created before it
+# for new balance:
+#   calc_balance = all txs
+PROCESS_SQL = """
+with last_dif as (
+    select distinct on (user_id, currency) user_id, currency, created, balance, sum_diff
+    from {dif}
+    where type = %(type)s
+    order by user_id, currency, id desc
+),
+b as (
+    select b.user_id, b.currency, b.amount,
+           l.created as last_created, l.balance as last_balance, l.sum_diff as last_sum_diff
+    from {balance} b
+    left join last_dif l on l.user_id = b.user_id and l.currency = b.currency
+),
+bounds as (
+    select min(last_created) as min_created from b
+),
+tx_new as (
+    select t.user_id, t.currency, sum(t.amount) as amount
+    from {tx} t
+    join b on b.user_id = t.user_id and b.currency = t.currency and b.last_created is null
+    where t.created <= %(now)s
+    group by t.user_id, t.currency
+),
+tx_done as (
+    select t.user_id, t.currency, sum(t.amount) as amount
+    from {tx} t
+    join b on b.user_id = t.user_id and b.currency = t.currency
+    where t.created > (select min_created from bounds)
+      and t.created > b.last_created
+      and t.created <= %(now)s
+      and t.state = any(%(done_states)s)
+    group by t.user_id, t.currency
+),
+tx_cancelled as (
+    select t.user_id, t.currency, sum(t.amount) as amount
+    from {tx} t
+    join b on b.user_id = t.user_id and b.currency = t.currency
+    where t.updated > (select min_created from bounds)
+      and t.updated > b.last_created
+      and t.updated <= %(now)s
+      and t.state = any(%(cancelled_states)s)
+      and not (t.created > b.last_created and t.created <= %(now)s)
+    group by t.user_id, t.currency
+),
+calc as (
+    select b.user_id, b.currency, b.amount as balance,
+           case when b.last_created is null then coalesce(n.amount, 0) else b.last_balance end as old_balance,
+           case when b.last_created is null then coalesce(n.amount, 0) else coalesce(d.amount, 0) end as txs_amount,
+           case when b.last_created is null then coalesce(n.amount, 0)
+                else b.last_balance + coalesce(d.amount, 0) - coalesce(c.amount, 0) end as calc_balance,
+           b.last_created is null as is_new,
+           coalesce(b.last_sum_diff, 0) as last_sum_diff
+    from b
+    left join tx_new n on n.user_id = b.user_id and n.currency = b.currency
+    left join tx_done d on d.user_id = b.user_id and d.currency = b.currency
+    left join tx_cancelled c on c.user_id = b.user_id and c.currency = b.currency
+)
+insert into {dif} (
+    user_id, currency, type, created, updated, diff, diff_percent,
+    balance, old_balance, calc_balance, txs_amount, sum_diff
+)
+select
+    user_id, currency, %(type)s, %(now)s, %(now)s,
+    balance - calc_balance,
+    case when balance != 0 then (balance - calc_balance) / balance else 0 end,
+    balance, old_balance, calc_balance, txs_amount,
+    case when is_new then 0 else last_sum_diff + balance - calc_balance end
+from calc
+"""
 
 
 class DifBalanceAbstract(UserMixinModel):
@@ -52,85 +127,25 @@ class DifBalanceAbstract(UserMixinModel):
 
     @classmethod
     def process(cls):
-        current_time = datetime.now()
-        balances = Balance.objects.all()
-        for balance in balances:
-            curr_balance = balance.amount
-            old_balance: cls = cls.objects.filter(
-                user=balance.user,
-                currency=balance.currency,
-                type=TYPE_BALANCE
-            ).last()
-
-            if old_balance:
-                sum_amount = Transaction.objects.filter(
-                    (
-                        Q(created__lte=current_time) &
-                        Q(created__gt=old_balance.created) &
-                        Q(state__in=[TRANSACTION_COMPLETED, TRANSACTION_PENDING])
-                    ),
-                    user=balance.user,
-                    currency=balance.currency,
-                ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-                # skip created/pending and then cancelled/failed txs in same period
-                cancelled_amount = Transaction.objects.filter(
-                    (
-                        Q(updated__lte=current_time) &
-                        Q(updated__gt=old_balance.created) &
-                        Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED])
-                    ),
-                    ~Q(
-                        Q(created__lte=current_time) &
-                        Q(created__gt=old_balance.created) &
-                        Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED]),
-                    ),
-                    user=balance.user,
-                    currency=balance.currency,
-                ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-                calculated_balance = old_balance.balance + sum_amount - cancelled_amount
-                diff = curr_balance - calculated_balance
-                diff_percent = diff / curr_balance if curr_balance else 0
-
-                dif = cls(
-                    user=balance.user,
-                    currency=balance.currency,
-                    diff=diff,
-                    diff_percent=diff_percent,
-                    balance=curr_balance,
-                    old_balance=old_balance.balance,
-                    txs_amount=sum_amount,
-                    calc_balance=calculated_balance,
-                    sum_diff=old_balance.sum_diff + diff
-                )
-                with suppress_autotime(dif, ['created']):
-                    dif.created = current_time
-                    dif.save()
-            else:
-                sum_amount = Transaction.objects.filter(
-                    user=balance.user,
-                    currency=balance.currency,
-                    created__lte=current_time  # get transaction only before start process
-                ).aggregate(sum=Sum('amount'))['sum'] or 0
-
-                diff = curr_balance - sum_amount
-                diff_percent = diff / curr_balance if curr_balance else 0
-
-                dif = cls(
-                    user=balance.user,
-                    currency=balance.currency,
-                    diff=curr_balance - sum_amount,
-                    diff_percent=diff_percent,
-                    balance=curr_balance,
-                    old_balance=sum_amount,
-                    txs_amount=sum_amount,
-                    calc_balance=sum_amount,
-                    sum_diff=0
-                )
-                with suppress_autotime(dif, ['created']):
-                    dif.created = current_time
-                    dif.save()
+        """
+        Compares every balance with previous snapshot plus transactions made since it,
+        all balances are processed with one grouped query
+        """
+        current_time = timezone.now()
+        sql = PROCESS_SQL.format(
+            dif=cls._meta.db_table,
+            balance=Balance._meta.db_table,
+            tx=Transaction._meta.db_table,
+        )
+        params = {
+            'type': TYPE_BALANCE,
+            'now': current_time,
+            'done_states': [TRANSACTION_COMPLETED, TRANSACTION_PENDING],
+            'cancelled_states': [TRANSACTION_CANCELED, TRANSACTION_FAILED],
+        }
+        with atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
 
 
 class DifBalance(DifBalanceAbstract):
@@ -163,7 +163,7 @@ class WalletTransactions(BaseModel):
         self.external_accumulation_address = address
         super(WalletTransactions, self).save()
 
-    def check_scoring(self):
+    def check_scoring(self, addr_risk_data=None):
         if self.state not in [self.STATE_WAITING_FOR_KYT_APPROVE, self.STATE_KYT_APPROVE_PLATFORM_ERROR]:
             return
         if ScoreManager.need_to_check_score(self.tx_hash, self.wallet.address, self.amount, self.currency.code):
@@ -174,7 +174,8 @@ class WalletTransactions(BaseModel):
                     self.wallet.address,
                     self.amount,
                     self.wallet.blockchain_currency,
-                    token_currency
+                    token_currency,
+                    addr_risk_data,
                 )
                 if is_scoring_ok:
                     self.topup_tx()
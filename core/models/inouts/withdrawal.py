@@ -5,6 +5,7 @@ from django.db.models import JSONField
 from django.db import models
 from django.db.models import Sum, QuerySet
 from django.db.transaction import atomic
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from rest_framework.exceptions import ValidationError
 
@@ -82,6 +83,8 @@ class WithdrawalRequest(UserMixinModel, BaseModel):
     sci_gate_id = models.IntegerField(null=True, blank=True)
 
     data = JSONField(default=dict, blank=True)
+    # set once when request becomes completed, unlike updated it does not change on later saves
+    completed = models.DateTimeField(null=True, blank=True, db_index=True)
     # SHA-256 hash
     confirmation_token = models.CharField(
         max_length=64, null=True, blank=True, default=None)
@@ -127,6 +130,9 @@ class WithdrawalRequest(UserMixinModel, BaseModel):
                 'type': 'withdrawal_unconfirmed'
             })
 
+        if self.state == COMPLETED and not self.completed:
+            self.completed = timezone.now()
+
         with atomic():
             if not self.id:
                 amount = - self.amount
@@ -150,6 +156,7 @@ class WithdrawalRequest(UserMixinModel, BaseModel):
             self.transaction.state = TRANSACTION_COMPLETED
             self.transaction.save()
             self.state = COMPLETED
+            self.completed = timezone.now()
             super(WithdrawalRequest, self).save()
 
     def cancel(self):
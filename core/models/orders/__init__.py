@@ -1,4 +1,5 @@
 import logging
+from collections import defaultdict
 from decimal import Decimal
 
 from django.conf import settings
@@ -18,9 +19,10 @@ from django.utils.translation import gettext as _
 from rest_framework.exceptions import ValidationError
 
 from core.balance_manager import BalanceManager
-from core.cache import last_pair_price_cache, external_exchanges_pairs_price_cache
+from core.cache import last_pair_price_cache, get_external_pair_price
 from core.consts.inouts import DISABLE_EXCHANGE
 from core.consts.inouts import DISABLE_STACK
+from core.consts.orders import BATCH_CANCEL, BATCH_PLACE
 from core.consts.orders import EXTERNAL, ORDER_REVERT, STOP_LIMIT
 from core.consts.orders import BUY
 from core.consts.orders import EXCHANGE
@@ -50,6 +52,7 @@ from core.models.inouts.transaction import REASON_ORDER_OPENED
 from core.models.inouts.transaction import TRANSACTION_COMPLETED
 from core.models.inouts.transaction import Transaction
 from core.models.inouts.pair import Pair, PairModelField
+from core.models.orders.matching import OrderMatchingMixin
 from core.signals.orders import order_changed
 from core.utils.inouts import is_coin_disabled
 from core.utils.limits import OrderLimitChecker
@@ -60,6 +63,7 @@ from exchange.models import BaseModel
 from exchange.models import UserMixinModel
 from lib.fields import MoneyField
 from lib.helpers import to_decimal, copy_instance, calc_relative_percent_difference
+from lib.tasks import TaskReply
 
 LIMIT = LIMIT  # import
 # needs to prevent zero fee
@@ -68,7 +72,7 @@ MIN_FEE_AMOUNT = to_decimal('0.00000001')
 log = logging.getLogger(__name__)
 
 
-class Order(UserMixinModel, BaseModel):
+class Order(OrderMatchingMixin, UserMixinModel, BaseModel):
     # operations
     OPERATION_BUY = BUY
     OPERATION_SELL = SELL
@@ -148,8 +152,9 @@ class Order(UserMixinModel, BaseModel):
         if self.price is not None and self.price <= 0:
             raise OrderPriceInvalidError()
 
+        place = kwargs.pop('place', True)
         if not self.id:
-            return self.create_order(*args, **kwargs)
+            return self.create_order(*args, place=place, **kwargs)
 
         old_order = type(self).objects.get(pk=self.pk) if self.pk else None
         if old_order and (old_order.state != self.state or old_order.status != self.status):
@@ -206,7 +211,11 @@ class Order(UserMixinModel, BaseModel):
 
         return to_decimal(amount)
 
-    def create_order(self, *args, **kwargs):
+    def create_order(self, *args, place=True, **kwargs):
+        """
+        Holds funds and saves new order.
+        With place=False the caller is responsible for sending order to the stack
+        """
         if self.is_pair_disabled():
             raise CoinOrPairsDisable()
 
@@ -262,7 +271,7 @@ class Order(UserMixinModel, BaseModel):
 
             # transaction.commit()
 
-        if self.id and self.type not in [MARKET, EXCHANGE, STOP_LIMIT]:
+        if place and self.id and self.type not in [MARKET, EXCHANGE, STOP_LIMIT]:
             from core.tasks import orders
 
             data = core_serializer.serialize('json', [self])
@@ -550,6 +559,59 @@ class Order(UserMixinModel, BaseModel):
 
         orders.cancel_order.apply_async(args, queue=self.queue())
 
+    @classmethod
+    def create_orders_batch(cls, orders):
+        """
+        Holds funds for all new orders in one db transaction
+        and sends them to the stack as one batch per pair
+        """
+        with transaction.atomic():
+            for order in orders:
+                order.save(place=False)
+
+        commands = defaultdict(list)
+        for order in orders:
+            if order.type not in [MARKET, EXCHANGE, STOP_LIMIT]:
+                data = core_serializer.serialize('json', [order])
+                commands[order.pair.code].append((BATCH_PLACE, data))
+
+        cls._send_batch_commands(commands)
+        return orders
+
+    @classmethod
+    def cancel_orders_batch(cls, orders):
+        """
+        Sends cancel commands for opened orders to the stack as one batch per pair,
+        orders already on cancel are skipped like in delete
+        """
+        orders = [order for order in orders if order.type not in [MARKET, EXCHANGE] and order.state == ORDER_OPENED]
+        on_cancel = set()
+        if settings.ORDER_DELETE_ATTEMPT_CACHE and orders:
+            on_cancel = set(cache.get_many([f'front_oncancel-{order.id}' for order in orders]))
+
+        commands = defaultdict(list)
+        keys = {}
+        for order in orders:
+            key = f'front_oncancel-{order.id}'
+            if key in on_cancel:
+                log.warning(f'{order.id} already on cancel')
+                continue
+            commands[order.pair.code].append((BATCH_CANCEL, order.id))
+            keys[key] = True
+
+        if settings.ORDER_DELETE_ATTEMPT_CACHE and keys:
+            cache.set_many(keys, 120)
+
+        cls._send_batch_commands(commands)
+        return [order_id for pair_commands in commands.values() for _, order_id in pair_commands]
+
+    @staticmethod
+    def _send_batch_commands(commands):
+        from core.tasks import orders
+
+        for pair_code, pair_commands in commands.items():
+            orders.process_orders_batch.apply_async([pair_code, pair_commands], queue=f'orders.{pair_code.upper()}')
+
     def update_order(self, order_data, nowait=False):
         if self.is_pair_disabled():
             raise CoinOrPairsDisable()
@@ -573,12 +635,12 @@ class Order(UserMixinModel, BaseModel):
 
         args = [order_data]
         from core.tasks import orders
-        f = orders.update_order_wrapped.apply_async(args, queue=self.queue())
 
         if nowait:
+            orders.update_order_wrapped.apply_async(args, queue=self.queue())
             return
 
-        return f.get(timeout=50)
+        return TaskReply.call(orders.update_order_wrapped, args, queue=self.queue(), timeout=50)
 
     def _update_order(self, order_data):
         if self.state != ORDER_OPENED:
@@ -710,37 +772,6 @@ class Order(UserMixinModel, BaseModel):
 
         self.notify(is_cancelled=True)
 
-    def determine_price(self, order):
-        """ `self` is newcome order to process,
-            `order` is order already presents in stack
-             market always has the best price
-             limit has the average price
-        """
-        # price is the price of order already in stack (older)
-        return to_decimal(order.price)
-
-    def quantity_from_cost(self, order):
-        quantityt_left = to_decimal(self.cost)
-        target_quantity = 0
-
-        price = to_decimal(order.price)
-        qty = to_decimal(order.quantity_left)
-
-        quoted_amount = price * qty
-        q = min([quantityt_left, quoted_amount])
-        target_quantity += q / price
-        quantityt_left -= q
-
-        return target_quantity
-
-    def get_vwap(self, quantity, price):
-        cost = to_decimal(to_decimal(quantity) * to_decimal(price))
-        if self.quantity and self.price:
-            cost += to_decimal(to_decimal(self.quantity) * to_decimal(self.price))
-            quantity += to_decimal(self.quantity)
-        result = to_decimal(cost / quantity)
-        return result
-
     def execute(self, order):
         from core.tasks.orders import send_api_callback
 
@@ -748,10 +779,7 @@ class Order(UserMixinModel, BaseModel):
 
         with transaction.atomic():
             assert self.operation != order.operation, 'Operations should be different!'
-            if self.type in [MARKET, EXCHANGE, ] and self.operation == BUY:
-                quantity = to_decimal(min(self.quantity_from_cost(order), order.quantity_left))
-            else:
-                quantity = to_decimal(min(self.quantity_left, order.quantity_left))
+            quantity = self.get_match_quantity(order)
             price = self.determine_price(order)  # TODO: better price determination
 
             self._execute(matched=order, quantity=quantity, price=price)
@@ -771,18 +799,7 @@ class Order(UserMixinModel, BaseModel):
         quantity = to_decimal(quantity)
         price = to_decimal(price)
 
-        if self.type in [MARKET, EXCHANGE, ]:
-            if self.operation == BUY:
-                self.cost -= to_decimal(price * quantity)
-                self.quantity += quantity
-            else:
-                self.quantity_left -= quantity
-
-            self.price = self.get_vwap(quantity, price)
-        else:
-            self.quantity_left -= quantity
-
-        self.quantity_left = to_decimal(self.quantity_left)
+        self.apply_match(quantity, price)
 
         r = ExecutionResult(order=self,
                             user_id=self.user_id,  # ?
@@ -828,8 +845,7 @@ class Order(UserMixinModel, BaseModel):
         r.save()
 
         self.executed = True
-        if (self.type in [MARKET, EXCHANGE, ] and self.cost == to_decimal(0)) or \
-                (to_decimal(self.quantity_left) == to_decimal(0)):
+        if self.is_filled():
             self.state = ORDER_CLOSED
 
         # todo: findout reason
@@ -1018,7 +1034,7 @@ class Order(UserMixinModel, BaseModel):
         if not price:
             price = self.price
 
-        last_price = get_pair_last_price(self.pair) or external_exchanges_pairs_price_cache.get(self.pair)
+        last_price = get_pair_last_price(self.pair) or get_external_pair_price(self.pair)
         custom_price = PairSettings.get_custom_price(self.pair)
 
         if last_price:
@@ -0,0 +1,65 @@
+from core.consts.orders import BUY
+from core.consts.orders import EXCHANGE
+from core.consts.orders import MARKET
+from lib.helpers import to_decimal
+
+
+class OrderMatchingMixin:
+    """
+    Matching arithmetic of order without database access,
+    shared by Order and in-memory orders of the matching benchmark
+    """
+
+    def determine_price(self, order):
+        """ `self` is newcome order to process,
+            `order` is order already presents in stack
+             market always has the best price
+             limit has the average price
+        """
+        # price is the price of order already in stack (older)
+        return to_decimal(order.price)
+
+    def quantity_from_cost(self, order):
+        quantityt_left = to_decimal(self.cost)
+        target_quantity = 0
+
+        price = to_decimal(order.price)
+        qty = to_decimal(order.quantity_left)
+
+        quoted_amount = price * qty
+        q = min([quantityt_left, quoted_amount])
+        target_quantity += q / price
+        quantityt_left -= q
+
+        return target_quantity
+
+    def get_vwap(self, quantity, price):
+        cost = to_decimal(to_decimal(quantity) * to_decimal(price))
+        if self.quantity and self.price:
+            cost += to_decimal(to_decimal(self.quantity) * to_decimal(self.price))
+            quantity += to_decimal(self.quantity)
+        result = to_decimal(cost / quantity)
+        return result
+
+    def get_match_quantity(self, order):
+        if self.type in [MARKET, EXCHANGE, ] and self.operation == BUY:
+            return to_decimal(min(self.quantity_from_cost(order), order.quantity_left))
+        return to_decimal(min(self.quantity_left, order.quantity_left))
+
+    def apply_match(self, quantity, price):
+        if self.type in [MARKET, EXCHANGE, ]:
+            if self.operation == BUY:
+                self.cost -= to_decimal(price * quantity)
+                self.quantity += quantity
+            else:
+                self.quantity_left -= quantity
+
+            self.price = self.get_vwap(quantity, price)
+        else:
+            self.quantity_left -= quantity
+
+        self.quantity_left = to_decimal(self.quantity_left)
+
+    def is_filled(self):
+        return (self.type in [MARKET, EXCHANGE, ] and self.cost == to_decimal(0)) or \
+            (to_decimal(self.quantity_left) == to_decimal(0))
@@ -33,6 +33,9 @@ class UserPairDailyStat(UserMixinModel, BaseModel):
     volume_spent1 = MoneyField(default=0)
     volume_spent2 = MoneyField(default=0)
 
+    # latest ExecutionResult counted in the row
+    last_execution_result_id = models.BigIntegerField(default=0, db_index=True)
+
     def is_empty(self):
         return (self.volume_got1 or self.volume_got2 or self.fee_amount_paid1 or self.fee_amount_paid2 or self.volume_spent1 or self.volume_spent2) == 0
 
@@ -6,7 +6,10 @@ from django.conf import settings
 from django.core.cache import cache
 
 from core.orderbook.helpers import group_by_precision
+from core.orderbook.quotes import make_stack_key
+from core.orderbook.quotes import make_stack_version_key
 
+from lib.metrics import stack_set_cache_seconds
 from lib.utils import threaded_daemon
 from exchange.notifications import stack_notificator
 
@@ -32,20 +35,35 @@ class Actions(object):
         if not self.stack_cache_update_enabled:
             return
 
+        with stack_set_cache_seconds.labels(self.book.pair).time():
+            self._set_cache()
+
+    def _set_cache(self):
         data = self.book.export(settings.STACK_EXPORT_LIMIT)
         pair_code = data['pair']
-        key = f'stack:{pair_code}'
-        cache.set(key, simplejson.dumps(data), timeout=None)
+        self.write_cache(make_stack_key(pair_code), simplejson.dumps(data))
+        # lets quote readers skip parsing of unchanged stack
+        self.write_cache(make_stack_version_key(pair_code), time.time())
         self.notify_stack(data)
 
-        groped_by_precisions_stack_data = group_by_precision(data['pair'], data)
+        groped_by_precisions_stack_data = group_by_precision(
+            data['pair'], data, self.get_stack_precisions(pair_code))
         for precision, grouped_data in groped_by_precisions_stack_data.items():
             key = f'stack:{pair_code}:{precision}'
-            cache.set(key, simplejson.dumps(grouped_data), timeout=None)
+            self.write_cache(key, simplejson.dumps(grouped_data))
             self.notify_stack(grouped_data, precision=precision)
 
         self.last_cache_update = time.time()
 
+    def write_cache(self, key, value):
+        cache.set(key, value, timeout=None)
+
+    def get_stack_precisions(self, pair_code):
+        """
+        None means precisions from pair settings
+        """
+        return None
+
     def set_cache_update(self, enabled=True):
         self.stack_cache_update_enabled = enabled
 
@@ -0,0 +1,454 @@
+"""
+Matching engine benchmark: synthetic order flow replayed through OrderBook
+in memory or with orders stored in database
+"""
+import json
+import random
+import time
+from types import SimpleNamespace
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.consts.orders import BUY
+from core.consts.orders import EXCHANGE
+from core.consts.orders import LIMIT
+from core.consts.orders import MARKET
+from core.consts.orders import OPERATIONS
+from core.consts.orders import ORDER_CANCELED
+from core.consts.orders import ORDER_CLOSED
+from core.consts.orders import ORDER_OPENED
+from core.consts.orders import SELL
+from core.consts.orders import STOP_LIMIT
+from core.models.orders.matching import OrderMatchingMixin
+from core.orderbook.actions import Actions
+from core.orderbook.book import OrderBook
+from core.orderbook.book import OrderProcessor
+from core.orderbook.stack import ASC
+from core.orderbook.stack import BaseStack
+from lib.helpers import to_decimal
+
+# shares of events and resting orders for each side placed before measuring
+PROFILES = {
+    'mixed': {'depth': 500, 'limit': 0.7, 'market': 0.1, 'stop': 0.05, 'cancel': 0.15},
+    'deep_book': {'depth': 20000, 'limit': 0.8, 'market': 0.1, 'stop': 0, 'cancel': 0.1},
+    'heavy_cancels': {'depth': 2000, 'limit': 0.4, 'market': 0.05, 'stop': 0, 'cancel': 0.55},
+}
+
+EVENT_KINDS = ('limit', 'market', 'stop', 'cancel')
+STACK_PRECISIONS = ['0.01', '0.1', '1']
+
+
+def generate_flow(profile, count, seed=0, price=100):
+    """
+    (warmup events, measured events) of ('limit' | 'market' | 'stop' | 'cancel', spec),
+    same seed gives same flow
+    """
+    params = PROFILES[profile]
+    rnd = random.Random(seed)
+    mid = float(price)
+    next_id = 1
+    placed = []
+
+    def limit_spec(aggressive):
+        nonlocal next_id
+        operation = rnd.choice([BUY, SELL])
+        offset = rnd.uniform(0, 0.01) if aggressive else rnd.uniform(0.0005, 0.05)
+        # aggressive orders cross the spread, passive ones rest in the book
+        sign = 1 if (operation == BUY) == aggressive else -1
+        spec = {
+            'id': next_id,
+            'operation': operation,
+            'price': f'{mid * (1 + sign * offset):.2f}',
+            'quantity': f'{rnd.uniform(0.01, 2):.4f}',
+        }
+        next_id += 1
+        placed.append(spec['id'])
+        return spec
+
+    warmup = [('limit', limit_spec(aggressive=False)) for _ in range(params['depth'] * 2)]
+
+    kinds = [kind for kind in EVENT_KINDS if params[kind]]
+    weights = [params[kind] for kind in kinds]
+    events = []
+    for _ in range(count):
+        mid *= 1 + rnd.uniform(-0.0005, 0.0005)
+        kind = rnd.choices(kinds, weights)[0]
+
+        if kind == 'limit':
+            events.append((kind, limit_spec(aggressive=rnd.random() < 0.3)))
+        elif kind == 'market':
+            operation = rnd.choice([BUY, SELL])
+            spec = {'id': next_id, 'operation': operation}
+            if operation == BUY:
+                spec['cost'] = f'{mid * rnd.uniform(0.01, 1):.2f}'
+            else:
+                spec['quantity'] = f'{rnd.uniform(0.01, 1):.4f}'
+            next_id += 1
+            events.append((kind, spec))
+        elif kind == 'stop':
+            spec = limit_spec(aggressive=True)
+            sign = 1 if spec['operation'] == BUY else -1
+            spec['stop'] = f'{mid * (1 + sign * rnd.uniform(0, 0.002)):.2f}'
+            events.append((kind, spec))
+        elif placed:
+            events.append((kind, {'id': placed.pop(rnd.randrange(len(placed)))}))
+    return warmup, events
+
+
+def latency_stats(samples) -> dict:
+    """
+    Latency percentiles in milliseconds
+    """
+    if not samples:
+        return {'count': 0}
+    samples = sorted(samples)
+
+    def percentile(q):
+        return round(samples[int(round(q * (len(samples) - 1)))] * 1000, 4)
+
+    return {
+        'count': len(samples),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': percentile(1),
+    }
+
+
+class MemoryOrder(OrderMatchingMixin):
+    """
+    Order stand-in without database, matching arithmetic is shared with Order.
+    Transactions, execution results, fees and balance holds of Order are skipped
+    """
+    ORDER_TYPE_EXCHANGE = EXCHANGE
+    OPERATION_BUY = BUY
+    OPERATION_SELL = SELL
+
+    def __init__(self, id, operation, type, user, price=None, quantity=0, cost=None, stop=None):
+        self.id = id
+        self.operation = operation
+        self.type = type
+        self.user = user
+        self.user_id = user.id
+        self.price = to_decimal(price) if price is not None else None
+        self.quantity = to_decimal(quantity)
+        self.quantity_left = to_decimal(quantity)
+        self.cost = to_decimal(cost) if cost is not None else None
+        self.stop = to_decimal(stop) if stop is not None else None
+        self.state = ORDER_OPENED
+        self.executed = False
+        self.created = timezone.now()
+
+    @property
+    def operation_str(self):
+        return OPERATIONS[self.operation]
+
+    def __str__(self):
+        return f'<{self.id}:{self.operation_str}:q{self.quantity_left}:p{self.price}>'
+
+    def execute(self, order):
+        quantity = self.get_match_quantity(order)
+        price = self.determine_price(order)
+
+        self._execute(quantity, price)
+        order._execute(quantity, price)
+
+    def _execute(self, quantity, price):
+        self.apply_match(quantity, price)
+        self.executed = True
+        if self.is_filled():
+            self.state = ORDER_CLOSED
+
+    def cancel_order(self):
+        if self.state == ORDER_OPENED:
+            self.state = ORDER_CANCELED
+
+    def close_market(self):
+        if self.type == EXCHANGE:
+            self.cost = None
+            self.state = ORDER_CLOSED
+
+
+class BenchmarkOrderProcessor(OrderProcessor):
+
+    def check_stop_limits(self, order):
+        # stop limits are triggered by the runner instead of celery task
+        if order.type not in [MARKET, EXCHANGE]:
+            self.book.last_trade_price = order.price
+
+
+class BenchmarkActions(Actions):
+    """
+    Serializes stack like set_cache does, without cache writes and notifications
+    """
+
+    def write_cache(self, key, value):
+        pass
+
+    def notify_stack(self, data, precision=None):
+        pass
+
+    def get_stack_precisions(self, pair_code):
+        return STACK_PRECISIONS
+
+
+class BenchmarkOrderBook(OrderBook):
+    ORDER_PROCESSOR_CLASS = BenchmarkOrderProcessor
+    ACTIONS_CLASS = BenchmarkActions
+
+    def __init__(self, pair, *args, **kwargs):
+        super().__init__(pair, *args, **kwargs)
+        self.last_trade_price = None
+
+
+class MemoryRunner:
+    """
+    Replays flow through the book, measures OrderBook.process_order and cancel_order calls
+    """
+    mode = 'memory'
+
+    def __init__(self, pair='BTC-USDT'):
+        self.pair = pair
+        self.book = BenchmarkOrderBook(pair)
+        self.orders = {}
+        self.stops = []
+        self.users = [SimpleNamespace(id=i, username=f'bench{i}@bench.local') for i in (1, 2)]
+
+    def make_order(self, kind, spec):
+        order_type = {'limit': LIMIT, 'market': MARKET, 'stop': STOP_LIMIT}[kind]
+        return MemoryOrder(
+            id=spec['id'],
+            operation=spec['operation'],
+            type=order_type,
+            user=self.users[spec['id'] % 2],
+            price=spec.get('price'),
+            quantity=spec.get('quantity', 0),
+            cost=spec.get('cost'),
+            stop=spec.get('stop'),
+        )
+
+    def apply(self, kind, spec, samples):
+        if kind == 'cancel':
+            order = self.orders.get(spec['id'])
+            if order is None or order.state != ORDER_OPENED:
+                return
+            started = time.perf_counter()
+            self.book.cancel_order(order)
+            samples[kind].append(time.perf_counter() - started)
+            return
+
+        order = self.make_order(kind, spec)
+        if order is None:
+            return
+        self.orders[order.id] = order
+        if kind == 'stop':
+            self.stops.append(order)
+            return
+
+        started = time.perf_counter()
+        self.book.process_order(order)
+        samples[kind].append(time.perf_counter() - started)
+        self.trigger_stops(samples)
+
+    def trigger_stops(self, samples):
+        price = self.book.last_trade_price
+        if price is None or not self.stops:
+            return
+
+        triggered = [
+            order for order in self.stops
+            if (order.operation == BUY and order.stop <= price) or (order.operation == SELL and order.stop >= price)
+        ]
+        for order in triggered:
+            self.stops.remove(order)
+            started = time.perf_counter()
+            self.book.process_order(order)
+            samples['stop'].append(time.perf_counter() - started)
+
+    def measure_set_cache(self, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.book.actions.set_cache()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    def run(self, profile, count, seed=0, price=100, set_cache_repeat=50) -> dict:
+        warmup, events = generate_flow(profile, count, seed=seed, price=price)
+        warmup_samples = {kind: [] for kind in EVENT_KINDS}
+        for kind, spec in warmup:
+            self.apply(kind, spec, warmup_samples)
+
+        samples = {kind: [] for kind in EVENT_KINDS}
+        started = time.perf_counter()
+        for kind, spec in events:
+            self.apply(kind, spec, samples)
+        seconds = time.perf_counter() - started
+
+        all_samples = [i for kind in EVENT_KINDS for i in samples[kind]]
+        return {
+            'profile': profile,
+            'mode': self.mode,
+            'events': len(all_samples),
+            'seconds': round(seconds, 4),
+            'throughput': round(len(all_samples) / seconds, 2) if seconds else 0,
+            'latency': {
+                'all': latency_stats(all_samples),
+                **{kind: latency_stats(samples[kind]) for kind in EVENT_KINDS},
+                'set_cache': latency_stats(self.measure_set_cache(set_cache_repeat)),
+            },
+            'book': {'sells': len(self.book.sells), 'buys': len(self.book.buys)},
+        }
+
+
+class DatabaseRunner(MemoryRunner):
+    """
+    Same flow with Order instances saved to database, so matching makes
+    execution results, transactions and balance updates. All changes are rolled back
+    """
+    mode = 'db'
+
+    def __init__(self, pair='BTC-USDT'):
+        super().__init__(pair)
+        self.users = []
+        self.rejected = 0
+
+    def setup_users(self):
+        from django.contrib.auth.models import User
+        from core.models.inouts.pair import Pair
+        from core.models.inouts.transaction import Transaction
+
+        pair = Pair.get(self.pair)
+        for i in (1, 2):
+            user = User.objects.create_user(f'bench{i}@bench.local', f'bench{i}@bench.local')
+            Transaction.topup(user.id, pair.base, 10 ** 9)
+            Transaction.topup(user.id, pair.quote, 10 ** 12)
+            self.users.append(user)
+
+    def make_order(self, kind, spec):
+        from core.models.inouts.pair import Pair
+        from core.models.orders import Order
+
+        order_type = {'limit': LIMIT, 'market': MARKET, 'stop': STOP_LIMIT}[kind]
+        order = Order(
+            type=order_type,
+            operation=spec['operation'],
+            user=self.users[spec['id'] % 2],
+            pair=Pair.get(self.pair),
+            price=to_decimal(spec['price']) if 'price' in spec else None,
+            quantity=to_decimal(spec.get('quantity', 0)),
+            cost=to_decimal(spec['cost']) if 'cost' in spec else None,
+            stop=to_decimal(spec['stop']) if 'stop' in spec else None,
+            in_stack=kind != 'stop',
+        )
+        try:
+            order.save(place=False)
+        except Exception:
+            self.rejected += 1
+            return None
+        # flow ids are kept for cancels
+        self.orders[spec['id']] = order
+        return order
+
+    def apply(self, kind, spec, samples):
+        if kind == 'cancel':
+            return super().apply(kind, spec, samples)
+        order = self.make_order(kind, spec)
+        if order is None:
+            return
+        if kind == 'stop':
+            self.stops.append(order)
+            return
+
+        started = time.perf_counter()
+        self.book.process_order(order)
+        samples[kind].append(time.perf_counter() - started)
+        self.trigger_stops(samples)
+
+    def run(self, *args, **kwargs) -> dict:
+        with transaction.atomic():
+            self.setup_users()
+            report = super().run(*args, **kwargs)
+            report['rejected'] = self.rejected
+            transaction.set_rollback(True)
+        return report
+
+
+def measure_stack(depth, count, seed=0) -> dict:
+    """
+    BaseStack add and remove latency with depth orders in stack
+    """
+    rnd = random.Random(seed)
+    user = SimpleNamespace(id=1, username='bench1@bench.local')
+    stack = BaseStack(ASC)
+
+    def make(order_id):
+        return MemoryOrder(order_id, SELL, LIMIT, user, price=f'{rnd.uniform(90, 110):.2f}', quantity=1)
+
+    for order_id in range(depth):
+        stack.add(make(order_id))
+
+    orders = [make(depth + i) for i in range(count)]
+    add_samples = []
+    for order in orders:
+        started = time.perf_counter()
+        stack.add(order)
+        add_samples.append(time.perf_counter() - started)
+
+    rnd.shuffle(orders)
+    remove_samples = []
+    for order in orders:
+        started = time.perf_counter()
+        stack.remove(order)
+        remove_samples.append(time.perf_counter() - started)
+
+    return {
+        'profile': 'stack',
+        'mode': 'memory',
+        'depth': depth,
+        'add': latency_stats(add_samples),
+        'remove': latency_stats(remove_samples),
+    }
+
+
+def make_report_key(report):
+    return f'{report["mode"]}:{report["profile"]}'
+
+
+def load_baseline(path) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, reports):
+    with open(path, 'w') as f:
+        json.dump({make_report_key(report): report for report in reports}, f, indent=2, sort_keys=True)
+
+
+def get_latencies(report) -> dict:
+    if 'latency' in report:
+        return report['latency']
+    # stack report
+    return {name: report[name] for name in ('add', 'remove') if name in report}
+
+
+def find_regressions(reports, baseline, tolerance=0.2) -> list:
+    """
+    Messages for reports with throughput lower or p99 latency higher than baseline beyond tolerance
+    """
+    regressions = []
+    for report in reports:
+        key = make_report_key(report)
+        base = baseline.get(key)
+        if not base:
+            continue
+
+        if 'throughput' in report and report['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f'{key}: throughput {report["throughput"]} < baseline {base["throughput"]}')
+
+        for name, stats in get_latencies(report).items():
+            base_p99 = get_latencies(base).get(name, {}).get('p99')
+            if base_p99 and stats.get('p99') and stats['p99'] > base_p99 * (1 + tolerance):
+                regressions.append(f'{key}: {name} p99 {stats["p99"]}ms > baseline {base_p99}ms')
+    return regressions
@@ -106,13 +106,9 @@ class OrderProcessor(object):
         self.logger.debug('Executed totally! {}'.format(self.order))
 
     def execute_order_with_matched(self, orders):
-        from django.core import serializers
-        from core.tasks.orders import stop_limit_processor
-
         for order in orders:
             self.execute_order_with(order)
-            data = serializers.serialize('json', [order])
-            stop_limit_processor.apply_async([data])
+            self.check_stop_limits(order)
             if order.operation == SELL and (
                     order.quantity_left * order.price) < getattr(settings, 'MIN_COST_ORDER_CANCEL', 0.0000001):
                 # order from stack
@@ -126,11 +122,17 @@ class OrderProcessor(object):
             else:
                 self.book.cancel_order(self.order)
 
-        data = serializers.serialize('json', [self.order])
-        stop_limit_processor.apply_async([data])
+        self.check_stop_limits(self.order)
 
         self.logger.debug('processed updated {}'.format(self.order))
 
+    def check_stop_limits(self, order):
+        from django.core import serializers
+        from core.tasks.orders import stop_limit_processor
+
+        data = serializers.serialize('json', [order])
+        stop_limit_processor.apply_async([data])
+
     def execute_order_with(self, order: Order):
         self.logger.debug('matched order {}'.format(order))
         self.order.execute(order)
@@ -233,6 +235,16 @@ class OrderBook(object):
         stack = self.sells if order.operation == SELL else self.buys
         stack.remove(order)
 
+    def reslot_orders(self, orders):
+        """
+        Moves orders with changed prices to their new places in stack
+        """
+        for order in orders:
+            self.remove_order_from_stack(order)
+
+        for order in orders:
+            self.process_order(order)
+
     def is_exists_in_stack(self, order):
         stack = self.sells if order.operation == SELL else self.buys
         return order.id in stack
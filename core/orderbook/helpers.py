@@ -38,13 +38,14 @@ def mark_self_stack(stack, user_id):
     return stack
 
 
-def group_by_precision(pair_code, stack_data):
+def group_by_precision(pair_code, stack_data, stack_precisions=None):
     res = {}
     buys = stack_data['buys']
     sells = stack_data['sells']
 
-    from core.models import PairSettings
-    stack_precisions = PairSettings.get_stack_precisions_by_pair(pair_code)
+    if stack_precisions is None:
+        from core.models import PairSettings
+        stack_precisions = PairSettings.get_stack_precisions_by_pair(pair_code)
 
     for precision in stack_precisions:
         stack_data_copy = stack_data.copy()
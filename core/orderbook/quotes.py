@@ -0,0 +1,96 @@
+import json
+import threading
+from bisect import bisect_left
+
+from django.core.cache import cache
+
+from core.models.inouts.pair import Pair
+from lib.helpers import to_decimal
+
+
+def make_stack_key(pair_code):
+    return f'stack:{pair_code}'
+
+
+def make_stack_version_key(pair_code):
+    return f'stack-version:{pair_code}'
+
+
+class StackSide:
+    """
+    Stack levels in match order with cumulative quantity and cost
+    """
+
+    def __init__(self, levels):
+        self.prices = []
+        self.cum_qty = []
+        self.cum_cost = []
+        total_qty = total_cost = to_decimal(0)
+        for level in levels:
+            price = to_decimal(level['price'])
+            qty = to_decimal(level['quantity'])
+            total_qty += qty
+            total_cost += qty * price
+            self.prices.append(price)
+            self.cum_qty.append(total_qty)
+            self.cum_cost.append(total_cost)
+
+    def cost_for_quantity(self, quantity):
+        """
+        (cost, last level price) to match quantity, (None, None) if stack is not enough
+        """
+        quantity = to_decimal(quantity)
+        i = bisect_left(self.cum_qty, quantity)
+        if i == len(self.cum_qty):
+            return None, None
+        prev_qty = self.cum_qty[i - 1] if i else 0
+        prev_cost = self.cum_cost[i - 1] if i else 0
+        return prev_cost + (quantity - prev_qty) * self.prices[i], self.prices[i]
+
+    def quantity_for_cost(self, cost):
+        """
+        (quantity, last level price) bought for cost, (None, None) if stack is not enough
+        """
+        cost = to_decimal(cost)
+        i = bisect_left(self.cum_cost, cost)
+        if i == len(self.cum_cost):
+            return None, None
+        prev_qty = self.cum_qty[i - 1] if i else 0
+        prev_cost = self.cum_cost[i - 1] if i else 0
+        return prev_qty + (cost - prev_cost) / self.prices[i], self.prices[i]
+
+
+class StackQuotes:
+    """
+    Parsed stacks by pair, reloaded only when stack version in cache changes
+    """
+
+    def __init__(self):
+        self.stacks = {}
+        self.lock = threading.Lock()
+
+    def get_sides(self, pair):
+        pair_code = Pair.get(pair).code.upper()
+        version = cache.get(make_stack_version_key(pair_code))
+        stack = self.stacks.get(pair_code)
+        if stack is not None and version is not None and stack[0] == version:
+            return stack[1]
+
+        with self.lock:
+            data = cache.get(make_stack_key(pair_code))
+            data = json.loads(data) if data else {}
+            sides = {
+                'buys': StackSide(data.get('buys', [])),
+                'sells': StackSide(data.get('sells', [])),
+            }
+            self.stacks[pair_code] = (version, sides)
+        return sides
+
+    def get_side(self, pair, side) -> StackSide:
+        """
+        side: 'buys' or 'sells'
+        """
+        return self.get_sides(pair)[side]
+
+
+stack_quotes = StackQuotes()
@@ -1,10 +1,15 @@
 import logging
+from collections import defaultdict
 from decimal import Decimal
 
 import requests
 from django.conf import settings
 from django.core.cache import cache
+from django.db.transaction import atomic
+from django.utils import timezone
 
+from core.balance_manager import BalanceManager
+from core.exceptions.inouts import NotEnoughFunds, NotEnoughHold
 from core.exceptions.pairs import NotSupportedPairs
 
 try:
@@ -15,9 +20,10 @@ except ImportError:
 
 from django.utils.translation import ugettext_lazy as _
 from core.cache import cryptocompare_pairs_price_cache
-from core.cache import external_exchanges_pairs_price_cache
+from core.cache import get_external_pair_price
 from core.consts.orders import EXTERNAL
 from core.consts.orders import BUY
+from core.consts.orders import ORDER_OPENED
 from core.models import PairSettings
 from core.models.inouts.pair import Pair
 from lib.helpers import calc_relative_percent_difference
@@ -130,7 +136,7 @@ class OtcOrdersUpdater:
     @classmethod
     def get_cached_price(cls, pair_code):
         pair = Pair.get(pair_code)
-        price = to_decimal(external_exchanges_pairs_price_cache.get(pair) or 0)
+        price = to_decimal(get_external_pair_price(pair) or 0)
         return price
 
     @classmethod
@@ -165,6 +171,28 @@ class OtcOrdersBulkUpdater(OtcOrdersUpdater):
         all stack stuff done outside of this code
     """
 
+    def get_order_new_price(self, order):
+        new_price = self.get_new_order_price(order.otc_percent)
+
+        if new_price == 0:
+            return None
+
+        if order.operation == BUY:
+            new_price = min([new_price, order.otc_limit])
+        else:
+            new_price = max([new_price, order.otc_limit])
+
+        if order.price == new_price:
+            return None
+
+        # check deviation
+        if calc_relative_percent_difference(new_price, order.price) > settings.EXTERNAL_PRICES_DEVIATION_PERCENTS:
+            cc_price = cryptocompare_pairs_price_cache.get(order.pair)
+            if cc_price and calc_relative_percent_difference(new_price, cc_price) > settings.CRYPTOCOMPARE_DEVIATION_PERCENTS:
+                return None
+
+        return new_price
+
     def process_orders(self):
         updated_orders = []
         for order in self.orders:
@@ -172,32 +200,105 @@ class OtcOrdersBulkUpdater(OtcOrdersUpdater):
             if order.pair != self.pair or order.type != EXTERNAL:
                 continue
 
-            new_price = self.get_new_order_price(order.otc_percent)
+            new_price = self.get_order_new_price(order)
+            if new_price is None:
+                continue
 
-            if new_price == 0:
+            try:
+                order._update_order({'price': new_price, 'is_external': True})
+            except Exception as e:
+                log.exception('OTCOrderUpdater exception')
                 continue
 
-            if order.operation == BUY:
-                new_price = min([new_price, order.otc_limit])
-            else:
-                new_price = max([new_price, order.otc_limit])
+            order._otc_price_updated = True
+            updated_orders.append(order)
 
-            if order.price == new_price:
+        return updated_orders
+
+
+class OtcOrdersBulkAmendUpdater(OtcOrdersBulkUpdater):
+    """ in stack otc order updater
+        computes all new prices first, then applies hold changes per user,
+        order prices and transactions with bulk queries.
+        all stack stuff done outside of this code
+    """
+
+    def process_orders(self):
+        from core.models.inouts.transaction import REASON_ORDER_CHARGE_RETURN
+        from core.models.inouts.transaction import REASON_ORDER_EXTRA_CHARGE
+        from core.models.inouts.transaction import TRANSACTION_COMPLETED
+        from core.models.inouts.transaction import Transaction
+        from core.models.orders import Order
+
+        # order id => (order, new price, hold amount to return)
+        changes = {}
+        users_amounts = defaultdict(lambda: to_decimal(0))
+
+        for order in self.orders:
+            order._otc_price_updated = False
+            if order.pair != self.pair or order.type != EXTERNAL or order.state != ORDER_OPENED:
                 continue
 
-            # check deviation
-            cc_price = cryptocompare_pairs_price_cache.get(order.pair)
-            if calc_relative_percent_difference(new_price, order.price) > settings.EXTERNAL_PRICES_DEVIATION_PERCENTS:
-                if cc_price and calc_relative_percent_difference(new_price, cc_price) > settings.CRYPTOCOMPARE_DEVIATION_PERCENTS:
-                    continue
+            new_price = self.get_order_new_price(order)
+            if new_price is None:
+                continue
+            new_price = to_decimal(new_price)
+
+            if order.operation == BUY:
+                amount = to_decimal(order.quantity_left * order.price) - to_decimal(order.quantity_left * new_price)
+                new_volume = to_decimal(order.quantity_left * new_price)
+                currency = self.pair.quote
+            else:
+                amount = to_decimal(0)
+                new_volume = to_decimal(order.quantity)
+                currency = self.pair.base
 
             try:
-                order._update_order({'price': new_price, 'is_external': True})
-            except Exception as e:
+                order.LIMIT_CHECKER.check_cost(currency, new_volume, self.pair, order.id)
+            except Exception:
                 log.exception('OTCOrderUpdater exception')
                 continue
 
-            order._otc_price_updated = True
-            updated_orders.append(order)
+            changes[order.id] = (order, new_price, amount)
+            users_amounts[order.user_id] += amount
+
+        if not changes:
+            return []
+
+        now = timezone.now()
+        updated_orders = []
+        transactions = []
+
+        with atomic():
+            for user_id, amount in users_amounts.items():
+                try:
+                    # positive amount is returned from hold
+                    BalanceManager.change_hold(user_id, self.pair.quote, -amount)
+                except (NotEnoughFunds, NotEnoughHold):
+                    log.warning(f'OTCOrderUpdater: not enough funds for user[{user_id}] orders')
+                    changes = {k: v for k, v in changes.items() if v[0].user_id != user_id}
+
+            for order, new_price, amount in changes.values():
+                log.info(f'order update: {order.id}, price: {order.price}, new price: {new_price}')
+                order.price = new_price
+                order.updated = now
+                order._otc_price_updated = True
+                updated_orders.append(order)
+
+                if amount != 0:
+                    transactions.append(Transaction(
+                        reason=REASON_ORDER_EXTRA_CHARGE if amount < 0 else REASON_ORDER_CHARGE_RETURN,
+                        user_id=order.user_id,
+                        currency=self.pair.quote,
+                        amount=amount,
+                        data={'order_id': order.id},
+                        state=TRANSACTION_COMPLETED,
+                    ))
+
+            Order.objects.bulk_update(updated_orders, ['price', 'updated'], batch_size=1000)
+            Transaction.objects.bulk_create(transactions, batch_size=1000)
+
+        for order in updated_orders:
+            order.notify(is_updated=True)
 
         return updated_orders
@@ -194,6 +194,21 @@ class ExchangeRequestSerializer(serializers.Serializer):
         return data
 
 
+class BulkCancelOrdersSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    pair = PairSerialField(required=False)
+    all = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, data):
+        data = serializers.Serializer.validate(self, data)
+        if not data.get('ids') and not data.get('pair') and not data['all']:
+            raise ValidationError({
+                'message': 'ids, pair or all required!',
+                'type': 'wrong_data'
+            })
+        return data
+
+
 class UpdateOrderSerializer(serializers.Serializer):
     id = serializers.IntegerField(required=True)
     price = serializers.DecimalField(min_value=0, required=False, max_digits=32, decimal_places=8)
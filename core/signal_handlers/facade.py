@@ -2,6 +2,7 @@ from django.contrib.auth.models import User
 from django.db.models.signals import post_save, pre_save
 from django.dispatch import receiver
 
+from core.auth.hmac_auth import hmac_credentials_cache
 from core.models.facade import Profile
 from core.models.facade import SmsHistory
 from core.models.facade import SourceOfFunds
@@ -9,6 +10,7 @@ from core.models.facade import TwoFactorSecretTokens
 from core.models.facade import UserKYC
 from core.models.facade import UserRestrictions
 from core.models.inouts.withdrawal import WithdrawalUserLimit
+from core.utils.facade import is_bot_profile
 
 
 @receiver(post_save, sender=User)
@@ -16,7 +18,7 @@ def create_or_save_user(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(
             user=instance,
-            user_type=Profile.USER_TYPE_STAFF if instance.is_staff else Profile.USER_TYPE_DEFAULT
+            user_type=Profile.USER_TYPE_STAFF if instance.is_staff else Profile.USER_TYPE_DEFAULT,
         )
         SourceOfFunds.objects.create(user=instance)
         UserRestrictions.objects.create(user=instance)  # TODO get default data from settings
@@ -27,6 +29,17 @@ def create_or_save_user(sender, instance, created, **kwargs):
     UserKYC.objects.get_or_create(user=instance)
 
 
+@receiver(post_save, sender=Profile)
+def invalidate_hmac_credentials(sender, instance, **kwargs):
+    hmac_credentials_cache.invalidate_user(instance.user_id)
+
+
+@receiver(pre_save, sender=Profile)
+def update_is_bot(sender, instance, *args, **kwargs):
+    # username or user_type may change after creation
+    instance.is_bot = is_bot_profile(instance)
+
+
 @receiver(pre_save, sender=Profile)
 def notify_sof_updated(sender, instance, *args, **kwargs):
     from core.tasks.facade import notify_sof_request_status_changed_user
@@ -6,7 +6,9 @@ from django.core.cache import cache
 from django.db.models import Sum
 
 from lib.helpers import to_decimal
-from core.otcupdater import OtcOrdersBulkUpdater
+from lib.metrics import stack_place_order_seconds
+from core.otcupdater import OtcOrdersBulkAmendUpdater
+from core.consts.orders import BATCH_CANCEL, BATCH_PLACE
 from core.consts.orders import EXTERNAL, STOP_LIMIT, LIMIT
 from core.consts.orders import BUY
 from core.consts.orders import MARKET
@@ -26,6 +28,7 @@ class StackProcessor:
     _instance = None
     _pair_instance = None
     _place_order_delay: int = getattr(settings, 'PLACE_ORDER_DELAY', 300)
+    OTC_UPDATER_CLASS = OtcOrdersBulkAmendUpdater
 
     def __init__(self, loglevel=logging.INFO, pairs=None):
         self.pairs = [i.code.upper() for i in pairs or Pair.objects.all()]
@@ -63,6 +66,9 @@ class StackProcessor:
     def place_order(self, order_data):
         # TODO check if exist order -> except
         order: Order = self.get_order_from_json(order_data)
+        self._place_order(order)
+
+    def _place_order(self, order: Order):
         key = f'place_order-{order.id}'
         if key in cache:
             log.error(f'order[{order.id}] already on place_order; user[{order.user_id}]')
@@ -71,7 +77,32 @@ class StackProcessor:
         cache.set(key, True, self._place_order_delay)
 
         book = self.get_book_for_order(order)
-        book.process_order(order)
+        with stack_place_order_seconds.labels(book.pair).time():
+            book.process_order(order)
+
+    def process_batch(self, pair, commands):
+        """
+        Applies list of (action, payload) commands to the pair book in the given order.
+        action 'place' takes serialized order, 'cancel' takes order id.
+        Stack cache is published once after the whole batch.
+        """
+        book = self._book_by_pair(pair)
+        book.actions.set_cache_update(False)
+
+        try:
+            for action, payload in commands:
+                try:
+                    if action == BATCH_PLACE:
+                        self._place_order(self.get_order_from_json(payload))
+                    elif action == BATCH_CANCEL:
+                        self.cancel_order({'id': payload})
+                    else:
+                        log.error(f'batch: unknown action {action}')
+                except Exception:
+                    log.exception(f'batch: {action} failed; pair[{pair}]')
+        finally:
+            book.actions.set_cache_update(True)
+            book.actions.set_cache()
 
     def get_book_for_order(self, order):
         return self._book_by_pair(order.pair)
@@ -224,21 +255,17 @@ class StackProcessor:
         orders = list(Order.objects.filter(
             type=EXTERNAL,
             state=ORDER_OPENED,
-            pair=pair)
-        )
+            pair=pair,
+        ).select_related(
+            'user',
+        ))
 
         book = self._book_by_pair(pair)
 
-        updater = OtcOrdersBulkUpdater(orders, pair)
+        updater = self.OTC_UPDATER_CLASS(orders, pair)
         orders2reload = updater.start()
 
         book.actions.set_cache_update(False)
-
-        for order in orders2reload:
-            book.remove_order_from_stack(order)
-
-        for order in orders2reload:
-            book.process_order(order)
-
+        book.reslot_orders(orders2reload)
         book.actions.set_cache_update(True)
         book.actions.set_cache()
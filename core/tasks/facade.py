@@ -1,4 +1,6 @@
 import datetime
+import logging
+
 import websocket
 
 from celery.app import shared_task
@@ -17,10 +19,13 @@ from django.utils.translation import ugettext_lazy as _
 from core.models.facade import AccessLog
 from core.models.facade import LoginHistory
 from core.models.facade import UserKYC
+from core.utils import access_logs
 from lib.services.sumsub_client import SumSubClient
 from lib.notifications import send_telegram_message
 from lib.utils import get_domain
 
+log = logging.getLogger(__name__)
+
 
 @shared_task
 def pong():
@@ -89,6 +94,14 @@ def clear_old_logs():
     AccessLog.objects.filter(created__lt=two_weeks_ago).delete()
 
 
+@shared_task
+def flush_access_logs():
+    """Writes queued AccessLog entries to db"""
+    count = access_logs.flush_access_logs()
+    stats = access_logs.get_access_log_queue_stats()
+    log.info('Access logs flushed: %s, queue depth: %s, dropped: %s', count, stats['depth'], stats['dropped'])
+
+
 @shared_task
 def clear_login_history():
     """Clear users login history. Keeps only last 100 entries per each user"""
@@ -10,7 +10,9 @@ from django.template import loader
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from core.cache import balance_cache
 from core.consts.currencies import CURRENCIES_LIST
+from core.models.inouts.balance import Balance
 from core.models.inouts.dif_balance import DifBalance
 from core.models.inouts.dif_balance import DifBalanceMonth
 from core.models.inouts.disabled_coin import DisabledCoin
@@ -20,6 +22,7 @@ from core.models.inouts.withdrawal import CREATED
 from core.models.inouts.withdrawal import WithdrawalRequest
 from core.serializers.orders import ExchangeRequestSerializer
 from core.withdrawal_processor import SCIPayoutsProcessor
+from lib.batch import chunks
 from lib.helpers import to_decimal, pretty_decimal
 from lib.orders_helper import get_cost_and_price
 from lib.utils import memcache_lock
@@ -147,3 +150,30 @@ def send_withdrawal_confirmation_email(withdrawal_request_id):
         from_email=settings.DEFAULT_FROM_EMAIL,
         recipient_list=[withdrawal_request.user.email],
     )
+
+
+@shared_task
+def check_balance_cache(batch_size=1000):
+    """Compares cached user balances with db and drops mismatched ones"""
+    checked = mismatched = 0
+    for user_ids in chunks(balance_cache.iter_user_ids(), batch_size):
+        db_balances = {user_id: {} for user_id in user_ids}
+        for user_id, currency, amount, amount_in_orders in Balance.objects.filter(
+            user_id__in=user_ids,
+        ).values_list('user_id', 'currency', 'amount', 'amount_in_orders'):
+            db_balances[user_id][currency.code] = (to_decimal(amount), to_decimal(amount_in_orders))
+
+        for user_id, balances in db_balances.items():
+            cached = balance_cache.get(user_id)
+            checked += 1
+            if cached is None:
+                continue
+            # zero balances may be missed in cache or in db
+            cached = {k: v for k, v in cached.items() if any(v)}
+            balances = {k: v for k, v in balances.items() if any(v)}
+            if cached != balances:
+                mismatched += 1
+                log.warning('Balance cache mismatch for user %s: cache %s, db %s', user_id, cached, balances)
+                balance_cache.invalidate(user_id)
+
+    log.info('Balance cache checked: %s users, mismatched: %s', checked, mismatched)
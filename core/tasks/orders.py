@@ -1,15 +1,13 @@
 import datetime
 import logging
 
-import requests
 from celery import shared_task
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.contrib.postgres.aggregates import ArrayAgg
-from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.contrib.sites.models import Site
 from django.core import serializers
 from django.core.mail import send_mail
+from django.db import connection
 from django.db.models.aggregates import Sum
 from django.db.transaction import atomic
 from django.template import loader
@@ -17,28 +15,23 @@ from django.utils import timezone
 
 from core.cache import PAIRS_VOLUME_CACHE_KEY
 from core.cache import orders_app_cache
-from core.consts.currencies import ALL_CURRENCIES
 from core.consts.orders import STOP_LIMIT
 from core.currency import Currency
 from core.orderbook.helpers import get_stack_by_pair
 from core.models import PairSettings
-from core.models.facade import Profile
-from core.models.inouts.transaction import REASON_FEE_TOPUP, REASON_ORDER_EXTRA_CHARGE, REASON_ORDER_CHARGE_RETURN
+from core.models.inouts.transaction import REASON_FEE_TOPUP
 from core.models.inouts.transaction import TRANSACTION_COMPLETED
 from core.models.inouts.transaction import Transaction
 from core.models.orders import ExecutionResult
 from core.models.orders import Order
 from core.models.orders import OrderChangeHistory
 from core.models.inouts.pair import Pair
-from core.serializers.orders import OrderSerializer, ExecutionResultApiSerializer
 from core.stack_processor import StackProcessor
-from core.utils.cleanup_utils import get_orders_to_delete_ids, strip_orders
-from core.utils.cleanup_utils import get_transactions_to_delete_ids, strip_transactions
+from core.utils.api_callbacks import enqueue_api_callback
+from core.utils.archive_utils import archive_bot_matches
+from core.utils.cleanup_utils import collapse_extra_transactions
 from core.utils.stats.daily import get_pairs_24h_stats
 from exchange.notifications import pairs_volume_notificator
-from lib.backup_utils import finish_backup
-from lib.backup_utils import prepare_backup
-from lib.helpers import make_hmac_signature_headers
 from lib.tasks import WrappedTaskManager
 
 log = logging.getLogger(__name__)
@@ -53,16 +46,13 @@ def place_order(data):
 
 
 @shared_task
-def update_order_wrapped(data):
+def update_order_wrapped(data, reply_to=None):
     """Updates order via stack worker for the specified pair"""
-    try:
+    def update_order():
         stack_processor = StackProcessor.get_instance()
         stack_processor.update_order(data)
 
-        return WrappedTaskManager.pack_result()
-
-    except Exception as exc:
-        return WrappedTaskManager.pack_exception(exc)
+    return WrappedTaskManager.wrap_fn_and_reply(reply_to, update_order)
 
 
 @shared_task
@@ -74,6 +64,13 @@ def cancel_order(data):
     stack_processor.cancel_order(data)
 
 
+@shared_task
+def process_orders_batch(pair, commands):
+    """Places and cancels batch of orders via stack worker for the specified pair"""
+    stack_processor: StackProcessor = StackProcessor.get_instance()
+    stack_processor.process_batch(pair, commands)
+
+
 @shared_task
 def market_order(data):
     """Creates market order via stack worker for the specified pair"""
@@ -83,9 +80,9 @@ def market_order(data):
 
 
 @shared_task
-def market_order_wrapped(data):
+def market_order_wrapped(data, reply_to=None):
     """Creates market order via stack worker for the specified pair"""
-    return WrappedTaskManager.wrap_fn(market_order, data)
+    return WrappedTaskManager.wrap_fn_and_reply(reply_to, market_order, data)
 
 
 @shared_task
@@ -99,9 +96,9 @@ def exchange_order(data):
 
 
 @shared_task
-def exchange_order_wrapped(data):
+def exchange_order_wrapped(data, reply_to=None):
     """Creates exchange order via stack worker for the specified pair"""
-    return WrappedTaskManager.wrap_fn(exchange_order, data)
+    return WrappedTaskManager.wrap_fn_and_reply(reply_to, exchange_order, data)
 
 
 @shared_task
@@ -113,9 +110,9 @@ def stop_limit_order(data):
 
 
 @shared_task
-def stop_limit_order_wrapped(data):
+def stop_limit_order_wrapped(data, reply_to=None):
     """Creates stop limit order via stack worker for the specified pair"""
-    return WrappedTaskManager.wrap_fn(stop_limit_order, data)
+    return WrappedTaskManager.wrap_fn_and_reply(reply_to, stop_limit_order, data)
 
 
 @shared_task
@@ -191,6 +188,68 @@ def pairs_24h_stats_cache_update():
     pairs_volume_notificator.add_data()
 
 
+FEE_AGGREGATE_CHECKPOINT_KEY = 'aggregate_fee_last_id'
+FEE_AGGREGATE_RANGE_SIZE = 500_000
+# matches with ids up to the latest one older than lag are committed,
+# so checkpoint never passes ids that are still to appear
+FEE_AGGREGATE_LAG = datetime.timedelta(minutes=5)
+
+FEE_AGGREGATE_UPDATE_SQL = """
+update {er} er
+set fee_aggregate_tx_id = v.tx_id
+from {tx} t, (values {values}) as v(currency, tx_id)
+where t.id = er.transaction_id
+  and t.currency = v.currency
+  and er.id > %s and er.id <= %s
+  and not er.cancelled
+  and er.fee_aggregate_tx_id is null
+  and er.fee_amount > 0
+"""
+
+
+def aggregate_fee_range(fee_user, lo, hi):
+    """
+    Collects fees of all currencies from ExecutionResult ids range with one grouped query
+    and tags counted matches with one update.
+    Whole range is taken regardless of created, checkpoint moves past all of it
+    """
+    with atomic():
+        totals = ExecutionResult.objects.filter(
+            id__gt=lo,
+            id__lte=hi,
+            cancelled=False,
+            fee_aggregate_tx__isnull=True,
+            fee_amount__gt=0,
+            transaction__isnull=False,
+        ).values(
+            'transaction__currency',
+        ).annotate(
+            total=Sum('fee_amount'),
+        ).order_by()
+
+        fee_txs = {}
+        for row in totals:
+            currency, fee_amount = row['transaction__currency'], row['total']
+            log.info(f'total fee amount for {currency.code} is {fee_amount}')
+            # saved one by one to update fee user balance
+            t = Transaction(reason=REASON_FEE_TOPUP, state=TRANSACTION_COMPLETED, currency=currency,
+                            amount=fee_amount, user=fee_user)
+            t.save()
+            fee_txs[currency.id] = t.id
+
+        if not fee_txs:
+            return
+
+        sql = FEE_AGGREGATE_UPDATE_SQL.format(
+            er=ExecutionResult._meta.db_table,
+            tx=Transaction._meta.db_table,
+            values=', '.join(['(%s, %s)'] * len(fee_txs)),
+        )
+        params = [item for pair in fee_txs.items() for item in pair]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [lo, hi])
+
+
 @shared_task
 def aggregate_fee(use_prev_day=True):
     """Collects daily fees to special user, specified in settings.FEE_USER"""
@@ -199,25 +258,27 @@ def aggregate_fee(use_prev_day=True):
     if not fee_user:
         log.error('No fee user found! check settings!')
         return
-    for c in ALL_CURRENCIES:
-        with atomic():
-            qs = ExecutionResult.objects \
-                .filter(cancelled=False, fee_aggregate_tx__isnull=True, fee_amount__gt=0) \
-                .filter(transaction__currency=c)
-
-            if use_prev_day:
-                prev_day = (timezone.now() - datetime.timedelta(days=1)).replace(
-                    minute=0, second=0, hour=0, microsecond=0
-                )
-                qs = qs.filter(created__lt=prev_day)
-            fee_amount = qs.aggregate(total=Sum('fee_amount'))['total']
-            log.info(f'total fee amount for {c.code} is {fee_amount}')
-            if not fee_amount:
-                continue
-
-            t = Transaction(reason=REASON_FEE_TOPUP, state=TRANSACTION_COMPLETED, currency=c, amount=fee_amount, user=fee_user)
-            t.save()
-            qs.update(fee_aggregate_tx=t)
+
+    if use_prev_day:
+        ts_before = (timezone.now() - datetime.timedelta(days=1)).replace(
+            minute=0, second=0, hour=0, microsecond=0
+        )
+    else:
+        ts_before = timezone.now() - FEE_AGGREGATE_LAG
+
+    lo = orders_app_cache.get(FEE_AGGREGATE_CHECKPOINT_KEY) or 0
+    # matches after hi are left for next run, not yet aggregated ones before it are taken in full
+    hi = ExecutionResult.objects.filter(
+        created__lt=ts_before,
+    ).order_by('-id').values_list('id', flat=True).first()
+    if not hi or hi <= lo:
+        return
+
+    for range_lo in range(lo, hi, FEE_AGGREGATE_RANGE_SIZE):
+        range_hi = min(range_lo + FEE_AGGREGATE_RANGE_SIZE, hi)
+        aggregate_fee_range(fee_user, range_lo, range_hi)
+        orders_app_cache.set(FEE_AGGREGATE_CHECKPOINT_KEY, range_hi, timeout=None)
+        log.info('fee aggregated for ids %s - %s', range_lo, range_hi)
 
 
 def send_api_callback(user_id, order_id):
@@ -226,38 +287,7 @@ def send_api_callback(user_id, order_id):
 
     cb = get_cached_api_callback_url(user_id)
     if cb:
-        send_order_changed_api_callback_request.apply_async([
-            order_id,
-            user_id,
-        ])
-
-
-@shared_task
-def send_order_changed_api_callback_request(order_id, user_id):
-    profile = Profile.objects.filter(user_id=user_id).only('api_callback_url').first()
-
-    if not profile.api_callback_url:
-        return
-
-    order = Order.objects.filter(pk=order_id).first()
-    data = OrderSerializer(order).data
-
-    er_qs = ExecutionResult.objects.filter(
-        order_id=order_id,
-        cancelled=False,
-    ).only(
-        'id',
-        'price',
-        'quantity',
-    )
-    data['matches'] = ExecutionResultApiSerializer(er_qs, many=True).data
-
-    headers = make_hmac_signature_headers(order.user.profile.api_key, order.user.profile.secret_key)
-    requests.post(
-        url=order.user.profile.api_callback_url,
-        json=data,
-        headers=headers,
-    )
+        enqueue_api_callback(user_id, order_id)
 
 
 @shared_task
@@ -284,27 +314,14 @@ def send_exchange_expired_message(params, lang='en'):
 
 @shared_task
 def bot_matches_cleanup(only_backup=False):
-    """Cleans bot-bot matches and relevant orders and transactions"""
-    prepare_backup()
+    """Archives bot-bot matches and relevant orders and transactions by id ranges"""
     start_time = timezone.now()
     log.info('+' * 10)
-    log.info('Get order ids')
-    order_ids = get_orders_to_delete_ids()
-    log.info('Start cleanup orders')
-    strip_orders(order_ids, only_backup)
-    log.info('Done orders: %s', timezone.now() - start_time)
-
-    log.info('+' * 10)
-    log.info('Get transaction ids')
-    transaction_ids = get_transactions_to_delete_ids()
-    log.info('Txs without foreign count: %s', len(transaction_ids))
-    log.info('Start cleanup transaction without foreign')
-    strip_transactions(transaction_ids, only_backup)
-    log.info('Done transactions: %s', timezone.now() - start_time)
-
+    orders_totals, transactions_totals = archive_bot_matches(only_backup)
+    log.info('Done orders: %s', orders_totals)
+    log.info('Done transactions: %s', transactions_totals)
     log.info('Done: %s', timezone.now() - start_time)
     log.info('+' * 10)
-    finish_backup()
 
 
 @shared_task
@@ -321,58 +338,5 @@ def cleanup_old_order_changes():
 @shared_task()
 def cleanup_extra_transactions():
     """Collapse update order transaction to one transaction"""
-    ts_start = timezone.now()
     ago = timezone.now() - datetime.timedelta(days=3)
-
-    #  aggreggates transactions by order_id
-    grouped_extra_transactions = Transaction.objects.filter(
-        state=TRANSACTION_COMPLETED,
-        reason__in=(
-            REASON_ORDER_EXTRA_CHARGE,
-            REASON_ORDER_CHARGE_RETURN,
-        ),
-        created__lt=ago,
-    ).annotate(
-        oid=KeyTextTransform('order_id', 'data')
-    ).values('oid').annotate(
-        summ=Sum('amount'),
-        tx_ids=ArrayAgg('id')
-    ).values(
-        'oid', 'summ', 'tx_ids'
-    ).order_by('oid')
-
-    log.info(f'query time: %s' % (timezone.now() - ts_start))
-
-    for_start = timezone.now()
-    count_tr: int = 0
-    count_or: int = 0
-
-    for entry in grouped_extra_transactions:
-        order_start = timezone.now()
-        tr_list = entry['tx_ids']
-        order_id = int(entry['oid'])
-        if len(tr_list) <= 1:
-            continue
-
-        first_tx_id = tr_list[0]
-        to_delete_tx_ids = tr_list[1:]
-        sum_amount = entry['summ']
-
-        reason = REASON_ORDER_CHARGE_RETURN if sum_amount > 0 else REASON_ORDER_EXTRA_CHARGE
-        with atomic():
-            # Update only first tx in group
-            Transaction.objects.filter(id=first_tx_id).update(reason=reason, amount=sum_amount)
-            deleted_count = len(to_delete_tx_ids)
-
-            # delete other group txs
-            q = Transaction.objects.filter(pk__in=to_delete_tx_ids)
-            q.delete()
-            log.info(f'==order id: {order_id}, time: {timezone.now() - order_start}, deleted txs: {deleted_count}')
-            count_or += 1
-            log.info(f'Checked {count_or}/{len(grouped_extra_transactions)}')
-
-    log.info(f'for time: %s' % (timezone.now() - for_start))
-
-    log.info(f'count orders: %s' % (count_or))
-    log.info(f'count transactions: %s' % (count_tr))
-    log.info(f'Duration: %s' % (timezone.now() - ts_start))
+    collapse_extra_transactions(ago)
@@ -3,98 +3,36 @@ import datetime
 from celery.app import shared_task
 from django.conf import settings
 from django.db import connection
-from django.db.models import Case
-from django.db.models import F
-from django.db.models import Sum
-from django.db.models import When
-from django.db.models.fields import DateField
-from django.db.models.functions.datetime import Trunc
-from django.db.transaction import atomic
 from django.utils import timezone
 from django.utils.timezone import now
 
 from core.cache import cryptocompare_pairs_price_cache
 from core.cache import external_exchanges_pairs_price_cache
-from core.consts.orders import BUY
-from core.consts.orders import SELL
 from core.models.inouts.disabled_coin import DisabledCoin
 from core.models.inouts.pair_settings import PairSettings
-from core.models.orders import ExecutionResult
 from core.models.stats import ExternalPricesHistory
 from core.models.stats import TradesAggregatedStats
-from core.models.stats import UserPairDailyStat
 from core.models.inouts.pair import Pair
 from core.tasks.orders import run_otc_orders_price_update
+from core.utils.stats import user_stats
 from core.utils.stats.trades_aggregate import TradesAggregator
-from lib.batch import BatchProcessor
-from lib.batch import chunks
 from lib.services.cryptocompare_client import CryptocompareClient
 from lib.helpers import calc_relative_percent_difference
 from lib.services.exchange_api_client import ExchangeClientSession
 
 
-class UserStatsBatchProcessor(BatchProcessor):
-    def process_batch(self, items):
-        UserPairDailyStat.objects.bulk_create(items)
-
-    def make_item(self, obj):
-
-        for k, v in obj.items():
-            if v is None:
-                obj[k] = 0
-        item = UserPairDailyStat(currency1=Pair.get(obj['pair_id']).base, currency2=Pair.get(obj['pair_id']).quote, **obj)
-
-        if item.is_empty():
-            return None
-
-        return item
-
-    def make_qs(self):
-        latest_stat = UserPairDailyStat.objects.all().order_by('-day').first()
-
-        qs = ExecutionResult.objects.filter(cancelled=False).annotate(
-            day=Trunc('created', 'day', output_field=DateField())
-        )
-
-        if latest_stat:
-            qs = qs.filter(day__gt=latest_stat.day)
-
-        qs = qs.filter(day__lt=now().date())
-        qs = qs.values(
-            'user_id',
-            'day',
-            'pair_id'
-        )
-        qs = qs.annotate(
-            volume_got1=Sum(Case(When(order__operation=BUY, then=F('quantity')))),
-            volume_got2=Sum(Case(When(order__operation=SELL, then=F('price') * F('quantity')))),
-            fee_amount_paid1=Sum(Case(When(order__operation=BUY, then=F('fee_amount')))),
-            fee_amount_paid2=Sum(Case(When(order__operation=SELL, then=F('fee_amount')))),
-            volume_spent1=Sum(Case(When(order__operation=SELL, then=F('quantity')))),
-            volume_spent2=Sum(Case(When(order__operation=BUY, then=F('price') * F('quantity')))),
-        )
-        qs = qs.order_by('day')
-        qs = qs.values(
-            'user_id',
-            'day',
-            'pair_id',
-            'volume_got1',
-            'volume_got2',
-            'fee_amount_paid1',
-            'fee_amount_paid2',
-            'volume_spent1',
-            'volume_spent2'
-        )
-        return qs
-
-    def make_batch_iter(self, qs, size):
-        return chunks(qs, size)
+@shared_task
+def accumulate_user_stats():
+    user_stats.accumulate_user_stats()
 
 
 @shared_task
 def make_user_stats():
-    with atomic():
-        UserStatsBatchProcessor().start()
+    """Recounts stats of last days, accumulated counters may miss late or cancelled matches"""
+    user_stats.accumulate_user_stats()
+    today = now().date()
+    for days_ago in range(settings.USER_STATS_RECONCILE_DAYS, 0, -1):
+        user_stats.reconcile_user_stats(today - datetime.timedelta(days=days_ago))
 
 
 @shared_task
@@ -1,3 +1,469 @@
+import asyncio
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db.models import Q
+from django.db.models import Sum
+from django.test import SimpleTestCase
 from django.test import TestCase
+from django.utils import timezone
+
+from core.balance_manager import BalanceManager
+from core.cache import balance_cache
+from core.consts.dif_balance import TYPE_BALANCE
+from core.consts.orders import BUY
+from core.consts.orders import LIMIT
+from core.consts.orders import ORDER_CLOSED
+from core.consts.orders import SELL
+from core.currency import Currency
+from core.models.facade import Profile
+from core.models.inouts.balance import Balance
+from core.models.inouts.dif_balance import DifBalance
+from core.models.inouts.pair import Pair
+from core.models.inouts.transaction import REASON_FEE_TOPUP
+from core.models.inouts.transaction import REASON_MANUAL_TOPUP
+from core.models.inouts.transaction import REASON_ORDER_EXECUTED
+from core.models.inouts.transaction import REASON_ORDER_OPENED
+from core.models.inouts.transaction import TRANSACTION_CANCELED
+from core.models.inouts.transaction import TRANSACTION_COMPLETED
+from core.models.inouts.transaction import TRANSACTION_FAILED
+from core.models.inouts.transaction import TRANSACTION_PENDING
+from core.models.inouts.transaction import Transaction
+from core.models.orders import ExecutionResult
+from core.models.orders import Order
+from core.models.stats import UserPairDailyStat
+from core.orderbook.benchmark import MemoryRunner
+from core.orderbook.benchmark import find_regressions
+from core.orderbook.benchmark import generate_flow
+from core.orderbook.book import PreMatch
+from core.orderbook.quotes import StackSide
+from core.tasks.inouts import check_balance_cache
+from core.tasks.orders import aggregate_fee_range
+from core.utils.access_logs import to_copy_row
+from core.utils.api_callbacks import ApiCallbackDispatcher
+from core.utils.facade import is_bot_profile
+from core.utils.stats.user_stats import accumulate_range
+from lib.countless_pagination import decode_keyset_cursor
+from lib.countless_pagination import encode_keyset_cursor
+from lib.countless_pagination import keyset_page
+from lib.export import iter_csv
+from lib.export import to_cell
+from lib.helpers import to_decimal
+from lib.tests.stub_server import StubServerMixin
+
+STACK = [
+    {'price': 100, 'quantity': 1},
+    {'price': 101, 'quantity': 2},
+    {'price': 103.5, 'quantity': 0.5},
+]
+
+
+class StackSideTest(SimpleTestCase):
+
+    def stack_iter(self):
+        return ((i['price'], i['quantity']) for i in STACK)
+
+    def test_cost_for_quantity_matches_prematch(self):
+        side = StackSide(STACK)
+        for quantity in ['0.5', '1', '2.2', '3.5']:
+            self.assertEqual(
+                side.cost_for_quantity(quantity),
+                PreMatch(self.stack_iter()).find_cost_and_price(quantity),
+            )
+        self.assertEqual(side.cost_for_quantity('3.6'), (None, None))
+
+    def test_quantity_for_cost_matches_prematch(self):
+        side = StackSide(STACK)
+        for cost in ['50', '100', '250', '353.75']:
+            target_qty, price, _ = PreMatch(self.stack_iter()).find_qty_and_price(cost)
+            self.assertEqual(side.quantity_for_cost(cost), (target_qty, price))
+        self.assertEqual(side.quantity_for_cost('400'), (None, None))
+
+
+class ApiCallbackDispatcherTest(StubServerMixin, SimpleTestCase):
+
+    def setUp(self):
+        self.received = []
+        self.fail_first = {3, 7}
+        self.server = self.start_stub_server(self.respond)
+        self.url = f'{self.server.url}/callback'
+
+    def respond(self, body):
+        order_id = body['id']
+        if order_id in self.fail_first:
+            self.fail_first.discard(order_id)
+            return 503, None
+        self.received.append(order_id)
+        return 200, None
+
+    def test_send_many_with_retries(self):
+        requests = [(self.url, {'id': i}, {}) for i in range(50)]
+
+        async def send():
+            async with ApiCallbackDispatcher.make_session() as session:
+                dispatcher = ApiCallbackDispatcher(session, rate=1000, retries=2, backoff=0.01)
+                return await dispatcher.send_many(requests)
+
+        results = asyncio.run(send())
+        self.assertTrue(all(results))
+        self.assertEqual(sorted(self.received), list(range(50)))
+
+
+class MatchingBenchmarkTest(SimpleTestCase):
+
+    def test_flow_is_reproducible(self):
+        self.assertEqual(generate_flow('mixed', 200, seed=3), generate_flow('mixed', 200, seed=3))
+        self.assertNotEqual(generate_flow('mixed', 200, seed=3), generate_flow('mixed', 200, seed=4))
+
+    def test_memory_run(self):
+        report = MemoryRunner().run('mixed', 300, seed=1, set_cache_repeat=3)
+        self.assertEqual(report['mode'], 'memory')
+        self.assertGreater(report['events'], 0)
+        self.assertGreater(report['latency']['limit']['count'], 0)
+        self.assertEqual(report['latency']['set_cache']['count'], 3)
+
+        baseline = {'memory:mixed': dict(report, throughput=report['throughput'] * 2)}
+        self.assertEqual(len(find_regressions([report], baseline)), 1)
+        self.assertEqual(find_regressions([report], {'memory:mixed': report}), [])
+
+
+class ExportTest(SimpleTestCase):
+
+    def test_csv_lines(self):
+        rows = ([to_cell(v) for v in row] for row in [(1, Decimal('0.5'), None), (2, {'a': 1}, 'x,y')])
+        lines = list(iter_csv(['id', 'amount', 'note'], rows))
+        self.assertEqual(lines, ['id,amount,note\r\n', '1,0.5,\r\n', '2,"{""a"": 1}","x,y"\r\n'])
+
+
+class AccessLogsTest(SimpleTestCase):
+
+    def test_copy_row_has_no_nulls(self):
+        row = to_copy_row({'created': '2024-01-01T00:00:00+00:00', 'ip': None, 'referer': '', 'method': 'X' * 30,
+                           'status': 200})
+        self.assertEqual(row, ['2024-01-01T00:00:00+00:00', '', '', 'X' * 20, '', '', '200', ''])
+
+
+class IsBotProfileTest(SimpleTestCase):
+
+    def test_username_or_user_type(self):
+        def profile(username, user_type=Profile.USER_TYPE_DEFAULT):
+            return Profile(user=User(username=username), user_type=user_type)
+
+        self.assertTrue(is_bot_profile(profile('bot12@bot.com')))
+        self.assertTrue(is_bot_profile(profile('Bot12@Bot.com')))
+        self.assertTrue(is_bot_profile(profile('mm@example.com', Profile.USER_TYPE_BOT)))
+        self.assertFalse(is_bot_profile(profile('bot12@example.com')))
+
+
+class MatchesMixin:
+    """
+    Orders, matches and their transactions made with bulk_create,
+    order placing and balance updates are skipped
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.pair, _ = Pair.objects.get_or_create(base=Currency.get('BTC'), quote=Currency.get('USDT'))
+        self.buyer, self.seller = User.objects.bulk_create([
+            User(username='buyer@example.com', email='buyer@example.com'),
+            User(username='seller@example.com', email='seller@example.com'),
+        ])
+
+    def add_match(self, quantity, price, fee_rate='0.001', cancelled=False) -> list:
+        """
+        [buyer match, seller match], fee is paid in received currency
+        """
+        quantity, price, fee_rate = to_decimal(quantity), to_decimal(price), to_decimal(fee_rate)
+        base, quote = self.pair.base, self.pair.quote
+        cost = to_decimal(quantity * price)
+        buy_fee, sell_fee = to_decimal(quantity * fee_rate), to_decimal(cost * fee_rate)
+
+        buy_tx, sell_tx, buy_executed_tx, sell_executed_tx = Transaction.objects.bulk_create([
+            Transaction(user=self.buyer, currency=quote, amount=-cost, reason=REASON_ORDER_OPENED,
+                        state=TRANSACTION_COMPLETED),
+            Transaction(user=self.seller, currency=base, amount=-quantity, reason=REASON_ORDER_OPENED,
+                        state=TRANSACTION_COMPLETED),
+            Transaction(user=self.buyer, currency=base, amount=quantity - buy_fee, reason=REASON_ORDER_EXECUTED,
+                        state=TRANSACTION_COMPLETED),
+            Transaction(user=self.seller, currency=quote, amount=cost - sell_fee, reason=REASON_ORDER_EXECUTED,
+                        state=TRANSACTION_COMPLETED),
+        ])
+        buy, sell = Order.objects.bulk_create([
+            Order(user=self.buyer, pair=self.pair, type=LIMIT, operation=BUY, state=ORDER_CLOSED,
+                  quantity=quantity, quantity_left=0, price=price, in_transaction=buy_tx),
+            Order(user=self.seller, pair=self.pair, type=LIMIT, operation=SELL, state=ORDER_CLOSED,
+                  quantity=quantity, quantity_left=0, price=price, in_transaction=sell_tx),
+        ])
+        return ExecutionResult.objects.bulk_create([
+            ExecutionResult(user=self.buyer, order=buy, matched_order=sell, pair=self.pair, quantity=quantity,
+                            price=price, fee_rate=fee_rate, fee_amount=buy_fee, transaction=buy_executed_tx,
+                            cancelled=cancelled),
+            ExecutionResult(user=self.seller, order=sell, matched_order=buy, pair=self.pair, quantity=quantity,
+                            price=price, fee_rate=fee_rate, fee_amount=sell_fee, transaction=sell_executed_tx,
+                            cancelled=cancelled),
+        ])
+
+
+class UserStatsTest(MatchesMixin, TestCase):
+
+    def get_stats(self):
+        return {
+            stat.user_id: (stat.volume_got1, stat.volume_got2, stat.fee_amount_paid1, stat.fee_amount_paid2,
+                           stat.volume_spent1, stat.volume_spent2)
+            for stat in UserPairDailyStat.objects.filter(pair=self.pair)
+        }
+
+    def test_replay_is_idempotent(self):
+        matches = self.add_match('1', '100') + self.add_match('0.5', '110') + self.add_match('2', '90', cancelled=True)
+        lo, hi = matches[0].id - 1, matches[-1].id
+
+        accumulate_range(lo, hi)
+        stats = self.get_stats()
+        self.assertEqual(stats[self.buyer.id], (Decimal('1.5'), 0, Decimal('0.0015'), 0, 0, Decimal('155')))
+        self.assertEqual(stats[self.seller.id], (0, Decimal('155'), 0, Decimal('0.155'), Decimal('1.5'), 0))
+
+        accumulate_range(lo, hi)
+        self.assertEqual(self.get_stats(), stats)
+
+        # range replayed with new matches adds only them
+        matches = self.add_match('1', '120')
+        accumulate_range(lo, matches[-1].id)
+        self.assertEqual(self.get_stats()[self.buyer.id][0], Decimal('2.5'))
+        self.assertEqual(self.get_stats()[self.seller.id][1], Decimal('275'))
+
+
+class AggregateFeeTest(MatchesMixin, TestCase):
+
+    def test_fee_split_per_currency(self):
+        fee_user, = User.objects.bulk_create([User(username='fee@example.com', email='fee@example.com')])
+        matches = self.add_match('1', '100') + self.add_match('2', '110') + self.add_match('1', '90', cancelled=True)
+        lo, hi = matches[0].id - 1, matches[-1].id
+
+        aggregate_fee_range(fee_user, lo, hi)
+        fee_txs = {
+            t.currency.code: t for t in Transaction.objects.filter(user=fee_user, reason=REASON_FEE_TOPUP)
+        }
+        self.assertEqual(
+            {code: t.amount for code, t in fee_txs.items()},
+            {'BTC': Decimal('0.003'), 'USDT': Decimal('0.32')},
+        )
+
+        # every match is tagged with fee tx of its currency, cancelled ones are left
+        for match in ExecutionResult.objects.filter(id__in=[m.id for m in matches]).select_related('transaction'):
+            expected = None if match.cancelled else fee_txs[match.transaction.currency.code].id
+            self.assertEqual(match.fee_aggregate_tx_id, expected)
+
+        aggregate_fee_range(fee_user, lo, hi)
+        self.assertEqual(Transaction.objects.filter(user=fee_user, reason=REASON_FEE_TOPUP).count(), 2)
+
+
+class BalanceCacheTest(TestCase):
+
+    def setUp(self):
+        self.user, = User.objects.bulk_create([User(username='cache@example.com', email='cache@example.com')])
+        self.btc = Currency.get('BTC')
+        self.addCleanup(balance_cache.invalidate, self.user.id)
+        self.addCleanup(balance_cache.client.delete, balance_cache.make_version_key(self.user.id))
+
+    def fill(self, balances):
+        return balance_cache.fill(self.user.id, balances, balance_cache.get_version(self.user.id))
+
+    def test_fill_and_write_through(self):
+        Balance.objects.create(user=self.user, currency=self.btc, amount=1)
+        self.assertIsNone(balance_cache.get(self.user.id))
+
+        self.assertTrue(self.fill({'BTC': (Decimal('1'), Decimal('0'))}))
+        self.assertEqual(balance_cache.get(self.user.id), {'BTC': (Decimal('1'), Decimal('0'))})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            BalanceManager.increase_amount(self.user.id, self.btc, Decimal('2'))
+        self.assertEqual(balance_cache.get(self.user.id), {'BTC': (Decimal('3'), Decimal('0'))})
+
+    def test_write_through_skips_cold_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            BalanceManager.increase_amount(self.user.id, self.btc, Decimal('2'))
+        self.assertIsNone(balance_cache.get(self.user.id))
+
+    def test_stale_fill_is_discarded(self):
+        version = balance_cache.get_version(self.user.id)
+        # balance changed after version was read and before fill
+        balance_cache.bump_version(self.user.id)
+
+        self.assertFalse(balance_cache.fill(self.user.id, {'BTC': (Decimal('1'), Decimal('0'))}, version))
+        self.assertIsNone(balance_cache.get(self.user.id))
+
+    def test_stale_write_through_drops_cache(self):
+        self.fill({'BTC': (Decimal('1'), Decimal('0'))})
+        stale_version = balance_cache.bump_version(self.user.id)
+        balance_cache.bump_version(self.user.id)
+
+        balance_cache.set(self.user.id, 'BTC', Decimal('5'), Decimal('0'), version=stale_version)
+        self.assertIsNone(balance_cache.get(self.user.id))
+
+    def test_check_drops_mismatched_cache(self):
+        Balance.objects.create(user=self.user, currency=self.btc, amount=1)
+
+        self.fill({'BTC': (Decimal('1'), Decimal('0')), 'ETH': (Decimal('0'), Decimal('0'))})
+        check_balance_cache()
+        self.assertIsNotNone(balance_cache.get(self.user.id))
+
+        self.fill({'BTC': (Decimal('3'), Decimal('0'))})
+        check_balance_cache()
+        self.assertIsNone(balance_cache.get(self.user.id))
+
+
+def legacy_dif_balance(balance, current_time):
+    """
+    Snapshot values as computed by former per-balance loop of DifBalance.process
+    """
+    old_balance = DifBalance.objects.filter(
+        user=balance.user,
+        currency=balance.currency,
+        type=TYPE_BALANCE,
+    ).last()
+
+    if not old_balance:
+        sum_amount = Transaction.objects.filter(
+            user=balance.user,
+            currency=balance.currency,
+            created__lte=current_time,
+        ).aggregate(sum=Sum('amount'))['sum'] or 0
+        return {
+            'diff': balance.amount - sum_amount,
+            'balance': balance.amount,
+            'old_balance': sum_amount,
+            'txs_amount': sum_amount,
+            'calc_balance': sum_amount,
+            'sum_diff': 0,
+        }
+
+    sum_amount = Transaction.objects.filter(
+        Q(created__lte=current_time) & Q(created__gt=old_balance.created)
+        & Q(state__in=[TRANSACTION_COMPLETED, TRANSACTION_PENDING]),
+        user=balance.user,
+        currency=balance.currency,
+    ).aggregate(sum=Sum('amount'))['sum'] or 0
+    cancelled_amount = Transaction.objects.filter(
+        Q(updated__lte=current_time) & Q(updated__gt=old_balance.created)
+        & Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED]),
+        ~Q(
+            Q(created__lte=current_time) & Q(created__gt=old_balance.created)
+            & Q(state__in=[TRANSACTION_CANCELED, TRANSACTION_FAILED]),
+        ),
+        user=balance.user,
+        currency=balance.currency,
+    ).aggregate(sum=Sum('amount'))['sum'] or 0
+
+    calculated_balance = old_balance.balance + sum_amount - cancelled_amount
+    diff = balance.amount - calculated_balance
+    return {
+        'diff': diff,
+        'balance': balance.amount,
+        'old_balance': old_balance.balance,
+        'txs_amount': sum_amount,
+        'calc_balance': calculated_balance,
+        'sum_diff': old_balance.sum_diff + diff,
+    }
+
+
+class DifBalanceTest(TestCase):
+
+    def setUp(self):
+        self.user, = User.objects.bulk_create([User(username='dif@example.com', email='dif@example.com')])
+        self.btc, self.usdt = Currency.get('BTC'), Currency.get('USDT')
+        self.now = timezone.now()
+
+    def add_tx(self, currency, amount, state, created, updated=None):
+        tx, = Transaction.objects.bulk_create([
+            Transaction(user=self.user, currency=currency, amount=amount, reason=REASON_MANUAL_TOPUP, state=state)
+        ])
+        Transaction.objects.filter(id=tx.id).update(created=created, updated=updated or created)
+
+    def test_parity_with_loop(self):
+        snapshot_time = self.now - datetime.timedelta(hours=1)
+        snapshot = DifBalance.objects.create(user=self.user, currency=self.btc, type=TYPE_BALANCE,
+                                             balance=Decimal('10'), sum_diff=Decimal('0.5'))
+        DifBalance.objects.filter(id=snapshot.id).update(created=snapshot_time)
+
+        def minutes(m):
+            return snapshot_time + datetime.timedelta(minutes=m)
+
+        # before snapshot
+        self.add_tx(self.btc, '5', TRANSACTION_COMPLETED, minutes(-120))
+        # done since snapshot
+        self.add_tx(self.btc, '2', TRANSACTION_COMPLETED, minutes(10))
+        self.add_tx(self.btc, '-1', TRANSACTION_PENDING, minutes(20))
+        # created before snapshot, cancelled after
+        self.add_tx(self.btc, '3', TRANSACTION_CANCELED, minutes(-30), minutes(5))
+        # created and failed since snapshot
+        self.add_tx(self.btc, '4', TRANSACTION_FAILED, minutes(15), minutes(25))
+        # balance without snapshot
+        self.add_tx(self.usdt, '100', TRANSACTION_COMPLETED, minutes(-300))
+        self.add_tx(self.usdt, '-30', TRANSACTION_COMPLETED, minutes(30))
+
+        Balance.objects.bulk_create([
+            Balance(user=self.user, currency=self.btc, amount=Decimal('8.5')),
+            Balance(user=self.user, currency=self.usdt, amount=Decimal('70')),
+        ])
+        expected = {
+            b.currency.code: legacy_dif_balance(b, self.now) for b in Balance.objects.filter(user=self.user)
+        }
+
+        DifBalance.process()
+        result = {
+            dif.currency.code: {field: getattr(dif, field) for field in expected[dif.currency.code]}
+            for dif in DifBalance.objects.filter(user=self.user).exclude(id=snapshot.id)
+        }
+        self.assertEqual(result, expected)
+        self.assertEqual(result['BTC']['calc_balance'], Decimal('8'))
+        self.assertEqual(result['BTC']['sum_diff'], Decimal('1'))
+        self.assertEqual(result['USDT']['diff'], 0)
+
+
+class KeysetPageTest(TestCase):
+
+    def setUp(self):
+        self.user, = User.objects.bulk_create([User(username='keyset@example.com', email='keyset@example.com')])
+        self.btc = Currency.get('BTC')
+        self.now = timezone.now().replace(microsecond=123456)
+        # amounts and created times repeat, so pages are split inside runs of equal values
+        txs = Transaction.objects.bulk_create([
+            Transaction(user=self.user, currency=self.btc, amount=Decimal(amount), reason=REASON_MANUAL_TOPUP,
+                        state=TRANSACTION_COMPLETED)
+            for amount in ['1.5', '0.1', '1.5', '2', '1.5', '0.1', '3', '2']
+        ])
+        for i, tx in enumerate(txs):
+            Transaction.objects.filter(id=tx.id).update(created=self.now - datetime.timedelta(seconds=i // 3))
+
+    def collect(self, qs, limit):
+        ids, cursor = [], None
+        while True:
+            items, cursor = keyset_page(qs, limit, cursor)
+            ids.extend(item.id for item in items)
+            if not cursor:
+                return ids
+
+    def test_cursor_round_trip(self):
+        cursor = encode_keyset_cursor([Decimal('1.50000001'), self.now, 7])
+        self.assertEqual(decode_keyset_cursor(cursor), ['1.50000001', self.now.isoformat(), 7])
+
+    def test_ties_on_datetime(self):
+        qs = Transaction.objects.filter(user=self.user).order_by('-created')
+        expected = list(qs.order_by('-created', '-id').values_list('id', flat=True))
+        for limit in [1, 2, 3, 10]:
+            self.assertEqual(self.collect(qs, limit), expected)
+
+    def test_ties_on_decimal(self):
+        qs = Transaction.objects.filter(user=self.user).order_by('amount')
+        expected = list(qs.order_by('amount', 'id').values_list('id', flat=True))
+        self.assertEqual(self.collect(qs, 2), expected)
+
+    def test_several_fields(self):
+        qs = Transaction.objects.filter(user=self.user).order_by('-created', 'amount')
+        expected = list(qs.order_by('-created', 'amount', 'id').values_list('id', flat=True))
+        self.assertEqual(self.collect(qs, 2), expected)
 
-# Create your tests here.
+    def test_invalid_cursor_starts_from_first_page(self):
+        qs = Transaction.objects.filter(user=self.user).order_by('-created')
+        self.assertEqual(keyset_page(qs, 2, 'invalid')[0], keyset_page(qs, 2)[0])
@@ -14,4 +14,5 @@ urlpatterns = [
     url(r'^account/reset-password/(?P<uidb64>[-:\w]+)/(?P<token>[-:\w]+)', NullView.as_view(), name='password_reset_confirm'),
     url(r'^robots.txt', facade.robots, name='robots'),
     url(r'^sitemap.xml', facade.sitemap, name='sitemap'),
+    url(r'^metrics$', facade.metrics, name='metrics'),
 ]
\ No newline at end of file
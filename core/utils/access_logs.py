@@ -0,0 +1,122 @@
+import csv
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from core.models.facade import AccessLog
+from lib.cache import redis_client
+
+log = logging.getLogger(__name__)
+
+ACCESS_LOG_QUEUE_KEY = 'access_log_queue'
+ACCESS_LOG_DROPPED_KEY = 'access_log_dropped'
+ACCESS_LOG_FLUSH_LOCK_KEY = 'access_log_flush_lock'
+
+ACCESS_LOG_FIELDS = ('created', 'ip', 'username', 'method', 'uri', 'referer', 'status', 'user_agent')
+
+# pushes record if queue is not full, otherwise counts it as dropped
+PUSH_SCRIPT = """
+if redis.call('LLEN', KEYS[1]) >= tonumber(ARGV[2]) then
+    redis.call('INCR', KEYS[2])
+    return 0
+end
+redis.call('RPUSH', KEYS[1], ARGV[1])
+return 1
+"""
+
+push_script = redis_client.register_script(PUSH_SCRIPT)
+
+
+def push_access_log(**record) -> bool:
+    """
+    Puts access log record to redis queue with one round-trip
+    """
+    record['created'] = timezone.now().isoformat()
+    try:
+        return bool(push_script(
+            keys=[ACCESS_LOG_QUEUE_KEY, ACCESS_LOG_DROPPED_KEY],
+            args=[json.dumps(record), settings.ACCESS_LOG_QUEUE_MAX_SIZE],
+        ))
+    except Exception as e:
+        log.error(str(e))
+        return False
+
+
+def peek_access_logs(count) -> list:
+    return redis_client.lrange(ACCESS_LOG_QUEUE_KEY, 0, count - 1)
+
+
+def to_copy_row(record) -> list:
+    """
+    Values of columns, all columns except created are not null and limited by max_length
+    """
+    row = []
+    for field in ACCESS_LOG_FIELDS:
+        value = record.get(field)
+        value = '' if value is None else str(value)
+        max_length = AccessLog._meta.get_field(field).max_length
+        if max_length:
+            value = value[:max_length]
+        row.append(value)
+    return row
+
+
+def write_access_logs(records):
+    """
+    Writes records to AccessLog table with COPY, keeps original request time
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for record in records:
+        writer.writerow(to_copy_row(record))
+    buffer.seek(0)
+
+    # empty unquoted csv value is NULL for COPY
+    not_null_fields = ', '.join(f for f in ACCESS_LOG_FIELDS if f != 'created')
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f'COPY {AccessLog._meta.db_table} ({", ".join(ACCESS_LOG_FIELDS)}) FROM STDIN '
+            f'WITH (FORMAT CSV, FORCE_NOT_NULL ({not_null_fields}))',
+            buffer,
+        )
+
+
+def flush_access_logs(batch_size=None, max_batches=100) -> int:
+    """
+    Records are removed from queue only after COPY is committed,
+    so failed batch stays in queue and is written next time
+    """
+    batch_size = batch_size or settings.ACCESS_LOG_FLUSH_BATCH_SIZE
+    lock = redis_client.lock(ACCESS_LOG_FLUSH_LOCK_KEY, timeout=settings.ACCESS_LOG_FLUSH_PERIOD * 60)
+    if not lock.acquire(blocking=False):
+        return 0
+
+    total = 0
+    try:
+        for _ in range(max_batches):
+            items = peek_access_logs(batch_size)
+            if not items:
+                break
+            write_access_logs([json.loads(item) for item in items])
+            redis_client.ltrim(ACCESS_LOG_QUEUE_KEY, len(items), -1)
+            total += len(items)
+            if len(items) < batch_size:
+                break
+    finally:
+        lock.release()
+    return total
+
+
+def get_access_log_queue_stats() -> dict:
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(ACCESS_LOG_QUEUE_KEY)
+    pipe.get(ACCESS_LOG_DROPPED_KEY)
+    depth, dropped = pipe.execute()
+    return {
+        'depth': depth,
+        'dropped': int(dropped or 0),
+    }
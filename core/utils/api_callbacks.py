@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import uuid
+from urllib.parse import urlsplit
+
+import aiohttp
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from lib.cache import redis_client
+from lib.helpers import make_hmac_signature_headers
+from lib.rate_limit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+API_CALLBACK_PENDING_KEY = 'api-callback-pending'
+
+
+def enqueue_api_callback(user_id, order_id):
+    """
+    Marks order as changed, several changes of one order before dispatch make one callback
+    """
+    redis_client.hset(API_CALLBACK_PENDING_KEY, order_id, user_id)
+
+
+# moves orders of processing key back to pending, keeping ones changed again meanwhile
+RESTORE_SCRIPT = redis_client.register_script("""
+local items = redis.call('HGETALL', KEYS[1])
+for i = 1, #items, 2 do
+    redis.call('HSETNX', KEYS[2], items[i], items[i + 1])
+end
+redis.call('DEL', KEYS[1])
+return #items / 2
+""")
+
+
+def take_pending_callbacks() -> tuple:
+    """
+    (processing_key, {order_id: user_id}) of changed orders, taken atomically.
+    Processing key is kept until callbacks are sent, so unsent ones can be restored after restart
+    """
+    processing_key = f'{API_CALLBACK_PENDING_KEY}-{uuid.uuid4().hex}'
+    try:
+        redis_client.rename(API_CALLBACK_PENDING_KEY, processing_key)
+    except redis.exceptions.ResponseError:
+        # no pending callbacks
+        return None, {}
+
+    items = redis_client.hgetall(processing_key)
+    return processing_key, {int(order_id): int(user_id) for order_id, user_id in items.items()}
+
+
+def finish_pending_callbacks(processing_key):
+    redis_client.delete(processing_key)
+
+
+def restore_pending_callbacks(processing_key=None) -> int:
+    """
+    Returns orders of processing key, or of all processing keys left by previous run, to pending
+    """
+    if processing_key:
+        keys = [processing_key]
+    else:
+        keys = list(redis_client.scan_iter(f'{API_CALLBACK_PENDING_KEY}-*'))
+    return sum(RESTORE_SCRIPT(keys=[key, API_CALLBACK_PENDING_KEY]) for key in keys)
+
+
+def build_callback_requests(order_ids) -> list:
+    """
+    [(url, data, headers)] with current state of orders, made with a few bulk queries
+    """
+    from core.models.orders import ExecutionResult
+    from core.models.orders import Order
+    from core.serializers.orders import ExecutionResultApiSerializer
+    from core.serializers.orders import OrderSerializer
+
+    close_old_connections()
+    orders = Order.objects.filter(
+        id__in=order_ids,
+        user__profile__api_callback_url__isnull=False,
+    ).exclude(
+        user__profile__api_callback_url='',
+    ).select_related(
+        'user__profile',
+    )
+
+    matches = {}
+    for er in ExecutionResult.objects.filter(
+        order_id__in=order_ids,
+        cancelled=False,
+    ).only(
+        'id',
+        'order_id',
+        'price',
+        'quantity',
+    ):
+        matches.setdefault(er.order_id, []).append(er)
+
+    result = []
+    for order in orders:
+        profile = order.user.profile
+        data = OrderSerializer(order).data
+        data['matches'] = ExecutionResultApiSerializer(matches.get(order.id, []), many=True).data
+        headers = make_hmac_signature_headers(profile.api_key, profile.secret_key)
+        result.append((profile.api_callback_url, data, headers))
+    return result
+
+
+class ApiCallbackDispatcher:
+    """
+    Sends order changed callbacks concurrently through pooled connections
+    with rate limit and retries for each endpoint host.
+    Only one dispatcher should run, it restores batches left unsent by previous run on start
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, rate=None, retries=None, backoff=1):
+        self.session = session
+        self.rate = rate or settings.API_CALLBACK_RATE_LIMIT
+        self.retries = settings.API_CALLBACK_RETRIES if retries is None else retries
+        self.backoff = backoff
+        self.buckets = {}
+        self.in_flight = set()
+        self.max_in_flight = settings.API_CALLBACK_MAX_IN_FLIGHT
+
+    @classmethod
+    def make_session(cls):
+        connector = aiohttp.TCPConnector(
+            limit=settings.API_CALLBACK_CONCURRENCY,
+            limit_per_host=settings.API_CALLBACK_CONNECTIONS_PER_HOST,
+        )
+        timeout = aiohttp.ClientTimeout(total=settings.API_CALLBACK_TIMEOUT)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def get_bucket(self, url) -> TokenBucket:
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate)
+        return self.buckets[host]
+
+    async def send(self, url, data, headers) -> bool:
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self.backoff * 2 ** (attempt - 1))
+
+            await self.get_bucket(url).acquire()
+            try:
+                async with self.session.post(url, json=data, headers=headers) as response:
+                    if response.status < 500 and response.status != 429:
+                        return True
+                    log.warning('Callback %s failed with status %s', url, response.status)
+            except Exception as e:
+                log.warning('Callback %s failed: %s', url, e)
+
+        log.error('Callback %s dropped after %s attempts', url, self.retries + 1)
+        return False
+
+    async def send_many(self, requests) -> list:
+        return await asyncio.gather(*[self.send(*request) for request in requests])
+
+    async def dispatch_pending(self) -> int:
+        # while busy, changes keep coalescing in redis
+        if len(self.in_flight) >= self.max_in_flight:
+            return 0
+
+        processing_key, pending = take_pending_callbacks()
+        if not pending:
+            return 0
+        try:
+            requests = await sync_to_async(build_callback_requests)(list(pending))
+        except Exception:
+            restore_pending_callbacks(processing_key)
+            raise
+
+        # sending is not awaited, so slow endpoints don't hold next batches
+        tasks = []
+        for request in requests:
+            task = asyncio.ensure_future(self.send(*request))
+            self.in_flight.add(task)
+            task.add_done_callback(self.in_flight.discard)
+            tasks.append(task)
+
+        def on_batch_done(_):
+            # batch cancelled on shutdown stays in redis and is restored on next start
+            if not any(task.cancelled() for task in tasks):
+                finish_pending_callbacks(processing_key)
+
+        asyncio.gather(*tasks, return_exceptions=True).add_done_callback(on_batch_done)
+        return len(requests)
+
+    async def run_forever(self, poll_interval=None):
+        poll_interval = poll_interval or settings.API_CALLBACK_POLL_INTERVAL
+        restored = restore_pending_callbacks()
+        if restored:
+            log.warning('%s callbacks left unsent by previous run are pending again', restored)
+
+        while True:
+            try:
+                count = await self.dispatch_pending()
+            except Exception as e:
+                log.exception('Unable to dispatch callbacks: %s', e)
+                count = 0
+            if not count:
+                await asyncio.sleep(poll_interval)
+
+
+async def run_api_callback_dispatcher():
+    async with ApiCallbackDispatcher.make_session() as session:
+        dispatcher = ApiCallbackDispatcher(session)
+        try:
+            await dispatcher.run_forever()
+        finally:
+            if dispatcher.in_flight:
+                log.warning('Stopped with %s callbacks in flight, they will be sent on next start',
+                            len(dispatcher.in_flight))
@@ -0,0 +1,251 @@
+import gzip
+import logging
+import os
+import time
+
+from django.db import connection
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from core.consts.orders import ORDER_OPENED
+from core.models import WalletHistoryItem
+from core.models.facade import Profile
+from core.models.inouts.transaction import REASON_ORDER_OPENED, REASON_ORDER_EXECUTED, REASON_ORDER_CANCELED
+from core.models.inouts.transaction import Transaction
+from core.models.orders import ExecutionResult, Order, OrderChangeHistory, OrderStateChangeHistory
+from lib.backup_utils import BACKUP_PATH
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_PATH = os.path.join(BACKUP_PATH, 'archive')
+ARCHIVE_BEFORE_DELTA = timezone.timedelta(days=7)
+ARCHIVE_RANGE_SIZE = 50_000
+ARCHIVE_RANGE_PAUSE = 0.1  # seconds between ranges to let replication and autovacuum catch up
+
+TABLES = {
+    'order': Order._meta.db_table,
+    'er': ExecutionResult._meta.db_table,
+    'tx': Transaction._meta.db_table,
+    'whi': WalletHistoryItem._meta.db_table,
+    'och': OrderChangeHistory._meta.db_table,
+    'osch': OrderStateChangeHistory._meta.db_table,
+    'profile': Profile._meta.db_table,
+}
+
+# restore order matters because of foreign keys
+RESTORE_TABLES = ('tx', 'order', 'er', 'whi')
+
+# closed bot orders from id range without any match against non-bot order
+ARCHIVE_ORDERS_SQL = """
+create temp table archive_orders on commit drop as
+select o.id
+from {order} o
+join {profile} p on p.user_id = o.user_id and p.is_bot
+where o.id >= %(lo)s and o.id < %(hi)s
+  and o.state != %(opened)s
+  and o.created < %(ts_before)s
+  and not exists (
+      select 1 from {er} er
+      join {order} mo on mo.id = er.matched_order_id
+      join {profile} mp on mp.user_id = mo.user_id
+      where er.order_id = o.id and not mp.is_bot
+  )
+  and not exists (
+      select 1 from {er} er
+      join {profile} mp on mp.user_id = er.user_id
+      where er.matched_order_id = o.id and not mp.is_bot
+  );
+
+create temp table archive_er on commit drop as
+select er.id, er.transaction_id, er.cacheback_transaction_id
+from {er} er join archive_orders a on a.id = er.order_id
+union
+select er.id, er.transaction_id, er.cacheback_transaction_id
+from {er} er join archive_orders a on a.id = er.matched_order_id;
+
+create temp table archive_tx on commit drop as
+select o.in_transaction_id as id from {order} o join archive_orders a on a.id = o.id
+union
+select transaction_id from archive_er where transaction_id is not null
+union
+select cacheback_transaction_id from archive_er where cacheback_transaction_id is not null;
+
+create temp table archive_whi on commit drop as
+select whi.id from {whi} whi join archive_tx a on a.id = whi.transaction_id;
+"""
+
+# bot order transactions from id range not linked to any order or match
+ARCHIVE_TRANSACTIONS_SQL = """
+create temp table archive_tx on commit drop as
+select t.id
+from {tx} t
+join {profile} p on p.user_id = t.user_id and p.is_bot
+where t.id >= %(lo)s and t.id < %(hi)s
+  and t.reason = any(%(reasons)s)
+  and t.created < %(ts_before)s
+  and not exists (select 1 from {order} o where o.in_transaction_id = t.id)
+  and not exists (select 1 from {er} er where er.transaction_id = t.id)
+  and not exists (select 1 from {er} er where er.cacheback_transaction_id = t.id);
+
+create temp table archive_whi on commit drop as
+select whi.id from {whi} whi join archive_tx a on a.id = whi.transaction_id;
+"""
+
+
+def prepare_archive_dir():
+    dirname = os.path.join(ARCHIVE_PATH, f'archive_{timezone.now().date()}')
+    os.makedirs(dirname, exist_ok=True)
+    return dirname
+
+
+def copy_to_gzip_csv(cursor, sql, filepath):
+    """
+    Streams query result into gzipped csv on the database side with COPY TO,
+    rows never materialize as python objects
+    """
+    with gzip.open(filepath, 'wb') as f:
+        cursor.copy_expert(f'COPY ({sql}) TO STDOUT WITH CSV HEADER', f)
+
+
+def copy_from_gzip_csv(cursor, table, filepath):
+    with gzip.open(filepath, 'rb') as f:
+        cursor.copy_expert(f'COPY {table} FROM STDIN WITH CSV HEADER', f)
+
+
+def archive_table(cursor, dirname, name, tmp_table, key, range_name):
+    table = TABLES[name]
+    filepath = os.path.join(dirname, f'{table}.{range_name}.csv.gz')
+    copy_to_gzip_csv(
+        cursor,
+        f'select t.* from {table} t join {tmp_table} a on a.id = t.{key}',
+        filepath,
+    )
+    return filepath
+
+
+def delete_table_rows(cursor, name, tmp_table, key):
+    table = TABLES[name]
+    cursor.execute(f'delete from {table} t using {tmp_table} a where t.{key} = a.id')
+    return cursor.rowcount
+
+
+def get_id_bounds(model, ts_before):
+    lo = model.objects.order_by('id').values_list('id', flat=True).first()
+    hi = model.objects.filter(created__lt=ts_before).order_by('-id').values_list('id', flat=True).first()
+    return lo, hi
+
+
+def iter_id_ranges(lo, hi, size=ARCHIVE_RANGE_SIZE):
+    if lo is None or hi is None:
+        return
+    for start in range(lo, hi + 1, size):
+        yield start, min(start + size, hi + 1)
+
+
+def archive_range(dirname, range_name, sql, params, to_archive, to_delete, only_backup=False):
+    """
+    Collects ids of the range into temp tables, dumps rows with COPY TO
+    and deletes them in one short transaction
+    """
+    files = []
+    deleted = {}
+    try:
+        with atomic(), connection.cursor() as cursor:
+            cursor.execute(sql.format(**TABLES), params)
+            for name, tmp_table, key in to_archive:
+                files.append(archive_table(cursor, dirname, name, tmp_table, key, range_name))
+
+            if not only_backup:
+                for name, tmp_table, key in to_delete:
+                    deleted[name] = delete_table_rows(cursor, name, tmp_table, key)
+    except Exception:
+        # range is rolled back, so its dump is not valid anymore
+        for filepath in files:
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        raise
+    return deleted
+
+
+def archive_bot_orders(dirname, ts_before, only_backup=False):
+    to_archive = (
+        ('tx', 'archive_tx', 'id'),
+        ('order', 'archive_orders', 'id'),
+        ('er', 'archive_er', 'id'),
+        ('whi', 'archive_whi', 'id'),
+    )
+    to_delete = (
+        ('whi', 'archive_whi', 'id'),
+        ('er', 'archive_er', 'id'),
+        ('och', 'archive_orders', 'order_id'),
+        ('osch', 'archive_orders', 'order_id'),
+        ('order', 'archive_orders', 'id'),
+        ('tx', 'archive_tx', 'id'),
+    )
+    return _archive_ranges(Order, ARCHIVE_ORDERS_SQL, {'opened': ORDER_OPENED}, dirname, ts_before,
+                           to_archive, to_delete, only_backup)
+
+
+def archive_bot_transactions(dirname, ts_before, only_backup=False):
+    to_archive = (
+        ('tx', 'archive_tx', 'id'),
+        ('whi', 'archive_whi', 'id'),
+    )
+    to_delete = (
+        ('whi', 'archive_whi', 'id'),
+        ('tx', 'archive_tx', 'id'),
+    )
+    params = {'reasons': [REASON_ORDER_OPENED, REASON_ORDER_EXECUTED, REASON_ORDER_CANCELED]}
+    return _archive_ranges(Transaction, ARCHIVE_TRANSACTIONS_SQL, params, dirname, ts_before,
+                           to_archive, to_delete, only_backup)
+
+
+def _archive_ranges(model, sql, params, dirname, ts_before, to_archive, to_delete, only_backup):
+    start_time = timezone.now()
+    lo, hi = get_id_bounds(model, ts_before)
+    log.info('Archive %s ids range: %s - %s', model._meta.model_name, lo, hi)
+
+    totals = {}
+    for range_lo, range_hi in iter_id_ranges(lo, hi):
+        deleted = archive_range(
+            dirname,
+            f'{model._meta.model_name}_{range_lo}',
+            sql,
+            {**params, 'lo': range_lo, 'hi': range_hi, 'ts_before': ts_before},
+            to_archive,
+            to_delete,
+            only_backup,
+        )
+        for name, count in deleted.items():
+            totals[name] = totals.get(name, 0) + count
+
+        log.info('Range %s - %s done, deleted: %s', range_lo, range_hi, deleted)
+        log.info(timezone.now() - start_time)
+        time.sleep(ARCHIVE_RANGE_PAUSE)
+
+    log.info('Archive %s done, deleted total: %s', model._meta.model_name, totals)
+    return totals
+
+
+def archive_bot_matches(only_backup=False, ts_before=None):
+    if ts_before is None:
+        ts_before = timezone.now() - ARCHIVE_BEFORE_DELTA
+    dirname = prepare_archive_dir()
+    log.info('Archiving bot matches to %s', dirname)
+    orders_totals = archive_bot_orders(dirname, ts_before, only_backup)
+    transactions_totals = archive_bot_transactions(dirname, ts_before, only_backup)
+    return orders_totals, transactions_totals
+
+
+def restore_from_archive(dirname):
+    dirname = os.path.join(ARCHIVE_PATH, dirname)
+    filenames = sorted(os.listdir(dirname))
+    for name in RESTORE_TABLES:
+        table = TABLES[name]
+        for filename in filenames:
+            if not filename.startswith(f'{table}.'):
+                continue
+            filepath = os.path.join(dirname, filename)
+            log.info(f'Restoring {filepath}')
+            with atomic(), connection.cursor() as cursor:
+                copy_from_gzip_csv(cursor, table, filepath)
@@ -6,19 +6,23 @@ from django.db.models import Case, When, Q, F, Count, IntegerField
 from django.db.transaction import atomic
 from django.utils import timezone
 
+from core.cache import orders_app_cache
 from core.consts.orders import ORDER_OPENED, ORDER_CANCELED
 from core.models import WalletHistoryItem
 from core.models.inouts.transaction import REASON_ORDER_OPENED, REASON_ORDER_EXECUTED, REASON_ORDER_CANCELED
+from core.models.inouts.transaction import REASON_ORDER_EXTRA_CHARGE, REASON_ORDER_CHARGE_RETURN
+from core.models.inouts.transaction import TRANSACTION_COMPLETED
 from core.models.inouts.transaction import Transaction
-from core.models.orders import ExecutionResult, Order, OrderChangeHistory, OrderStateChangeHistory
+from core.models.orders import ExecutionResult, Order, OrderChangeHistory, OrderStateChangeHistory, OrderRevert
 from lib.backup_utils import backup_qs_to_csv
-from lib.helpers import BOT_RE
 from lib.helpers import chunked
 
 log = logging.getLogger(__name__)
 
 DEFAULT_BEFORE_DELTA = timezone.timedelta(days=7)
 DEFAULT_BATCH_SIZE = 10_000
+EXTRA_TRANSACTIONS_RANGE_SIZE = 100_000
+EXTRA_TRANSACTIONS_CHECKPOINT_KEY = 'cleanup_extra_transactions_last_id'
 
 
 # startdate = datetime.datetime(2021,7,8,10,15)
@@ -38,6 +42,52 @@ left outer join core_wallethistoryitem whi on whi.transaction_id = o.in_transact
 where o.id = any(%s)
 group by o.id;
 """
+# collapses extra charge/return transactions of every order inside the id range
+# into the first transaction of the order, all in one statement
+collapse_extra_transactions_sql = """
+with txs as (
+    select t.id, t.data->>'order_id' as oid, t.amount
+    from {tx} t
+    where t.id >= %(lo)s and t.id < %(hi)s
+      and t.state = %(state)s
+      and t.reason = any(%(reasons)s)
+      and t.created < %(ts_before)s
+      and t.data ? 'order_id'
+      and not exists (
+          select 1 from {revert} r
+          where r.transaction_id = t.id or r.origin_transaction_id = t.id
+      )
+),
+groups as (
+    select oid, min(id) as keep_id, sum(amount) as summ
+    from txs
+    group by oid
+    having count(*) > 1
+),
+updated as (
+    update {tx} t
+    set amount = g.summ,
+        reason = case when g.summ > 0 then %(charge_return)s else %(extra_charge)s end
+    from groups g
+    where t.id = g.keep_id
+    returning t.id
+),
+to_delete as (
+    select txs.id from txs join groups g on g.oid = txs.oid where txs.id != g.keep_id
+),
+deleted_whi as (
+    delete from {whi} w using to_delete d where w.transaction_id = d.id returning w.id
+),
+deleted as (
+    delete from {tx} t using to_delete d where t.id = d.id returning t.id
+)
+select (select count(*) from updated), (select count(*) from deleted);
+""".format(
+    tx=Transaction._meta.db_table,
+    whi=WalletHistoryItem._meta.db_table,
+    revert=OrderRevert._meta.db_table,
+)
+
 
 def get_bot_matches_qs(ts_before):
     """
@@ -46,9 +96,9 @@ def get_bot_matches_qs(ts_before):
     return ExecutionResult.objects.filter(
         ~Q(Q(order__state=ORDER_OPENED) | Q(created__gte=ts_before)),
         cancelled=False,
-        user__username__iregex=BOT_RE,
-        order__user__username__iregex=BOT_RE,
-        matched_order__user__username__iregex=BOT_RE,
+        user__profile__is_bot=True,
+        order__user__profile__is_bot=True,
+        matched_order__user__profile__is_bot=True,
         # created__gt=startdate
     ).only(
         'order_id',
@@ -59,8 +109,8 @@ def get_bot_matches_qs(ts_before):
 def get_bot_excluded_matches_qs(order_ids):
     return ExecutionResult.objects.filter(
         Q(order_id__in=order_ids) | Q(matched_order_id__in=order_ids),
-        ~Q(order__user__username__iregex=BOT_RE) |
-        (Q(matched_order__isnull=False) & ~Q(matched_order__user__username__iregex=BOT_RE))
+        ~Q(order__user__profile__is_bot=True) |
+        (Q(matched_order__isnull=False) & ~Q(matched_order__user__profile__is_bot=True))
     ).only(
         'order_id',
         'matched_order_id'
@@ -73,7 +123,7 @@ def get_bot_matched_without_exr_qs(ts_before):
     """
 
     return Order.objects.filter(
-        user__username__iregex=BOT_RE,
+        user__profile__is_bot=True,
     ).filter(
         ~Q(state=ORDER_OPENED) &
         Q(executionresult__isnull=True) &
@@ -87,7 +137,7 @@ def get_bot_tr_qs(ts_before):
     """
 
     return Transaction.objects.filter(
-        user__username__iregex=BOT_RE,
+        user__profile__is_bot=True,
         reason__in=(REASON_ORDER_OPENED, REASON_ORDER_EXECUTED, REASON_ORDER_CANCELED),
         order_in_transaction__isnull=True,
         executionresult__cacheback_transaction__isnull=True,
@@ -101,7 +151,7 @@ def list_bots_cancelled():
     Specific function to process bot cancelled cleanup
     """
     qs = Order.objects.filter(
-        user__username__iregex=BOT_RE,
+        user__profile__is_bot=True,
     ).filter(
         state=ORDER_CANCELED,
         quantity=F('quantity_left')
@@ -288,3 +338,48 @@ def strip_orders(order_ids, only_backup=False):
                 log.info('All Order count: %s', all_or)
                 log.info('All WalletHistoryItem count: %s', all_whi)
                 log.info('=' * 10)
+
+
+def collapse_extra_transactions(ts_before, range_size=EXTRA_TRANSACTIONS_RANGE_SIZE):
+    """
+    Collapses order extra charge/return transactions created before ts_before
+    by bounded id ranges. Progress is stored after every range,
+    so the next run continues from the last processed id
+    """
+    start_time = timezone.now()
+    lo = orders_app_cache.get(EXTRA_TRANSACTIONS_CHECKPOINT_KEY)
+    if lo is None:
+        lo = Transaction.objects.order_by('id').values_list('id', flat=True).first()
+    hi = Transaction.objects.filter(created__lt=ts_before).order_by('-id').values_list('id', flat=True).first()
+    if lo is None or hi is None or lo > hi:
+        log.info('No extra transactions to collapse')
+        return 0, 0
+
+    log.info('Collapse extra transactions ids range: %s - %s', lo, hi)
+    params = {
+        'state': TRANSACTION_COMPLETED,
+        'reasons': [REASON_ORDER_EXTRA_CHARGE, REASON_ORDER_CHARGE_RETURN],
+        'charge_return': REASON_ORDER_CHARGE_RETURN,
+        'extra_charge': REASON_ORDER_EXTRA_CHARGE,
+        'ts_before': ts_before,
+    }
+    all_updated = 0
+    all_deleted = 0
+    for range_lo in range(lo, hi + 1, range_size):
+        range_start = timezone.now()
+        range_hi = min(range_lo + range_size, hi + 1)
+        with atomic(), connection.cursor() as cursor:
+            cursor.execute(collapse_extra_transactions_sql, {**params, 'lo': range_lo, 'hi': range_hi})
+            updated, deleted = cursor.fetchone()
+        orders_app_cache.set(EXTRA_TRANSACTIONS_CHECKPOINT_KEY, range_hi, timeout=None)
+
+        all_updated += updated
+        all_deleted += deleted
+        seconds = (timezone.now() - range_start).total_seconds() or 1
+        log.info('Range %s - %s: orders %s, deleted txs %s, %.0f ids/s',
+                 range_lo, range_hi, updated, deleted, (range_hi - range_lo) / seconds)
+
+    seconds = (timezone.now() - start_time).total_seconds() or 1
+    log.info('Collapsed orders: %s, deleted txs: %s, %.0f ids/s, %.0f deleted rows/s',
+             all_updated, all_deleted, (hi + 1 - lo) / seconds, all_deleted / seconds)
+    return all_updated, all_deleted
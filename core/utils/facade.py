@@ -20,6 +20,7 @@ User = get_user_model()
 
 BOT_USERNAME_RE = r'^bot[0-9]+@bot\.com$'
 BOT_USERNAME_CMPRE = re.compile(BOT_USERNAME_RE)
+BOT_USERNAME_ICMPRE = re.compile(BOT_USERNAME_RE, re.IGNORECASE)
 
 
 def load_api_callback_urls_cache():
@@ -55,6 +56,13 @@ def is_bot_user(username):
     return bool(BOT_USERNAME_CMPRE.match(username))
 
 
+def is_bot_profile(profile):
+    """
+    Same rule as used to fill Profile.is_bot in migration: bot username or bot user type
+    """
+    return profile.user_type == Profile.USER_TYPE_BOT or bool(BOT_USERNAME_ICMPRE.match(profile.user.username))
+
+
 def generate_sitemap():
     cache_key = 'sitemap'
     result = facade_cache.get(cache_key)
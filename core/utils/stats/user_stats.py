@@ -0,0 +1,161 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from core.consts.orders import BUY
+from core.consts.orders import SELL
+from core.models.inouts.pair import Pair
+from core.models.orders import ExecutionResult
+from core.models.orders import Order
+from core.models.stats import UserPairDailyStat
+
+log = logging.getLogger(__name__)
+
+TABLES = {
+    'stat': UserPairDailyStat._meta.db_table,
+    'er': ExecutionResult._meta.db_table,
+    'order': Order._meta.db_table,
+    'pair': Pair._meta.db_table,
+}
+
+STATS_SELECT_SQL = """
+select
+    er.user_id,
+    er.pair_id,
+    (er.created at time zone %(tz)s)::date,
+    p.base,
+    p.quote,
+    coalesce(sum(er.quantity) filter (where o.operation = %(buy)s), 0),
+    coalesce(sum(er.price * er.quantity) filter (where o.operation = %(sell)s), 0),
+    coalesce(sum(er.fee_amount) filter (where o.operation = %(buy)s), 0),
+    coalesce(sum(er.fee_amount) filter (where o.operation = %(sell)s), 0),
+    coalesce(sum(er.quantity) filter (where o.operation = %(sell)s), 0),
+    coalesce(sum(er.price * er.quantity) filter (where o.operation = %(buy)s), 0),
+    max(er.id),
+    now(),
+    now()
+from {er} er
+join {order} o on o.id = er.order_id
+join {pair} p on p.id = er.pair_id
+"""
+
+STATS_INSERT_SQL = """
+insert into {stat} as st (
+    user_id, pair_id, day, currency1, currency2,
+    volume_got1, volume_got2, fee_amount_paid1, fee_amount_paid2, volume_spent1, volume_spent2,
+    last_execution_result_id, created, updated
+)
+"""
+
+# adds matches from ids range to counters, every row skips matches it already contains,
+# so replay of the same range changes nothing
+ACCUMULATE_SQL = STATS_INSERT_SQL + STATS_SELECT_SQL + """
+left join {stat} s
+    on s.user_id = er.user_id
+    and s.pair_id = er.pair_id
+    and s.day = (er.created at time zone %(tz)s)::date
+where er.id > %(lo)s and er.id <= %(hi)s
+  and not er.cancelled
+  and er.id > coalesce(s.last_execution_result_id, 0)
+group by 1, 2, 3, 4, 5
+on conflict (user_id, day, pair_id) do update set
+    volume_got1 = st.volume_got1 + excluded.volume_got1,
+    volume_got2 = st.volume_got2 + excluded.volume_got2,
+    fee_amount_paid1 = st.fee_amount_paid1 + excluded.fee_amount_paid1,
+    fee_amount_paid2 = st.fee_amount_paid2 + excluded.fee_amount_paid2,
+    volume_spent1 = st.volume_spent1 + excluded.volume_spent1,
+    volume_spent2 = st.volume_spent2 + excluded.volume_spent2,
+    last_execution_result_id = greatest(st.last_execution_result_id, excluded.last_execution_result_id),
+    updated = excluded.updated
+"""
+
+# full recount of one day, fixes matches cancelled or committed after accumulation
+RECONCILE_DAY_SQL = """
+delete from {stat} where day = %(day)s;
+""" + STATS_INSERT_SQL + STATS_SELECT_SQL + """
+where er.created >= %(start)s and er.created < %(end)s
+  and not er.cancelled
+group by 1, 2, 3, 4, 5
+"""
+
+
+# accumulation and reconcile of user stats are serialized with this transaction level lock,
+# otherwise overlapping runs check last_execution_result_id against their own snapshots
+# and add the same matches twice
+USER_STATS_LOCK_ID = 7301
+
+LOCK_SQL = 'select pg_advisory_xact_lock(%s)'
+
+
+def _params(**params):
+    return {'tz': settings.TIME_ZONE, 'buy': BUY, 'sell': SELL, **params}
+
+
+def get_accumulated_last_id():
+    """
+    Last ExecutionResult id added to stats.
+    Stats made before accumulation have no ids, then start from the day after latest of them
+    """
+    last_id = UserPairDailyStat.objects.aggregate(last_id=Max('last_execution_result_id'))['last_id']
+    if last_id:
+        return last_id
+
+    latest_stat = UserPairDailyStat.objects.order_by('-day').only('day').first()
+    if not latest_stat:
+        return 0
+
+    first_er_id = ExecutionResult.objects.filter(
+        created__gte=latest_stat.day + datetime.timedelta(days=1),
+    ).order_by('id').values_list('id', flat=True).first()
+    if first_er_id:
+        return first_er_id - 1
+    return ExecutionResult.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def accumulate_range(lo, hi):
+    """
+    Adds not cancelled matches with ids in (lo, hi] to counters
+    """
+    with atomic(), connection.cursor() as cursor:
+        cursor.execute(LOCK_SQL, [USER_STATS_LOCK_ID])
+        cursor.execute(ACCUMULATE_SQL.format(**TABLES), _params(lo=lo, hi=hi))
+        return cursor.rowcount
+
+
+def accumulate_user_stats(range_size=None):
+    """
+    Adds matches settled since last run to per user, pair and day counters
+    """
+    range_size = range_size or settings.USER_STATS_RANGE_SIZE
+    lo = get_accumulated_last_id()
+
+    # recent matches may be not committed yet, leave them for the next run
+    ts_before = timezone.now() - datetime.timedelta(seconds=settings.USER_STATS_LAG)
+    hi = ExecutionResult.objects.filter(
+        created__lt=ts_before,
+    ).order_by('-id').values_list('id', flat=True).first()
+    if not hi or hi <= lo:
+        return 0
+
+    count = 0
+    for range_lo in range(lo, hi, range_size):
+        range_hi = min(range_lo + range_size, hi)
+        count += accumulate_range(range_lo, range_hi)
+    log.info('User stats accumulated for ids %s - %s, rows: %s', lo, hi, count)
+    return count
+
+
+def reconcile_user_stats(day):
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time()))
+    end = start + datetime.timedelta(days=1)
+    with atomic(), connection.cursor() as cursor:
+        cursor.execute(LOCK_SQL, [USER_STATS_LOCK_ID])
+        cursor.execute(RECONCILE_DAY_SQL.format(**TABLES), _params(day=day, start=start, end=end))
+        count = cursor.rowcount
+    log.info('User stats reconciled for %s, rows: %s', day, count)
+    return count
@@ -10,6 +10,8 @@ from django.contrib.auth.models import User
 from django.core.cache import cache
 from django.http import HttpResponse
 from django.utils import translation, timezone
+from prometheus_client import CONTENT_TYPE_LATEST
+from prometheus_client import generate_latest
 from django.utils.timezone import now
 from django_countries import countries
 from drf_spectacular.types import OpenApiTypes
@@ -45,6 +47,7 @@ from core.tasks.facade import notify_sof_verification_request_admin
 from core.utils.facade import generate_sitemap
 from core.utils.stats.daily import get_filtered_pairs_24h_stats
 from lib.filterbackend import FilterBackend
+from lib.metrics import get_web_registry
 from lib.services.sumsub_client import SumSubClient
 from lib.services.twilio import TwilioClient
 from lib.services.twilio import twilio_client
@@ -801,6 +804,16 @@ def sitemap(request):
     return HttpResponse(sitemap, content_type="text/xml")
 
 
+def metrics(request):
+    registry = get_web_registry() if settings.METRICS_ENABLED and settings.METRICS_TOKEN else None
+    if registry is None:
+        return HttpResponse(status=404)
+    if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponse(status=403)
+
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
 class CaptchaCheck(views.APIView):
     permission_classes = (AllowAny,)
 
@@ -13,7 +13,9 @@ from drf_spectacular.utils import extend_schema, OpenApiExample, OpenApiResponse
 from rest_framework import mixins
 from rest_framework import status
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.exceptions import APIException
+from rest_framework.exceptions import ValidationError
 from rest_framework.generics import GenericAPIView
 from rest_framework.generics import ListAPIView
 from rest_framework.permissions import AllowAny
@@ -36,6 +38,7 @@ from core.otcupdater import OtcOrdersUpdater
 from core.models.inouts.pair import Pair
 from core.permissions import BotsOnly
 from core.serializers.orders import ExchangeRequestSerializer, StopLimitOrderSerializer, AllOrdersSimpleSerializer
+from core.serializers.orders import BulkCancelOrdersSerializer
 from core.serializers.orders import ExchangeResultSerialzier
 from core.serializers.orders import ExecutionResultSerializer
 from core.serializers.orders import LimitOnlyOrderSerializer
@@ -49,6 +52,7 @@ from lib.helpers import calc_absolute_percent_difference
 from lib.helpers import to_decimal
 from lib.orders_helper import prepare_market_data, market_cost_and_price, get_cost_and_price
 from lib.permissions import IsPUTOrIsAuthenticated
+from lib.tasks import TaskReply
 from lib.tasks import WrappedTaskManager
 from lib.views import ExceptionHandlerMixin
 
@@ -78,6 +82,54 @@ class OrdersView(ExceptionHandlerMixin,
     def perform_create(self, serializer):
         serializer.save()
 
+    @extend_schema(
+        request=LimitOnlyOrderSerializer(many=True),
+        responses=LimitOnlyOrderSerializer(many=True),
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        if isinstance(request.data, list) and len(request.data) > settings.ORDERS_BATCH_MAX_SIZE:
+            raise ValidationError({
+                'message': f'Max batch size: {settings.ORDERS_BATCH_MAX_SIZE}',
+                'type': 'batch_size_exceeded'
+            })
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        new_orders = [Order(**item) for item in serializer.validated_data]
+        Order.create_orders_batch(new_orders)
+        return Response(self.get_serializer(new_orders, many=True).data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request=BulkCancelOrdersSerializer,
+        responses={
+            200: OpenApiTypes.OBJECT
+        },
+    )
+    @action(detail=False, methods=['post'], url_path='bulk_cancel')
+    def bulk_cancel(self, request):
+        serializer = BulkCancelOrdersSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        qs = self.get_queryset().filter(
+            state=ORDER_OPENED,
+        ).exclude(
+            type__in=[Order.ORDER_TYPE_MARKET, Order.ORDER_TYPE_EXCHANGE],
+        ).select_related(
+            'pair',
+        ).only(
+            'id', 'type', 'state', 'pair',
+        )
+        if data.get('ids'):
+            qs = qs.filter(id__in=data['ids'])
+        if data.get('pair'):
+            qs = qs.filter(pair=data['pair'])
+
+        cancelled = Order.cancel_orders_batch(qs)
+        return Response({'cancelled': cancelled})
+
 
 class LastExecutedOrdersView(viewsets.ReadOnlyModelViewSet):
     serializer_class = OrderSerializer
@@ -126,8 +178,9 @@ class StopLimitView(ExceptionHandlerMixin, GenericAPIView):
         data['user_id'] = request.user.id
 
         try:
-            wrapped_result = self.TASK.apply_async([data], queue='orders.{}'.format(data['pair_name'].upper()))
-            result = WrappedTaskManager.unpack_result_or_raise(wrapped_result.get(timeout=10))
+            wrapped_result = TaskReply.call(self.TASK, [data], queue='orders.{}'.format(data['pair_name'].upper()),
+                                            timeout=10)
+            result = WrappedTaskManager.unpack_result_or_raise(wrapped_result)
         except Exception as e:
             if isinstance(e, (BaseError, APIException)):
                 raise e
@@ -157,8 +210,9 @@ class MarketView(ExceptionHandlerMixin, GenericAPIView):
         data = self.data(request)
 
         try:
-            wrapped_result = self.TASK.apply_async([data], queue='orders.{}'.format(data['pair_name'].upper()))
-            result = WrappedTaskManager.unpack_result_or_raise(wrapped_result.get(timeout=10))
+            wrapped_result = TaskReply.call(self.TASK, [data], queue='orders.{}'.format(data['pair_name'].upper()),
+                                            timeout=10)
+            result = WrappedTaskManager.unpack_result_or_raise(wrapped_result)
         except Exception as e:
             if isinstance(e, (BaseError, APIException)):
                 raise e
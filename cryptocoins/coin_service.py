@@ -24,6 +24,7 @@ from cryptocoins.accumulation_manager import AccumulationManager
 from cryptocoins.exceptions import CoinServiceError, TransferAmountLowError, SignTxError
 from cryptocoins.models.keeper import Keeper
 from cryptocoins.models.scoring import ScoringSettings, TransactionInputScore
+from cryptocoins.scoring.manager import ScoreManager
 from cryptocoins.utils import commons
 from cryptocoins.utils.btc import pubkey_to_address
 from lib.cipher import AESCoderDecoder
@@ -188,6 +189,13 @@ class CoinServiceBase:
             qs = qs.exclude(block_type=UserWallet.BLOCK_TYPE_DEPOSIT_AND_ACCUMULATION)
         return list(qs)
 
+    @cachetools.func.ttl_cache(ttl=5)
+    def get_users_addresses_set(self, exclude_blocked=False) -> frozenset:
+        """
+        User addresses for membership checks
+        """
+        return frozenset(self.get_users_addresses(exclude_blocked))
+
     def get_accumulation_ready_wallet_transactions(self) -> List[WalletTransactions]:
         return WalletTransactions.get_ready_for_accumulation(self.currency)
 
@@ -292,9 +300,12 @@ class CoinServiceBase:
         self.log.info('Deposit %s %s for address %s processed', self.currency.code, amount, address)
 
     def check_for_scoring(self):
-        waiting_for_scoring = AccumulationManager.get_waiting_for_kyt_check(self.currency.code)
+        waiting_for_scoring = list(AccumulationManager.get_waiting_for_kyt_check(
+            self.currency.code,
+        ).select_related('wallet'))
+        scores = ScoreManager.get_wallet_transactions_score_info(waiting_for_scoring)
         for wallet_transaction in waiting_for_scoring:
-            wallet_transaction.check_scoring()
+            wallet_transaction.check_scoring(scores.get(wallet_transaction.id))
 
 
 class BitCoreCoinServiceBase(CoinServiceBase):
@@ -536,9 +547,11 @@ class BitCoreCoinServiceBase(CoinServiceBase):
         for addr, amount in self.parse_tx_outputs(tx_data):
             outputs_amount[addr] += amount
 
+        users_addresses = self.get_users_addresses_set()
+
         # process only our addresses
         for addr, amount in outputs_amount.items():
-            if addr not in self.get_users_addresses():
+            if addr not in users_addresses:
                 continue
 
             self.process_deposit(tx_id, addr, amount)
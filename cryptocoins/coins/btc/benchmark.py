@@ -0,0 +1,156 @@
+"""
+BTC accumulation benchmark: synthetic deposits accumulated one by one
+and with multi-input transactions through BTCCoinService with a local node stand-in
+"""
+import datetime
+import hashlib
+import json
+import random
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from django.utils import timezone
+
+from cryptocoins.coins.btc.service import BTCCoinService
+from lib.helpers import to_decimal
+
+MODES = ('single', 'batched')
+
+
+class LocalNode:
+    """
+    Node stand-in: unspent outputs of deposits, signed and sent transactions are only recorded
+    """
+
+    def __init__(self, unspent):
+        self.unspent = unspent
+        self.calls = Counter()
+        self.sent = []
+
+    def getnetworkinfo(self):
+        self.calls['getnetworkinfo'] += 1
+        return {'version': 250000}
+
+    def listunspent(self, minconf, maxconf, addresses):
+        self.calls['listunspent'] += 1
+        addresses = set(addresses)
+        return [item for item in self.unspent if item['address'] in addresses]
+
+    def createrawtransaction(self, inputs, outputs):
+        self.calls['createrawtransaction'] += 1
+        return json.dumps({
+            'inputs': [f'{item["txid"]}:{item["vout"]}' for item in inputs],
+            'outputs': {address: str(amount) for address, amount in outputs.items()},
+        })
+
+    def signrawtransactionwithkey(self, tx_hex, private_keys, prevtxs):
+        self.calls['signrawtransactionwithkey'] += 1
+        return {'complete': True, 'hex': tx_hex}
+
+    def sendrawtransaction(self, tx_hex):
+        self.calls['sendrawtransaction'] += 1
+        self.sent.append(tx_hex)
+        return hashlib.sha256(f'{len(self.sent)}:{tx_hex}'.encode()).hexdigest()
+
+
+class LocalDeposit:
+    """
+    WalletTransactions stand-in
+    """
+
+    def __init__(self, id, address, amount, created=None, external_accumulation_address=None):
+        self.id = id
+        self.tx_hash = f'{id:064x}'
+        self.wallet = SimpleNamespace(address=address)
+        self.amount = to_decimal(amount)
+        self.created = created or timezone.now()
+        self.external_accumulation_address = external_accumulation_address
+        self.state = 'ready'
+
+    def set_accumulation_in_progress(self):
+        self.state = 'accumulation_in_progress'
+
+    def set_balance_too_low(self):
+        self.state = 'balance_too_low'
+
+    def as_unspent(self):
+        return {'txid': self.tx_hash, 'vout': 0, 'address': self.wallet.address, 'amount': self.amount}
+
+
+class LocalBTCCoinService(BTCCoinService):
+    """
+    BTCCoinService with local node, fixed fee rate and accumulations kept in memory
+    """
+    withdrawal_fee = to_decimal('0.0005')
+    accumulation_address = 'bc1qlocalaccumulation'
+
+    def __init__(self, deposits, sat_per_byte):
+        super().__init__()
+        self.node = LocalNode([deposit.as_unspent() for deposit in deposits])
+        self.sat_per_byte = sat_per_byte
+        self.accumulations = []
+
+    @property
+    def rpc(self):
+        return self.node
+
+    def get_sat_per_byte(self):
+        return self.sat_per_byte
+
+    def get_tx_size(self, inputs, outputs, private_keys):
+        return self.estimate_tx_vsize(len(inputs), len(outputs))
+
+    def get_private_keys_dict(self, addresses) -> dict:
+        return {address: f'key-{address}' for address in addresses}
+
+    def get_accumulation_address(self, accumulation_amount):
+        return self.accumulation_address
+
+    def save_accumulation(self, tx_id, accumulation_address, accumulated):
+        self.accumulations.append((tx_id, accumulation_address, accumulated))
+        for wallet_transaction, _, _ in accumulated:
+            wallet_transaction.set_accumulation_in_progress()
+
+
+def generate_deposits(count, seed=0, max_age_hours=48) -> list:
+    """
+    Deposits of random amounts and ages to own addresses, same seed gives same deposits
+    """
+    rnd = random.Random(seed)
+    now = timezone.now()
+    return [
+        LocalDeposit(
+            i + 1,
+            f'bc1qdeposit{i + 1}',
+            f'{rnd.uniform(0.0005, 0.05):.8f}',
+            created=now - datetime.timedelta(hours=rnd.uniform(0, max_age_hours)),
+        ) for i in range(count)
+    ]
+
+
+def run_accumulation(mode, count, sat_per_byte, seed=0) -> dict:
+    deposits = generate_deposits(count, seed)
+    service = LocalBTCCoinService(deposits, sat_per_byte)
+
+    started = time.perf_counter()
+    if mode == 'batched':
+        service.accumulate_batched(deposits)
+    else:
+        service.accumulate_single(deposits)
+    seconds = time.perf_counter() - started
+
+    accumulated = [item for _, _, items in service.accumulations for item in items]
+    accumulated_amount = sum((amount for _, _, amount in accumulated), to_decimal(0))
+    deposits_amount = sum((wallet_transaction.amount for wallet_transaction, _, _ in accumulated), to_decimal(0))
+    return {
+        'mode': mode,
+        'deposits': count,
+        'sat_per_byte': sat_per_byte,
+        'accumulated': len(accumulated),
+        'txs': len(service.node.sent),
+        'vbytes': sum(service.estimate_tx_vsize(len(items), 1) for _, _, items in service.accumulations),
+        'fee': str(to_decimal(deposits_amount - accumulated_amount)),
+        'rpc_calls': dict(service.node.calls),
+        'seconds': round(seconds, 4),
+    }
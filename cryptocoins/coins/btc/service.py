@@ -1,8 +1,10 @@
+import datetime
 from collections import defaultdict
 from decimal import Decimal
 
 from cryptos import Bitcoin, apply_multisignatures, serialize
 from django.conf import settings
+from django.utils import timezone
 
 from core.models.cryptocoins import UserWallet
 from core.models.inouts.fees_and_limits import FeesAndLimits
@@ -14,7 +16,7 @@ from cryptocoins.models import AccumulationTransaction
 from cryptocoins.models.accumulation_details import AccumulationDetails
 from cryptocoins.models.scoring import ScoringSettings
 from cryptocoins.scoring.manager import ScoreManager
-from cryptocoins.tasks.scoring import process_deffered_deposit
+from cryptocoins.tasks.scoring import process_deffered_deposits
 from cryptocoins.utils.btc import btc2sat
 from lib.cipher import AESCoderDecoder
 from lib.helpers import to_decimal
@@ -146,7 +148,61 @@ class BTCCoinService(BitCoreCoinServiceBase):
         tx_decode = self.rpc.decoderawtransaction(raw_tx)
         return tx_decode.get('size')
 
-    def check_tx_for_deposit(self, tx_data):
+    def get_pending_accumulations(self, tx_ids) -> dict:
+        """
+        Pending accumulation transactions by tx hash for the whole block in one query
+        """
+        accumulations = defaultdict(list)
+        qs = AccumulationTransaction.objects.filter(
+            tx_hash__in=tx_ids,
+            tx_state=AccumulationTransaction.STATE_PENDING,
+        ).select_related(
+            'wallet_transaction__wallet',
+        )
+        for accumulation_transaction in qs:
+            accumulations[accumulation_transaction.tx_hash].append(accumulation_transaction)
+        return accumulations
+
+    def process_block(self, block_id):
+        """
+        Run check_tx_for_deposit for transaction by block_id,
+        deffered scoring task is scheduled once for the whole block
+        """
+        block_txs = self.get_block_transactions(block_id)
+        accumulations = self.get_pending_accumulations([tx_data['txid'] for tx_data in block_txs])
+
+        deffered_deposits = []
+        for tx_data in block_txs:
+            deffered_deposits.extend(self.check_tx_for_deposit(tx_data, accumulations))
+
+        if deffered_deposits:
+            defer_time = ScoringSettings.get_deffered_scoring_time(self.currency.code)
+            process_deffered_deposits.apply_async([deffered_deposits], queue='btc', countdown=defer_time)
+            self.log.info('Block %s: %s deposits sent to deffered scoring', block_id, len(deffered_deposits))
+
+    def process_accumulation_transaction(self, tx_id, accumulation_transaction, output_address):
+        addr = accumulation_transaction.wallet_transaction.wallet.address
+        self.log.info(f'Found accumulation from {addr} to {output_address}')
+        accumulation_details = AccumulationDetails.objects.filter(
+            txid=tx_id,
+            from_address=addr
+        ).first()
+        if not accumulation_details:
+            AccumulationDetails.objects.create(
+                currency=BTC_CURRENCY,
+                txid=tx_id,
+                from_address=addr,
+                to_address=output_address,
+            )
+        else:
+            accumulation_details.to_address = output_address
+            accumulation_details.complete()
+        accumulation_transaction.complete()
+
+    def check_tx_for_deposit(self, tx_data, accumulations=None):
+        """
+        Process accumulations and deposits of tx, returns deposits for deffered scoring
+        """
         tx_id = tx_data['txid']
         outputs_amount = defaultdict(Decimal)
 
@@ -154,48 +210,38 @@ class BTCCoinService(BitCoreCoinServiceBase):
         for addr, amount in self.parse_tx_outputs(tx_data):
             outputs_amount[addr] += amount
 
+        if accumulations is None:
+            accumulations = self.get_pending_accumulations([tx_id])
+
+        users_addresses = self.get_users_addresses_set()
+        tx_accumulations = accumulations.get(tx_id)
+        if not tx_accumulations and users_addresses.isdisjoint(outputs_amount):
+            return []
+
         output_address = ', '.join(outputs_amount)
-        accumulation_transaction: AccumulationTransaction = AccumulationTransaction.objects.filter(
-            tx_hash=tx_id,
-            tx_state=AccumulationTransaction.STATE_PENDING,
-        ).first()
+        for accumulation_transaction in tx_accumulations or []:
+            self.process_accumulation_transaction(tx_id, accumulation_transaction, output_address)
 
-        if accumulation_transaction:
-            addr = accumulation_transaction.wallet_transaction.wallet.address
-            self.log.info(f'Found accumulation from {addr} to {output_address}')
-            accumulation_details = AccumulationDetails.objects.filter(
-                txid=tx_id,
-                from_address=addr
-            ).first()
-            if not accumulation_details:
-                AccumulationDetails.objects.create(
-                    currency=BTC_CURRENCY,
-                    txid=tx_id,
-                    from_address=addr,
-                    to_address=output_address,
-                )
-            else:
-                accumulation_details.to_address = output_address
-                accumulation_details.complete()
-            accumulation_transaction.complete()
+        min_deposit = FeesAndLimits.get_limit(self.currency.code, FeesAndLimits.DEPOSIT, FeesAndLimits.MIN_VALUE)
+        deffered_deposits = []
 
         # process only our addresses
         for addr, amount in outputs_amount.items():
-            if addr not in self.get_users_addresses():
+            if addr not in users_addresses:
                 continue
 
-            if amount < FeesAndLimits.get_limit(self.currency.code, FeesAndLimits.DEPOSIT, FeesAndLimits.MIN_VALUE):
+            if amount < min_deposit:
                 self.log.info('Amount %s less than min deposit limit', amount)
                 continue
 
-            # self.process_deposit(tx_id, addr, amount)
             if ScoreManager.need_to_check_score(tx_id, addr, amount, self.currency.code):
-                defer_time = ScoringSettings.get_deffered_scoring_time(self.currency.code)
-                process_deffered_deposit.apply_async((tx_id, addr, amount, self.currency.code), queue='btc', countdown=defer_time)
+                deffered_deposits.append((tx_id, addr, amount, self.currency.code))
             else:
                 self.log.info('Tx amount too low for scoring')
                 self.process_deposit(tx_id, addr, amount)
 
+        return deffered_deposits
+
     def accumulate_deposit(self, wallet_transaction, inputs_dict, private_keys_dict):
         #private_keys = {}
         item = inputs_dict.get(wallet_transaction.tx_hash)
@@ -215,79 +261,177 @@ class BTCCoinService(BitCoreCoinServiceBase):
             tx_id = None
 
         if tx_id:
-            AccumulationDetails.objects.create(
+            self.save_accumulation(tx_id, accumulation_address, [(wallet_transaction, item, accumulation_amount)])
+        self.log.info(f'Accumulation to {accumulation_address} succeeded')
+
+    def save_accumulation(self, tx_id, accumulation_address, accumulated):
+        """
+        Stores sent accumulation tx, accumulated is [(wallet_transaction, input, amount)]
+        """
+        from_addresses = {item['address'] for _, item, _ in accumulated}
+        AccumulationDetails.objects.bulk_create([
+            AccumulationDetails(
                 currency=BTC_CURRENCY,
                 txid=tx_id,
-                from_address=item['address'],
+                from_address=address,
                 to_address=accumulation_address,
-            )
+            ) for address in from_addresses
+        ])
+
+        for wallet_transaction, _, amount in accumulated:
             AccumulationTransaction.objects.create(
                 wallet_transaction=wallet_transaction,
-                amount=accumulation_amount,
+                amount=amount,
                 tx_type=AccumulationTransaction.TX_TYPE_ACCUMULATION,
                 tx_hash=tx_id,
             )
             wallet_transaction.set_accumulation_in_progress()
-        self.log.info(f'Accumulation to {accumulation_address} succeeded')
 
-    def accumulate(self):
+    @staticmethod
+    def estimate_tx_vsize(inputs_num: int, outputs_num: int) -> int:
         """
-        We need to check if tx is bad
+        p2wpkh inputs and outputs
         """
-        self.log.info('Starting accumulation: %s', self.currency.code)
+        return inputs_num * 68 + outputs_num * 31 + 11
 
-        to_accumulate = self.get_accumulation_ready_wallet_transactions()
-        to_accumulate_from_addresses = [w.wallet.address for w in to_accumulate]
+    def split_accumulation_batches(self, items: list, max_inputs: int, max_vsize: int) -> list:
+        """
+        Splits (wallet_transaction, input) pairs into batches
+        fitting inputs number and tx size budget
+        """
+        batches = []
+        batch = []
+        for item in items:
+            if batch and (len(batch) >= max_inputs or self.estimate_tx_vsize(len(batch) + 1, 1) > max_vsize):
+                batches.append(batch)
+                batch = []
+            batch.append(item)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def get_private_keys_dict(self, addresses) -> dict:
+        decoder = AESCoderDecoder(settings.CRYPTO_KEY)
+        return {
+            address: decoder.decrypt(private_key) for address, private_key in UserWallet.objects.filter(
+                currency=self.currency,
+                address__in=addresses,
+            ).values_list(
+                'address',
+                'private_key'
+            )
+        }
 
-        if not to_accumulate:
-            self.log.warning('There are no addresses to accumulate')
+    def accumulate_batch(self, batch, accumulation_address, private_keys_dict):
+        """
+        Accumulates deposits of batch with one multi-input transaction,
+        transfer amount is split between deposits proportionally to their amounts
+        """
+        inputs = []
+        for wallet_transaction, item in batch:
+            private_keys_dict[item['txid'] + ':' + str(item['vout'])] = private_keys_dict[item['address']]
+            inputs.append(item)
+        total_amount = sum(wallet_transaction.amount for wallet_transaction, _ in batch)
+
+        try:
+            tx_id, accumulation_amount = self.transfer_to(inputs, accumulation_address, total_amount, private_keys_dict)
+        except TransferAmountLowError:
+            for wallet_transaction, _ in batch:
+                wallet_transaction.set_balance_too_low()
             return
 
-        inputs = self.get_unspent(addresses=to_accumulate_from_addresses)
-        inputs_dict = {i['txid']: i for i in inputs}
+        accumulated = []
+        rest_amount = accumulation_amount
+        for i, (wallet_transaction, item) in enumerate(batch):
+            if i == len(batch) - 1:
+                amount = rest_amount
+            else:
+                amount = to_decimal(accumulation_amount * wallet_transaction.amount / total_amount)
+                rest_amount -= amount
+            accumulated.append((wallet_transaction, item, amount))
+        self.save_accumulation(tx_id, accumulation_address, accumulated)
+        self.log.info(f'Accumulation of {len(batch)} deposits to {accumulation_address} succeeded: {tx_id}')
 
-        private_keys_dict = dict(UserWallet.objects.filter(
-            currency=self.currency,
-            address__in=to_accumulate_from_addresses,
-        ).values_list(
-            'address',
-            'private_key'
-        ))
+    def accumulate_batched(self, to_accumulate):
+        """
+        Consolidation mode: deposits with the same accumulation address
+        are sent with multi-input transactions
+        """
+        s_p_b = self.get_sat_per_byte()
+        if s_p_b > settings.BTC_ACCUMULATION_BATCH_MAX_SAT_PER_BYTE:
+            waited_since = timezone.now() - datetime.timedelta(seconds=settings.BTC_ACCUMULATION_BATCH_MAX_WAIT)
+            overdue = [w for w in to_accumulate if w.created < waited_since]
+            self.log.info(f'Fee rate {s_p_b} Sat/b is higher than target, accumulation postponed, '
+                          f'{len(overdue)} deposits waited too long and are accumulated one by one')
+            if overdue:
+                self.accumulate_single(overdue)
+            return
 
-        private_keys_dict = {
-            address: AESCoderDecoder(settings.CRYPTO_KEY).decrypt(private_key) for address, private_key in private_keys_dict.items()
-        }
+        from_addresses = [w.wallet.address for w in to_accumulate]
+        inputs_dict = {(i['txid'], i['address']): i for i in self.get_unspent(addresses=from_addresses)}
+        private_keys_dict = self.get_private_keys_dict(from_addresses)
 
+        external = defaultdict(list)
+        internal = []
         for wallet_transaction in to_accumulate:
-            self.accumulate_deposit(wallet_transaction, inputs_dict, private_keys_dict)
+            item = inputs_dict.get((wallet_transaction.tx_hash, wallet_transaction.wallet.address))
+            if not item:
+                continue
+            if wallet_transaction.external_accumulation_address:
+                external[wallet_transaction.external_accumulation_address].append((wallet_transaction, item))
+            else:
+                internal.append((wallet_transaction, item))
 
+        max_inputs = settings.BTC_ACCUMULATION_BATCH_MAX_INPUTS
+        max_vsize = settings.BTC_ACCUMULATION_BATCH_MAX_VBYTES
 
-        to_accumulate = self.get_external_accumulation_ready_wallet_transactions()
-        to_accumulate_from_addresses = [w.wallet.address for w in to_accumulate]
+        for address, items in external.items():
+            for batch in self.split_accumulation_batches(items, max_inputs, max_vsize):
+                self.accumulate_batch(batch, address, private_keys_dict)
 
+        for batch in self.split_accumulation_batches(internal, max_inputs, max_vsize):
+            batch_amount = sum(wallet_transaction.amount for wallet_transaction, _ in batch)
+            self.accumulate_batch(batch, self.get_accumulation_address(batch_amount), private_keys_dict)
+
+    def accumulate(self):
+        """
+        We need to check if tx is bad
+        """
+        self.log.info('Starting accumulation: %s', self.currency.code)
+
+        if settings.BTC_ACCUMULATION_BATCH:
+            to_accumulate = list(self.get_accumulation_ready_wallet_transactions())
+            to_accumulate += list(self.get_external_accumulation_ready_wallet_transactions())
+            if not to_accumulate:
+                self.log.warning('There are no addresses to accumulate')
+                return
+            self.accumulate_batched(to_accumulate)
+            return
+
+        to_accumulate = self.get_accumulation_ready_wallet_transactions()
+        if not to_accumulate:
+            self.log.warning('There are no addresses to accumulate')
+            return
+        self.accumulate_single(to_accumulate)
+
+        to_accumulate = self.get_external_accumulation_ready_wallet_transactions()
         if not to_accumulate:
             self.log.warning('There are no addresses to accumulate')
             return
+        self.accumulate_single(to_accumulate)
 
+    def accumulate_single(self, to_accumulate):
+        """
+        Each deposit is sent with its own single-input transaction
+        """
+        to_accumulate_from_addresses = [w.wallet.address for w in to_accumulate]
         inputs = self.get_unspent(addresses=to_accumulate_from_addresses)
         inputs_dict = {i['txid']: i for i in inputs}
-
-        private_keys_dict = dict(UserWallet.objects.filter(
-            currency=self.currency,
-            address__in=to_accumulate_from_addresses,
-        ).values_list(
-            'address',
-            'private_key'
-        ))
-
-        private_keys_dict = {
-            address: AESCoderDecoder(settings.CRYPTO_KEY).decrypt(private_key) for address, private_key in private_keys_dict.items()
-        }
+        private_keys_dict = self.get_private_keys_dict(to_accumulate_from_addresses)
 
         for wallet_transaction in to_accumulate:
             self.accumulate_deposit(wallet_transaction, inputs_dict, private_keys_dict)
 
-
     def transfer(self, inputs: list, outputs: dict, private_keys: dict):
         self.log.info('Make transfer %s in -> %s out', len(inputs), len(outputs))
 
@@ -1,8 +1,15 @@
-import copy
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
 from decimal import Decimal
 from typing import Dict
 
+from django.conf import settings
+from django.db import connections
+
+from core.cache import EXTERNAL_PRICES_META_CACHE_KEY
 from core.cache import external_exchanges_pairs_price_cache
+from core.cache import get_external_prices_meta
 from core.models import PairSettings, ExternalPricesHistory, Settings
 from core.models.inouts.pair import Pair
 from cryptocoins.default_settings import ALERT_ON_MISSING_EXTERNAL_PAIR_PRICE
@@ -10,81 +17,119 @@ from cryptocoins.interfaces.datasources import BaseDataSource
 from lib.helpers import calc_relative_percent_difference
 from lib.notifications import send_telegram_message
 
+PriceEntry = namedtuple('PriceEntry', ['price', 'ts', 'source'])
+
+SOURCE_CUSTOM = 'custom'
+
 
 class DataSourcesManager:
-    def __init__(self, main_source: BaseDataSource, reserve_source: BaseDataSource):
+    def __init__(self, main_source: BaseDataSource, reserve_source: BaseDataSource, timeout=None):
         self.main_source: BaseDataSource = main_source
         self.reserve_source: BaseDataSource = reserve_source
+        self.timeout = timeout or settings.EXTERNAL_PRICES_SOURCE_TIMEOUT
         self._data: Dict[Pair, Decimal] = {}
+        self.prices: Dict[Pair, PriceEntry] = {}
         self._restore_old_prices()
 
     def _restore_old_prices(self):
-        for pair in Pair.objects.all():
-            self._data[pair] = external_exchanges_pairs_price_cache.get(pair.code)
-
-    def _update_cached_prices(self, new_data=None):
-        if not new_data:
-            new_data = self._data
-        for pair, price in new_data.items():
-            external_exchanges_pairs_price_cache.set(pair.code, price)
-
-    def _get_main_source_data(self):
+        pairs = list(Pair.objects.all())
+        cached = external_exchanges_pairs_price_cache.get_many([pair.code for pair in pairs])
+        meta = get_external_prices_meta()
+        for pair in pairs:
+            price = cached.get(pair.code)
+            self._data[pair] = price
+            ts, source = meta.get(pair.code, (None, None))
+            self.prices[pair] = PriceEntry(price, ts, source)
+
+    def _update_cached_prices(self, new_prices: Dict[Pair, PriceEntry]):
+        """
+        Writes all prices and their meta with one pipelined request
+        """
+        data = {pair.code: entry.price for pair, entry in new_prices.items() if entry.price}
+        data[EXTERNAL_PRICES_META_CACHE_KEY] = {
+            pair.code: (entry.ts, entry.source) for pair, entry in new_prices.items() if entry.price
+        }
+        external_exchanges_pairs_price_cache.set_many(data)
+
+    def _fetch_source(self, source: BaseDataSource):
         try:
-            return self.main_source.get_latest_prices()
+            return source.get_latest_prices()
         except Exception as e:
-            send_telegram_message(f'Datasource provider {self.main_source.NAME} error:\n{e}')
-            return {}
-
-    def _get_reserve_source_data(self):
-        try:
-            return self.reserve_source.get_latest_prices()
-        except Exception as e:
-            send_telegram_message(f'Datasource provider {self.reserve_source.NAME} error:\n{e}')
+            send_telegram_message(f'Datasource provider {source.NAME} error:\n{e}')
             return {}
+        finally:
+            connections.close_all()
+
+    def _fetch_sources(self):
+        """
+        Fetches all sources concurrently, sources not answered in time are treated as unavailable
+        """
+        sources = [self.main_source, self.reserve_source]
+        executor = ThreadPoolExecutor(max_workers=len(sources))
+        futures = {executor.submit(self._fetch_source, source): source for source in sources}
+        done, _ = wait(futures, timeout=self.timeout)
+        executor.shutdown(wait=False)
+
+        result = {}
+        for future, source in futures.items():
+            if future in done:
+                result[source] = future.result() or {}
+            else:
+                send_telegram_message(f'Datasource provider {source.NAME} timeout')
+                result[source] = {}
+        return result
 
     def update_prices(self):
-        self._get_main_source_data()
-        self._get_reserve_source_data()
+        sources_data = self._fetch_sources()
+        now = time.time()
 
         main_source = self.main_source
         reserve_source = self.reserve_source
+        main_data = sources_data[main_source]
+        reserve_data = sources_data[reserve_source]
 
-        new_data: Dict[Pair, Decimal] = copy.copy(self._data)
+        new_prices: Dict[Pair, PriceEntry] = dict(self.prices)
 
         # alerts
-        if not main_source.data:
-            if not self.reserve_source.data:
+        if not main_data:
+            if not reserve_data:
                 send_telegram_message(f'{main_source.NAME} and {reserve_source.NAME} not available!')
-                self._update_cached_prices()
-                return new_data
+                self._update_cached_prices(new_prices)
+                return self._data
 
             # switch to reserve datasource
-            main_source = reserve_source
-            reserve_source = None
+            main_source, main_data = reserve_source, reserve_data
+            reserve_source, reserve_data = None, {}
 
         # check deviation
         for pair, old_price in self._data.items():
             #  skip pairs with custom price
             custom_price = PairSettings.get_custom_price(pair)
             if custom_price:
-                new_data[pair] = custom_price
+                new_prices[pair] = PriceEntry(custom_price, now, SOURCE_CUSTOM)
                 continue
 
-            new_price = main_source.data.get(pair)
+            new_price = main_data.get(pair)
+            source = main_source
+            if not new_price and reserve_source and reserve_data.get(pair):
+                # pair missed in main source
+                new_price = reserve_data[pair]
+                source = reserve_source
+
             if new_price:
                 if not old_price:
-                    new_data[pair] = new_price
+                    new_prices[pair] = PriceEntry(new_price, now, source.NAME)
                     continue
 
-                if calc_relative_percent_difference(old_price, new_price) < main_source.MAX_DEVIATION:
-                    new_data[pair] = new_price
+                if calc_relative_percent_difference(old_price, new_price) < source.MAX_DEVIATION:
+                    new_prices[pair] = PriceEntry(new_price, now, source.NAME)
                 else:
-                    if reserve_source:
-                        reserve_price = reserve_source.data.get(pair)
-                        if calc_relative_percent_difference(new_price, reserve_price) < reserve_source.MAX_DEVIATION:
-                            new_data[pair] = new_price
+                    if reserve_source and source is not reserve_source:
+                        reserve_price = reserve_data.get(pair)
+                        if reserve_price and calc_relative_percent_difference(new_price, reserve_price) < reserve_source.MAX_DEVIATION:
+                            new_prices[pair] = PriceEntry(new_price, now, source.NAME)
                             continue
-                    send_telegram_message(f'{pair.code} price changes more than {main_source.MAX_DEVIATION}%.'
+                    send_telegram_message(f'{pair.code} price changes more than {source.MAX_DEVIATION}%.'
                                           f'\nCurrent price is {old_price}, new price: {new_price}')
             else:
                 # # global external prices alerts switch
@@ -96,13 +141,10 @@ class DataSourcesManager:
 
         from core.tasks.orders import run_otc_orders_price_update
         history = []
-        for pair in new_data:
-            new_price = new_data[pair]
-            custom_price = PairSettings.get_custom_price(pair.code)
-            price = custom_price or new_price
+        for pair, entry in new_prices.items():
+            price = entry.price
             if price:
-                new_data[pair] = price
-                previous_price = self._data[pair]
+                previous_price = self._data.get(pair)
                 if previous_price:
                     percent_difference = calc_relative_percent_difference(price, previous_price)
                     if percent_difference > 0.3:
@@ -113,7 +155,7 @@ class DataSourcesManager:
         if history:
             ExternalPricesHistory.objects.bulk_create(history)
 
-        self._update_cached_prices(new_data)
+        self._update_cached_prices(new_prices)
+        self.prices = new_prices
+        self._data = {pair: entry.price for pair, entry in new_prices.items()}
         return self._data
-
-
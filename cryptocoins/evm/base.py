@@ -1,15 +1,18 @@
 import logging
 
 from celery import group
+from django.conf import settings
 
 from core.models.inouts.wallet import WalletTransactions
 from core.utils.withdrawal import get_withdrawal_requests_to_process
 from cryptocoins.accumulation_manager import AccumulationManager
 from cryptocoins.models.accumulation_transaction import AccumulationTransaction
+from cryptocoins.scoring.manager import ScoreManager
 from cryptocoins.tasks.evm import (
     withdraw_coin_task,
     withdraw_tokens_task,
-    check_deposit_scoring_task,
+    withdraw_batch_task,
+    check_deposits_scoring_task,
     check_balance_task,
     accumulate_tokens_task,
 )
@@ -35,6 +38,7 @@ class BaseEVMCoinHandler:
     ACCUMULATION_PERIOD = 60
     COLLECT_DUST_PERIOD = 24 * 60 * 60
     IS_ENABLED = True
+    IS_BATCH_WITHDRAWALS = False
 
     @classmethod
     def process_block(cls, block_id):
@@ -67,6 +71,14 @@ class BaseEVMCoinHandler:
     def withdraw_tokens(cls, withdrawal_request_id, password, old_tx_data=None, prev_tx_hash=None):
         raise NotImplementedError
 
+    @classmethod
+    def withdraw_batch(cls, withdrawal_requests_ids, password):
+        raise NotImplementedError
+
+    @classmethod
+    def resend_pending_withdrawals(cls):
+        raise NotImplementedError
+
     @classmethod
     def process_new_blocks(cls):
         lock_id = f'{cls.CURRENCY.code}_blocks'
@@ -259,6 +271,8 @@ class BaseEVMCoinHandler:
 
     @classmethod
     def process_payouts(cls, password, withdrawals_ids=None):
+        is_batch = cls.IS_BATCH_WITHDRAWALS and settings.EVM_WITHDRAWAL_BATCH
+        batch_ids = []
         coin_withdrawal_requests = get_withdrawal_requests_to_process(currencies=[cls.CURRENCY])
 
         if coin_withdrawal_requests:
@@ -271,6 +285,9 @@ class BaseEVMCoinHandler:
                 # skip freezed withdrawals
                 if item.user.profile.is_payouts_freezed():
                     continue
+                if is_batch:
+                    batch_ids.append(item.id)
+                    continue
                 withdraw_coin_task.apply_async(
                     [cls.CURRENCY.code, item.id, password],
                     queue=f'{cls.CURRENCY.code.lower()}_payouts'
@@ -289,17 +306,37 @@ class BaseEVMCoinHandler:
                 # skip freezed withdrawals
                 if item.user.profile.is_payouts_freezed():
                     continue
+                if is_batch:
+                    batch_ids.append(item.id)
+                    continue
                 withdraw_tokens_task.apply_async(
                     [cls.CURRENCY.code, item.id, password],
                     queue=f'{cls.CURRENCY.code.lower()}_payouts'
                 )
 
+        # coins and tokens share keeper nonce, so they are sent with one task
+        if batch_ids:
+            withdraw_batch_task.apply_async(
+                [cls.CURRENCY.code, batch_ids, password],
+                queue=f'{cls.CURRENCY.code.lower()}_payouts'
+            )
+
     @classmethod
     def check_deposit_scoring(cls, wallet_transaction_id):
         """Check deposit for scoring"""
         wallet_transaction = accumulation_manager.get_wallet_transaction_by_id(wallet_transaction_id)
         wallet_transaction.check_scoring()
 
+    @classmethod
+    def check_deposits_scoring(cls, wallet_transactions_ids):
+        """Check batch of deposits for scoring, addresses are scored concurrently"""
+        wallet_transactions = list(WalletTransactions.objects.filter(
+            id__in=wallet_transactions_ids,
+        ).select_related('wallet'))
+        scores = ScoreManager.get_wallet_transactions_score_info(wallet_transactions)
+        for wallet_transaction in wallet_transactions:
+            wallet_transaction.check_scoring(scores.get(wallet_transaction.id))
+
     @classmethod
     def check_balances(cls):
         """Main accumulations scheduler"""
@@ -307,8 +344,9 @@ class BaseEVMCoinHandler:
         accumulations_jobs = []
         external_accumulations_jobs = []
 
-        for item in accumulation_manager.get_waiting_for_kyt_check(cls.CURRENCY):
-            kyt_check_jobs.append(check_deposit_scoring_task.s(cls.CURRENCY.code, item.id))
+        kyt_check_ids = list(accumulation_manager.get_waiting_for_kyt_check(cls.CURRENCY).values_list('id', flat=True))
+        if kyt_check_ids:
+            kyt_check_jobs.append(check_deposits_scoring_task.s(cls.CURRENCY.code, kyt_check_ids))
 
         for item in accumulation_manager.get_waiting_for_accumulation(blockchain_currency=cls.CURRENCY):
             accumulations_jobs.append(check_balance_task.s(cls.CURRENCY.code, item.id))
@@ -317,7 +355,7 @@ class BaseEVMCoinHandler:
             external_accumulations_jobs.append(check_balance_task.s(cls.CURRENCY.code, item.id))
 
         if kyt_check_jobs:
-            log.info('Need to check for KYT: %s', len(kyt_check_jobs))
+            log.info('Need to check for KYT: %s', len(kyt_check_ids))
             jobs_group = group(kyt_check_jobs)
             jobs_group.apply_async(queue=f'{cls.CURRENCY.code.lower()}_check_balances')
 
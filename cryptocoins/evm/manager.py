@@ -1,3 +1,4 @@
+from django.conf import settings
 from kombu import Queue
 
 
@@ -46,6 +47,16 @@ class EVMHandlerManager:
                     }
                 }
             })
+            if evm_handler.IS_BATCH_WITHDRAWALS and settings.EVM_WITHDRAWAL_BATCH:
+                beat_schedule[f'{currency_code}_resend_pending_withdrawals'] = {
+                    'task': 'cryptocoins.tasks.evm.resend_pending_withdrawals_task',
+                    'schedule': settings.EVM_WITHDRAWAL_RESEND_AFTER,
+                    'args': (currency_code,),
+                    'options': {
+                        'expires': 20,
+                        'queue': f'{currency_code.lower()}_payouts',
+                    }
+                }
             queues.extend([
                 Queue(f'{currency_code.lower()}_new_blocks'),
                 Queue(f'{currency_code.lower()}_deposits'),
@@ -0,0 +1,397 @@
+import datetime
+import logging
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db.transaction import atomic
+from django.utils import timezone
+from web3 import Web3
+
+from core.models.inouts.withdrawal import CREATED as WR_CREATED
+from core.models.inouts.withdrawal import PENDING as WR_PENDING
+from core.models.inouts.withdrawal import WithdrawalRequest
+from core.utils.inouts import get_withdrawal_fee
+from lib.cipher import AESCoderDecoder
+
+log = logging.getLogger(__name__)
+
+# node already has this tx, so it is sent
+KNOWN_TX_ERRORS = ('already known', 'known transaction')
+# tx may be accepted by node, it stays pending and is sent again later
+UNKNOWN_TX_ERRORS = ('no response', 'nonce too low')
+# nonce is taken by another tx, there is no gap to fill
+NONCE_USED_ERRORS = KNOWN_TX_ERRORS + ('nonce too low', 'replacement transaction underpriced')
+
+
+def is_error_in(error, messages) -> bool:
+    message = (error or {}).get('message', '').lower()
+    return any(m in message for m in messages)
+
+
+def rpc_batch(client: Web3, calls) -> list:
+    """
+    [(result, error)] for [(method, params)], sent with one JSON-RPC batch request.
+    Providers without http endpoint and nodes without batches support get calls one by one
+    """
+    provider = client.provider
+    endpoint_uri = getattr(provider, 'endpoint_uri', None)
+
+    if endpoint_uri:
+        payload = [
+            {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+            for i, (method, params) in enumerate(calls)
+        ]
+        response = requests.post(endpoint_uri, json=payload, **provider.get_request_kwargs())
+        response.raise_for_status()
+        items = response.json()
+        if isinstance(items, list):
+            by_id = {item.get('id'): item for item in items}
+            no_response = {'error': {'message': 'no response'}}
+            return [
+                (by_id.get(i, no_response).get('result'), by_id.get(i, no_response).get('error'))
+                for i in range(len(calls))
+            ]
+        log.warning('Batch request is not supported by %s: %s', endpoint_uri, items)
+
+    results = []
+    for method, params in calls:
+        response = provider.make_request(method, params)
+        results.append((response.get('result'), response.get('error')))
+    return results
+
+
+class LocalNonce:
+    """
+    Next nonce of hot wallet kept in cache between batches
+    """
+
+    def __init__(self, address):
+        self.address = address
+        self.key = f'nonce_{address}_next'
+
+    def sync(self, latest_count, pending_count) -> int:
+        nonce = cache.get(self.key)
+        if nonce is None or nonce < pending_count:
+            return pending_count
+
+        if nonce > pending_count and latest_count == pending_count:
+            # node has no our txs in mempool, sent ones above chain nonce were dropped
+            log.warning('Local nonce %s of %s is ahead of chain %s, reset', nonce, self.address, pending_count)
+            return pending_count
+        return nonce
+
+    def save(self, nonce):
+        cache.set(self.key, nonce, timeout=None)
+
+    def reset(self):
+        cache.delete(self.key)
+
+
+class EVMWithdrawalSender:
+    """
+    Sends withdrawals from keeper in batches: signs all of them in one pass with local nonces
+    and submits them with one JSON-RPC request. Receipts are not awaited,
+    sent withdrawals are completed with blocks processing
+    """
+
+    def __init__(self, handler, password=None):
+        self.handler = handler
+        self.manager = handler.COIN_MANAGER
+        self.client = self.manager.client
+        self.keeper = self.manager.get_keeper_wallet()
+        self.address = Web3.to_checksum_address(self.keeper.address)
+        # stored txs are sent again without private key
+        self.private_key = AESCoderDecoder(password).decrypt(self.keeper.private_key) if password else None
+        self.nonce = LocalNonce(self.address)
+        # same lock as single withdrawals take for nonce
+        self.lock_key = f'nonce_{self.keeper.address}_lock'
+
+    def send(self, withdrawal_requests_ids, batch_size=None) -> int:
+        batch_size = batch_size or settings.EVM_WITHDRAWAL_BATCH_SIZE
+        if not cache.add(self.lock_key, True, timeout=300):
+            log.info('%s keeper is busy, withdrawals postponed', self.handler.CURRENCY)
+            return 0
+
+        sent = 0
+        try:
+            for i in range(0, len(withdrawal_requests_ids), batch_size):
+                sent += self.send_batch(withdrawal_requests_ids[i:i + batch_size])
+        finally:
+            cache.delete(self.lock_key)
+        log.info('%s withdrawals sent: %s', self.handler.CURRENCY, sent)
+        return sent
+
+    def resend_pending(self, stale_seconds=None) -> int:
+        """
+        Sends again stored txs of withdrawals pending for long and unknown to node.
+        Withdrawal returns to the queue only when its nonce is taken by another mined tx
+        or node rejects its tx
+        """
+        stale_seconds = stale_seconds or settings.EVM_WITHDRAWAL_RESEND_AFTER
+        if not cache.add(self.lock_key, True, timeout=300):
+            return 0
+
+        try:
+            withdrawal_requests = list(WithdrawalRequest.objects.filter(
+                state=WR_PENDING,
+                data__signed_tx__keeper=self.address,
+                updated__lt=timezone.now() - datetime.timedelta(seconds=stale_seconds),
+            ).order_by('id'))
+            if not withdrawal_requests:
+                return 0
+
+            latest_count, _, _ = self.get_chain_state()
+            found = rpc_batch(self.client, [
+                ('eth_getTransactionByHash', [i.data['signed_tx']['hash']]) for i in withdrawal_requests
+            ])
+
+            to_send = []
+            for withdrawal_request, (result, error) in zip(withdrawal_requests, found):
+                signed_tx = withdrawal_request.data['signed_tx']
+                if error:
+                    log.warning('Unable to get withdrawal %s TX %s: %s', withdrawal_request.id, signed_tx['hash'], error)
+                elif result:
+                    # completed with blocks processing
+                    continue
+                elif signed_tx['nonce'] < latest_count:
+                    log.warning('Withdrawal %s TX %s nonce is used by another TX', withdrawal_request.id,
+                                signed_tx['hash'])
+                    self.revert_pending(withdrawal_request, signed_tx['hash'])
+                else:
+                    to_send.append(withdrawal_request)
+
+            if not to_send:
+                return 0
+
+            results = rpc_batch(self.client, [
+                ('eth_sendRawTransaction', [i.data['signed_tx']['raw']]) for i in to_send
+            ])
+            sent = 0
+            for withdrawal_request, (_, error) in zip(to_send, results):
+                tx_hash = withdrawal_request.data['signed_tx']['hash']
+                if not error or is_error_in(error, KNOWN_TX_ERRORS):
+                    log.info('Withdrawal %s TX %s sent again', withdrawal_request.id, tx_hash)
+                    sent += 1
+                elif is_error_in(error, UNKNOWN_TX_ERRORS):
+                    log.warning('Withdrawal %s TX %s state is unknown: %s', withdrawal_request.id, tx_hash, error)
+                else:
+                    log.error('Withdrawal %s TX %s rejected: %s', withdrawal_request.id, tx_hash, error)
+                    self.revert_pending(withdrawal_request, tx_hash)
+                    # nonce is free now, next batch takes it from chain
+                    self.nonce.reset()
+            return sent
+        finally:
+            cache.delete(self.lock_key)
+
+    def get_chain_state(self):
+        """
+        (latest nonce, pending nonce, balance) of keeper with one request
+        """
+        results = rpc_batch(self.client, [
+            ('eth_getTransactionCount', [self.address, 'latest']),
+            ('eth_getTransactionCount', [self.address, 'pending']),
+            ('eth_getBalance', [self.address, 'latest']),
+        ])
+        for _, error in results:
+            if error:
+                raise ValueError(error)
+        return [int(result, 16) for result, _ in results]
+
+    def send_batch(self, withdrawal_requests_ids) -> int:
+        latest_count, pending_count, coin_balance = self.get_chain_state()
+        first_nonce = self.nonce.sync(latest_count, pending_count)
+        gas_price = self.manager.gas_price_cache.get_increased_price(0)
+
+        signed = []
+        with atomic():
+            withdrawal_requests = WithdrawalRequest.objects.select_for_update(
+                skip_locked=True,
+            ).filter(
+                id__in=withdrawal_requests_ids,
+                state=WR_CREATED,
+                approved=True,
+                confirmed=True,
+            ).order_by(
+                'created',
+            )
+            prepared = self.prepare(withdrawal_requests, coin_balance, gas_price)
+            for nonce, (withdrawal_request, tx, fee_amount) in enumerate(prepared, first_nonce):
+                signed_tx = self.sign(tx, nonce, gas_price)
+                # marked with signed tx before sending, so withdrawal is never signed twice
+                # and tx lost on the way to node is sent again by resend_pending
+                self.mark_pending(withdrawal_request, signed_tx, nonce, fee_amount)
+                signed.append((withdrawal_request, nonce, signed_tx))
+
+        if not signed:
+            return 0
+
+        # nonces are taken even if txs are not sent now
+        self.nonce.save(signed[-1][1] + 1)
+
+        calls = [('eth_sendRawTransaction', [signed_tx.rawTransaction.hex()]) for _, _, signed_tx in signed]
+        try:
+            results = rpc_batch(self.client, calls)
+        except Exception as e:
+            # node could accept txs before response is lost, so withdrawals stay pending
+            log.exception('Unable to submit %s withdrawals batch: %s', self.handler.CURRENCY, e)
+            return 0
+        return self.reconcile(signed, results, gas_price)
+
+    def prepare(self, withdrawal_requests, coin_balance, gas_price) -> list:
+        """
+        [(withdrawal request, tx without nonce, our fee)] for withdrawals keeper has enough funds for
+        """
+        coin_fee_wei = self.manager.get_base_denomination_from_amount(
+            get_withdrawal_fee(self.handler.CURRENCY, self.handler.CURRENCY))
+        token_balances = {}
+        result = []
+
+        for withdrawal_request in withdrawal_requests:
+            try:
+                to_address = Web3.to_checksum_address(withdrawal_request.data.get('destination'))
+            except (TypeError, ValueError):
+                log.error('Invalid withdrawal %s address', withdrawal_request.id)
+                continue
+
+            if withdrawal_request.currency == self.handler.CURRENCY:
+                amount_wei = self.manager.get_base_denomination_from_amount(withdrawal_request.amount)
+                amount_to_send_wei = amount_wei - coin_fee_wei
+                gas = self.manager.GAS_CURRENCY
+                fee_amount = self.manager.get_amount_from_base_denomination(coin_fee_wei)
+                tx = {
+                    'to': to_address,
+                    'value': amount_to_send_wei,
+                    'gas': gas,
+                }
+                coin_needed = amount_to_send_wei + gas * gas_price
+                token_needed = 0
+            else:
+                token = self.manager.get_token_by_symbol(withdrawal_request.currency)
+                send_amount_wei = token.get_base_denomination_from_amount(withdrawal_request.amount)
+                withdrawal_fee_wei = token.get_base_denomination_from_amount(token.withdrawal_fee)
+                amount_to_send_wei = send_amount_wei - withdrawal_fee_wei
+                gas = token.get_transfer_gas_amount(to_address, amount_to_send_wei, True)
+                fee_amount = token.get_amount_from_base_denomination(withdrawal_fee_wei)
+                tx = {
+                    'to': Web3.to_checksum_address(token.params.contract_address),
+                    'value': 0,
+                    'gas': gas,
+                    'data': token.contract.encodeABI(fn_name='transfer', args=[to_address, amount_to_send_wei]),
+                }
+                coin_needed = gas * gas_price
+                token_needed = amount_to_send_wei
+                if token.params.symbol not in token_balances:
+                    token_balances[token.params.symbol] = token.get_base_denomination_balance(self.address)
+
+            if amount_to_send_wei <= 0:
+                log.error('Invalid withdrawal %s amount', withdrawal_request.id)
+                withdrawal_request.fail()
+                continue
+
+            if coin_balance < coin_needed:
+                log.warning(f'Keeper not enough {self.handler.CURRENCY} for withdrawal {withdrawal_request.id}, skipping')
+                continue
+
+            if token_needed:
+                if token_balances[token.params.symbol] < token_needed:
+                    log.warning(f'Keeper not enough {token.params.symbol} for withdrawal {withdrawal_request.id}, '
+                                f'skipping')
+                    continue
+                token_balances[token.params.symbol] -= token_needed
+
+            coin_balance -= coin_needed
+            result.append((withdrawal_request, tx, fee_amount))
+        return result
+
+    def sign(self, tx, nonce, gas_price):
+        tx = dict(tx, nonce=nonce, gasPrice=gas_price, chainId=self.handler.CHAIN_ID)
+        return self.client.eth.account.sign_transaction(tx, self.private_key)
+
+    def mark_pending(self, withdrawal_request, signed_tx, nonce, fee_amount):
+        tx_hash = signed_tx.hash.hex()
+        txs_attempts = withdrawal_request.data.get('txs_attempts', [])
+        withdrawal_request.data['txs_attempts'] = list(set(txs_attempts + [tx_hash]))
+        withdrawal_request.data['signed_tx'] = {
+            'keeper': self.address,
+            'hash': tx_hash,
+            'nonce': nonce,
+            'raw': signed_tx.rawTransaction.hex(),
+        }
+        withdrawal_request.state = WR_PENDING
+        withdrawal_request.our_fee_amount = fee_amount
+        # not save(), it checks limits and profile again for every request
+        WithdrawalRequest.objects.filter(
+            id=withdrawal_request.id,
+        ).update(
+            state=WR_PENDING,
+            our_fee_amount=fee_amount,
+            data=withdrawal_request.data,
+            updated=timezone.now(),
+        )
+
+    def revert_pending(self, withdrawal_request, tx_hash):
+        """
+        Returns withdrawal with rejected tx to the queue
+        """
+        txs_attempts = withdrawal_request.data.get('txs_attempts', [])
+        withdrawal_request.data['txs_attempts'] = [i for i in txs_attempts if i != tx_hash]
+        withdrawal_request.data.pop('signed_tx', None)
+        withdrawal_request.state = WR_CREATED
+        WithdrawalRequest.objects.filter(
+            id=withdrawal_request.id,
+            state=WR_PENDING,
+        ).update(
+            state=WR_CREATED,
+            data=withdrawal_request.data,
+            updated=timezone.now(),
+        )
+
+    def reconcile(self, signed, results, gas_price) -> int:
+        """
+        Only withdrawals with txs explicitly rejected by node return to the queue
+        """
+        sent_nonces = []
+        unknown_nonces = []
+        rejected_nonces = []
+        for (withdrawal_request, nonce, signed_tx), (_, error) in zip(signed, results):
+            tx_hash = signed_tx.hash.hex()
+            if not error or is_error_in(error, KNOWN_TX_ERRORS):
+                log.info('%s withdrawal %s TX %s sent', withdrawal_request.currency, withdrawal_request.id, tx_hash)
+                sent_nonces.append(nonce)
+            elif is_error_in(error, UNKNOWN_TX_ERRORS):
+                log.warning('Withdrawal %s TX %s state is unknown: %s', withdrawal_request.id, tx_hash, error)
+                unknown_nonces.append(nonce)
+            else:
+                log.error('Withdrawal %s TX %s rejected: %s', withdrawal_request.id, tx_hash, error)
+                self.revert_pending(withdrawal_request, tx_hash)
+                rejected_nonces.append(nonce)
+
+        if not sent_nonces and not unknown_nonces:
+            self.nonce.reset()
+            return 0
+
+        last_nonce = max(sent_nonces + unknown_nonces)
+        gaps = [nonce for nonce in rejected_nonces if nonce < last_nonce]
+        if gaps and not self.fill_gaps(gaps, gas_price):
+            # chain nonce is taken next time, so next batch fills the gaps
+            self.nonce.reset()
+        else:
+            self.nonce.save(last_nonce + 1)
+        return len(sent_nonces)
+
+    def fill_gaps(self, nonces, gas_price) -> bool:
+        """
+        Sends empty txs to keeper with nonces of rejected txs, so txs after them are not stuck
+        """
+        tx = {'to': self.address, 'value': 0, 'gas': self.manager.GAS_CURRENCY}
+        calls = [
+            ('eth_sendRawTransaction', [self.sign(tx, nonce, gas_price).rawTransaction.hex()])
+            for nonce in nonces
+        ]
+        filled = True
+        for nonce, (_, error) in zip(nonces, rpc_batch(self.client, calls)):
+            if error and not is_error_in(error, NONCE_USED_ERRORS):
+                log.error('Unable to fill nonce %s gap of %s: %s', nonce, self.address, error)
+                filled = False
+        return filled
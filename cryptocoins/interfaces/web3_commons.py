@@ -19,6 +19,7 @@ from core.utils.inouts import get_withdrawal_fee
 from core.utils.withdrawal import get_withdrawal_requests_by_status
 from cryptocoins.accumulation_manager import AccumulationManager
 from cryptocoins.evm.base import BaseEVMCoinHandler
+from cryptocoins.evm.withdrawal_sender import EVMWithdrawalSender
 from cryptocoins.exceptions import RetryRequired
 from cryptocoins.interfaces.common import BlockchainManager, GasPriceCache, Token, BlockchainTransaction
 from cryptocoins.models.accumulation_details import AccumulationDetails
@@ -319,6 +320,7 @@ class Web3Manager(BlockchainManager):
 class Web3CommonHandler(BaseEVMCoinHandler):
     CHAIN_ID = None
     W3_CLIENT = None
+    IS_BATCH_WITHDRAWALS = True
 
     @classmethod
     def process_block(cls, block_id):
@@ -674,6 +676,14 @@ class Web3CommonHandler(BaseEVMCoinHandler):
             # retry with higher gas price
             cls.withdraw_tokens(withdrawal_request_id, password, old_tx_data=tx_data, prev_tx_hash=tx_hash)
 
+    @classmethod
+    def withdraw_batch(cls, withdrawal_requests_ids, password):
+        return EVMWithdrawalSender(cls, password).send(withdrawal_requests_ids)
+
+    @classmethod
+    def resend_pending_withdrawals(cls):
+        return EVMWithdrawalSender(cls).resend_pending()
+
     @classmethod
     def is_gas_need(cls, wallet_transaction):
         acc_tx = accumulation_manager.get_last_gas_deposit_tx(wallet_transaction)
@@ -0,0 +1,25 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+
+from cryptocoins.coins.btc.benchmark import MODES
+from cryptocoins.coins.btc.benchmark import run_accumulation
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Compares single-input and batched BTC accumulation of synthetic deposits with a local node stand-in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=MODES, help='Accumulation mode, all modes by default')
+        parser.add_argument('--deposits', type=int, default=1000)
+        parser.add_argument('--sat-per-byte', type=int, default=10, help='Fee rate of the run')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        for mode in options['mode'] or MODES:
+            log.info('Run %s accumulation benchmark', mode)
+            report = run_accumulation(mode, options['deposits'], options['sat_per_byte'], seed=options['seed'])
+            self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,144 @@
+import asyncio
+import datetime
+import logging
+
+import aiohttp
+from cachetools import TTLCache
+from django.conf import settings
+from django.utils import timezone
+
+from cryptocoins.models.scoring import TransactionInputScore
+from lib.rate_limit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+
+def make_score_key(address, currency_code, token_currency=None):
+    return address, str(currency_code), str(token_currency) if token_currency else None
+
+
+class ScorechainProvider:
+    """
+    Scorechain HTTP provider working through shared aiohttp session
+    """
+
+    def __init__(self, session: aiohttp.ClientSession):
+        self.session = session
+
+    @staticmethod
+    def get_client(currency_code):
+        from cryptocoins.scoring.manager import ScoreManager
+        return ScoreManager.get_client(currency_code)
+
+    def rate_key(self, currency_code):
+        return self.get_client(currency_code).API_URL
+
+    async def get_address_summary(self, address, currency_code, token_currency=None) -> dict:
+        client = self.get_client(currency_code)
+        uri = client.get_address_summary_uri(address, client.TYPE_INPUT, token_currency)
+        async with self.session.get(client.get_request_url(uri)) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        log.info(f'Scorechain response for {address}: {data}')
+        return client.make_address_summary(address, client.parse_address_summary(data))
+
+
+class ScoreEngine:
+    """
+    Fetches address scores concurrently with rate limit for each provider.
+    Recent scores are reused from memory and TransactionInputScore,
+    same addresses requested at once share one request
+    """
+
+    def __init__(self, provider_class=ScorechainProvider, rate=None, concurrency=None, cache_ttl=None):
+        self.provider_class = provider_class
+        self.rate = rate or settings.SCORING_RATE_LIMIT
+        self.concurrency = concurrency or settings.SCORING_CONCURRENCY
+        self.cache_ttl = cache_ttl or settings.SCORING_CACHE_TTL
+        self.cache = TTLCache(maxsize=10000, ttl=self.cache_ttl)
+        self.buckets = {}
+        self._in_flight = {}
+
+    def get_bucket(self, key) -> TokenBucket:
+        if key not in self.buckets:
+            self.buckets[key] = TokenBucket(self.rate)
+        return self.buckets[key]
+
+    def get_scores(self, items) -> dict:
+        """
+        Scores for (address, currency_code, token_currency) items by make_score_key keys.
+        Items failed to fetch are missed in result
+        """
+        keys = {make_score_key(*item) for item in items}
+        result = {key: self.cache[key] for key in keys if key in self.cache}
+
+        missing = keys - result.keys()
+        if missing:
+            persisted = self.load_persisted_scores(missing)
+            self.cache.update(persisted)
+            result.update(persisted)
+
+        missing = keys - result.keys()
+        if missing:
+            log.info('Fetching scores for %s addresses', len(missing))
+            for key, data in asyncio.run(self.fetch_scores(missing)).items():
+                if isinstance(data, Exception):
+                    log.error('Unable to fetch score for %s: %s', key, data)
+                    continue
+                self.cache[key] = data
+                result[key] = data
+
+        return result
+
+    def load_persisted_scores(self, keys) -> dict:
+        ts = timezone.now() - datetime.timedelta(seconds=self.cache_ttl)
+        qs = TransactionInputScore.objects.filter(
+            address__in={key[0] for key in keys},
+            created__gte=ts,
+            scoring_state__in=[TransactionInputScore.SCORING_STATE_OK, TransactionInputScore.SCORING_STATE_FAILED],
+        ).exclude(
+            data={},
+        ).order_by(
+            'created',
+        ).values_list(
+            'address', 'currency', 'token_currency', 'data',
+        )
+
+        result = {}
+        for address, currency, token_currency, data in qs:
+            key = make_score_key(address, currency, token_currency)
+            if key in keys:
+                result[key] = data
+        return result
+
+    async def fetch_scores(self, keys) -> dict:
+        keys = list(keys)
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            provider = self.provider_class(session)
+            results = await asyncio.gather(
+                *[self.get_score(provider, *key) for key in keys],
+                return_exceptions=True,
+            )
+        return dict(zip(keys, results))
+
+    async def get_score(self, provider, address, currency_code, token_currency=None) -> dict:
+        key = make_score_key(address, currency_code, token_currency)
+        if key in self.cache:
+            return self.cache[key]
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._request(provider, key))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await future
+
+    async def _request(self, provider, key) -> dict:
+        address, currency_code, token_currency = key
+        await self.get_bucket(provider.rate_key(currency_code)).acquire()
+        return await provider.get_address_summary(address, currency_code, token_currency)
+
+
+score_engine = ScoreEngine()
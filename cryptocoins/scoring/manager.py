@@ -3,6 +3,7 @@ import logging
 from core.currency import Currency
 from cryptocoins.exceptions import ScoringClientError
 from cryptocoins.models.scoring import TransactionInputScore, ScoringSettings
+from cryptocoins.scoring.engine import make_score_key, score_engine
 from cryptocoins.scoring.scorechain_client.bitcoin import scorechain_bitcoin_client
 from cryptocoins.scoring.scorechain_client.bnb import scorechain_bnb_client
 from cryptocoins.scoring.scorechain_client.ethereum import scorechain_ethereum_client
@@ -42,7 +43,28 @@ class ScoreManager:
         return address_data
 
     @classmethod
-    def is_address_scoring_ok(cls, tx_id, address, amount, currency_code, token_currency=None):
+    def get_addresses_score_info(cls, items) -> dict:
+        """
+        Get scoring info for many (address, currency_code, token_currency) items
+        concurrently, result is keyed by make_score_key
+        """
+        return score_engine.get_scores(items)
+
+    @classmethod
+    def get_wallet_transactions_score_info(cls, wallet_transactions) -> dict:
+        """
+        Prefetch scoring info for wallet transactions by their ids
+        """
+        keys = {}
+        for wallet_transaction in wallet_transactions:
+            wallet = wallet_transaction.wallet
+            token_currency = wallet.currency if wallet.blockchain_currency != wallet.currency else None
+            keys[wallet_transaction.id] = make_score_key(wallet.address, wallet.blockchain_currency, token_currency)
+        scores = cls.get_addresses_score_info(keys.values())
+        return {wt_id: scores[key] for wt_id, key in keys.items() if key in scores}
+
+    @classmethod
+    def is_address_scoring_ok(cls, tx_id, address, amount, currency_code, token_currency=None, addr_risk_data=None):
         from cryptocoins.models.scoring import TransactionInputScore
         from cryptocoins.models.scoring import ScoringSettings
         from core.models import UserWallet
@@ -52,10 +74,11 @@ class ScoreManager:
 
         # check target addresses scoring
         is_address_scoring_ok = True
-        try:
-            addr_risk_data = ScoreManager.get_address_score_info(address, currency_code, token_currency)
-        except:
-            raise ScoringClientError()
+        if addr_risk_data is None:
+            try:
+                addr_risk_data = ScoreManager.get_address_score_info(address, currency_code, token_currency)
+            except:
+                raise ScoringClientError()
         addr_score = addr_risk_data.get('riskscore', {}).get('value', 0) or 0
 
         amount = to_decimal(amount)
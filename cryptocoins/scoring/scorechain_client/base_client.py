@@ -15,10 +15,13 @@ class ScorechainBaseClient:
     TYPE_OUTPUT = ''
     SIGNALS_PERCENT_KEY = ''
 
+    def get_request_url(self, uri=''):
+        return f'{self.API_URL}{uri}?token={self.API_TOKEN}'
+
     def _make_request(self, uri=''):
         res = {}
         try:
-            url = f'{self.API_URL}{uri}?token={self.API_TOKEN}'
+            url = self.get_request_url(uri)
             log.info(f'Scorechain request to {url}')
             res = requests.get(url)
             res = res.json()
@@ -27,18 +30,30 @@ class ScorechainBaseClient:
             log.exception(f'Can\'t fetch data from {self.API_URL}')
         return res
 
+    def get_address_summary_uri(self, address: str, score_type=TYPE_INPUT, token_currency=None) -> str:
+        raise NotImplementedError
+
+    def parse_address_summary(self, data: dict) -> Union[dict, None]:
+        """
+        Extract address summary from API response. Returns None if there are errors
+        """
+        raise NotImplementedError
+
     def fetch_address_summary(self, address: str, score_type=TYPE_INPUT, token_currency=None) -> Union[dict, None]:
         """
         Fetch address summary from scorechain API. Returns None if there are errors
         """
-        raise NotImplementedError
+        data = self._make_request(self.get_address_summary_uri(address, score_type, token_currency))
+        return self.parse_address_summary(data)
 
     def get_signals_list_from_data(self, data):
         raise NotImplementedError
 
     def get_address_summary(self, address: str, score_type=TYPE_INPUT, token_currency=None) -> dict:
         data = self.fetch_address_summary(address, score_type, token_currency)
+        return self.make_address_summary(address, data)
 
+    def make_address_summary(self, address: str, data: Union[dict, None]) -> dict:
         result = {
             'address': address,
             'address_data': None,
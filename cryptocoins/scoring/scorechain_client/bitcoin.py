@@ -14,8 +14,10 @@ class ScorechainBitcoinClient(ScorechainBaseClient):
     TYPE_OUTPUT = 'output'
     SIGNALS_PERCENT_KEY = 'percent'
 
-    def fetch_address_summary(self, address: str, score_type=TYPE_INPUT, token_currency=None):
-        data = self._make_request(f'/scoring/address/{score_type}/{address}')
+    def get_address_summary_uri(self, address: str, score_type=TYPE_INPUT, token_currency=None):
+        return f'/scoring/address/{score_type}/{address}'
+
+    def parse_address_summary(self, data):
         if 'error' not in data:
             return data
         log.warning(data)
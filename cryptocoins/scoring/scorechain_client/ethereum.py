@@ -22,12 +22,13 @@ class ScorechainEthereumClient(ScorechainBaseClient):
     SIGNALS_PERCENT_KEY = 'percentage'
     BLOCKCHAIN_CURRENCY = 'ETH'
 
-    def fetch_address_summary(self, address: str, score_type=TYPE_INPUT, token_currency=None):
+    def get_address_summary_uri(self, address: str, score_type=TYPE_INPUT, token_currency=None):
         if token_currency:
             token_addr = get_token_contract_address(token_currency, self.BLOCKCHAIN_CURRENCY)
-            data = self._make_request(f'/scoring/address/{address}/coin/{token_addr}/{score_type}')
-        else:
-            data = self._make_request(f'/scoring/address/{address}/{score_type}')
+            return f'/scoring/address/{address}/coin/{token_addr}/{score_type}'
+        return f'/scoring/address/{address}/{score_type}'
+
+    def parse_address_summary(self, data):
         if data['success']:
             return data['result']
         log.warning(data)
@@ -9,6 +9,7 @@ from cryptocoins.tasks.trx import *
 __all__ = (
     'sat_per_byte_cache',
     'process_deffered_deposit',
+    'process_deffered_deposits',
     'update_crypto_external_prices',
     'check_tx_withdrawal_task',
     'process_coin_deposit_task',
@@ -17,6 +18,7 @@ __all__ = (
     'withdraw_coin_task',
     'withdraw_tokens_task',
     'check_deposit_scoring_task',
+    'check_deposits_scoring_task',
     'check_balances_task',
     'check_balance_task',
     'accumulate_coin_task',
@@ -45,11 +45,26 @@ def withdraw_tokens_task(currency_code, withdrawal_request_id, password):
     evm_handlers_manager.get_handler(currency_code).withdraw_tokens(withdrawal_request_id, password)
 
 
+@shared_task
+def withdraw_batch_task(currency_code, withdrawal_requests_ids, password):
+    evm_handlers_manager.get_handler(currency_code).withdraw_batch(withdrawal_requests_ids, password)
+
+
+@shared_task
+def resend_pending_withdrawals_task(currency_code):
+    evm_handlers_manager.get_handler(currency_code).resend_pending_withdrawals()
+
+
 @shared_task
 def check_deposit_scoring_task(currency_code, wallet_transaction_id):
     evm_handlers_manager.get_handler(currency_code).check_deposit_scoring(wallet_transaction_id)
 
 
+@shared_task
+def check_deposits_scoring_task(currency_code, wallet_transactions_ids):
+    evm_handlers_manager.get_handler(currency_code).check_deposits_scoring(wallet_transactions_ids)
+
+
 @shared_task
 def check_balances_task(currency_code):
     evm_handlers_manager.get_handler(currency_code).check_balances()
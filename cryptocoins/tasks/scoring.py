@@ -2,6 +2,7 @@ import logging
 
 from celery.app import shared_task
 
+from cryptocoins.scoring.engine import make_score_key
 from cryptocoins.scoring.manager import ScoreManager
 from cryptocoins.utils.service import get_service_instance
 from lib.helpers import to_decimal
@@ -15,3 +16,25 @@ def process_deffered_deposit(tx_id, address, amount, currency_code):
     is_scoring_ok = ScoreManager.is_address_scoring_ok(tx_id, address, amount, currency_code)
     service = get_service_instance()
     service.process_deposit(tx_id, address, amount, is_scoring_ok)
+
+
+@shared_task
+def process_deffered_deposits(deposits):
+    """
+    Batch of (tx_id, address, amount, currency_code) deposits,
+    scores of all addresses are fetched concurrently before processing.
+    Failed deposit does not stop the batch, it is dispatched again to be processed alone
+    """
+    scores = ScoreManager.get_addresses_score_info((address, currency_code) for _, address, _, currency_code in deposits)
+    service = get_service_instance()
+    for tx_id, address, amount, currency_code in deposits:
+        try:
+            amount = to_decimal(amount)
+            addr_risk_data = scores.get(make_score_key(address, currency_code))
+            is_scoring_ok = ScoreManager.is_address_scoring_ok(
+                tx_id, address, amount, currency_code, addr_risk_data=addr_risk_data)
+            service.process_deposit(tx_id, address, amount, is_scoring_ok)
+        except Exception:
+            log.exception('Unable to process deffered deposit %s %s', tx_id, address)
+            # process_deposit skips already processed deposits, so retry is safe
+            process_deffered_deposit.apply_async([tx_id, address, amount, currency_code], queue='btc')
@@ -0,0 +1,289 @@
+import asyncio
+import datetime
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+from django.test import override_settings
+from django.utils import timezone
+from eth_account import Account
+from web3 import Web3
+
+from cryptocoins.coins.btc.benchmark import LocalBTCCoinService
+from cryptocoins.coins.btc.benchmark import LocalDeposit
+from cryptocoins.coins.btc.benchmark import run_accumulation
+from cryptocoins.evm.withdrawal_sender import EVMWithdrawalSender
+from cryptocoins.evm.withdrawal_sender import LocalNonce
+from cryptocoins.evm.withdrawal_sender import rpc_batch
+from cryptocoins.scoring.engine import ScoreEngine, make_score_key
+from lib.tests.stub_server import StubServerMixin
+
+
+class StubScoringProvider:
+    calls = []
+
+    def __init__(self, session):
+        self.session = session
+
+    def rate_key(self, currency_code):
+        return 'stub'
+
+    async def get_address_summary(self, address, currency_code, token_currency=None):
+        self.calls.append(address)
+        await asyncio.sleep(0.01)
+        return {'address': address, 'riskscore': {'value': 90}}
+
+
+class ScoreEngineTest(SimpleTestCase):
+
+    def test_fetch_scores_coalesces_same_address(self):
+        StubScoringProvider.calls = []
+        engine = ScoreEngine(provider_class=StubScoringProvider, rate=100, concurrency=5, cache_ttl=60)
+
+        async def fetch():
+            provider = StubScoringProvider(None)
+            return await asyncio.gather(*[engine.get_score(provider, 'addr1', 'BTC') for _ in range(5)])
+
+        results = asyncio.run(fetch())
+        self.assertEqual(StubScoringProvider.calls, ['addr1'])
+        self.assertTrue(all(r['riskscore']['value'] == 90 for r in results))
+
+    def test_fetch_scores(self):
+        StubScoringProvider.calls = []
+        engine = ScoreEngine(provider_class=StubScoringProvider, rate=100, concurrency=5, cache_ttl=60)
+        keys = {make_score_key(f'addr{i}', 'BTC') for i in range(10)}
+
+        results = asyncio.run(engine.fetch_scores(keys))
+        self.assertEqual(set(results), keys)
+        self.assertEqual(len(StubScoringProvider.calls), 10)
+
+
+class StubChain:
+    """
+    Dev chain stand-in: accepts raw txs, rejects ones from `rejected`
+    """
+
+    def __init__(self):
+        self.rejected = set()
+        self.errors = {}  # raw tx: error message
+        self.dropped = set()  # raw txs without response in batch
+        self.batches = True
+
+    def handle_call(self, call):
+        response = {'jsonrpc': '2.0', 'id': call['id']}
+        error = self.errors.get(call['params'][0])
+        if call['method'] == 'eth_getTransactionCount':
+            response['result'] = hex(5)
+        elif call['params'][0] in self.rejected:
+            response['error'] = {'code': -32000, 'message': 'insufficient funds for gas * price + value'}
+        elif error:
+            response['error'] = {'code': -32000, 'message': error}
+        else:
+            response['result'] = Web3.keccak(hexstr=call['params'][0]).hex()
+        return response
+
+    def respond(self, body):
+        if not isinstance(body, list):
+            return 200, self.handle_call(body)
+        if not self.batches:
+            return 200, {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch disabled'}}
+        return 200, [self.handle_call(call) for call in body if call['params'][0] not in self.dropped]
+
+
+class RpcBatchTest(StubServerMixin, SimpleTestCase):
+
+    def setUp(self):
+        self.chain = StubChain()
+        self.server = self.start_stub_server(self.chain.respond)
+        self.client = Web3(Web3.HTTPProvider(self.server.url))
+
+        account = Account.create()
+        self.raw_txs = [
+            account.sign_transaction({
+                'to': account.address,
+                'value': 1,
+                'gas': 21000,
+                'gasPrice': 10 ** 9,
+                'nonce': nonce,
+                'chainId': 1,
+            }).rawTransaction.hex()
+            for nonce in range(5, 15)
+        ]
+
+    def test_send_in_one_request(self):
+        self.chain.rejected = {self.raw_txs[3]}
+        results = rpc_batch(self.client, [('eth_sendRawTransaction', [raw_tx]) for raw_tx in self.raw_txs])
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(results), 10)
+        self.assertEqual([bool(error) for _, error in results], [i == 3 for i in range(10)])
+        self.assertEqual(results[0][0], Web3.keccak(hexstr=self.raw_txs[0]).hex())
+
+    def test_no_batches_support(self):
+        self.chain.batches = False
+        results = rpc_batch(self.client, [('eth_sendRawTransaction', [raw_tx]) for raw_tx in self.raw_txs[:3]])
+
+        self.assertEqual(len(self.server.requests), 4)
+        self.assertTrue(all(result and not error for result, error in results))
+
+
+class StubSender(EVMWithdrawalSender):
+    """
+    Sender with stub handler, reverted withdrawals are recorded instead of saved
+    """
+
+    def __init__(self, client, account):
+        self.handler = SimpleNamespace(CURRENCY='ETH', CHAIN_ID=1)
+        self.manager = SimpleNamespace(GAS_CURRENCY=21000)
+        self.client = client
+        self.address = account.address
+        self.private_key = account.key
+        self.nonce = LocalNonce(self.address)
+        self.reverted = []
+        self.signed_nonces = []
+
+    def sign(self, tx, nonce, gas_price):
+        self.signed_nonces.append(nonce)
+        return super().sign(tx, nonce, gas_price)
+
+    def revert_pending(self, withdrawal_request, tx_hash):
+        self.reverted.append(withdrawal_request.id)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class WithdrawalSenderTest(StubServerMixin, SimpleTestCase):
+
+    def setUp(self):
+        self.chain = StubChain()
+        self.server = self.start_stub_server(self.chain.respond)
+        self.sender = StubSender(Web3(Web3.HTTPProvider(self.server.url)), Account.create())
+        self.sender.nonce.reset()
+
+    def sign_batch(self, count=5, first_nonce=5):
+        tx = {'to': self.sender.address, 'value': 1, 'gas': 21000}
+        signed = [
+            (SimpleNamespace(id=i, currency='ETH'), nonce, self.sender.sign(tx, nonce, 10 ** 9))
+            for i, nonce in enumerate(range(first_nonce, first_nonce + count))
+        ]
+        self.sender.signed_nonces = []
+        return signed
+
+    def send(self, signed):
+        calls = [('eth_sendRawTransaction', [signed_tx.rawTransaction.hex()]) for _, _, signed_tx in signed]
+        return self.sender.reconcile(signed, rpc_batch(self.sender.client, calls), 10 ** 9)
+
+    def test_nonce_sync(self):
+        nonce = self.sender.nonce
+        self.assertEqual(nonce.sync(5, 7), 7)
+        nonce.save(6)
+        self.assertEqual(nonce.sync(5, 7), 7)
+        nonce.save(9)
+        # own txs are in mempool, node does not count ones sent to other nodes yet
+        self.assertEqual(nonce.sync(5, 7), 9)
+        # mempool is empty, txs above chain nonce were dropped
+        self.assertEqual(nonce.sync(7, 7), 7)
+
+    def test_rejected_in_the_middle(self):
+        signed = self.sign_batch()
+        self.chain.rejected = {signed[2][2].rawTransaction.hex()}
+
+        self.assertEqual(self.send(signed), 4)
+        self.assertEqual(self.sender.reverted, [2])
+        # empty tx takes nonce of rejected one
+        self.assertEqual(self.sender.signed_nonces, [7])
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.sender.nonce.sync(5, 5 + 4), 10)
+
+    def test_rejected_last(self):
+        signed = self.sign_batch()
+        self.chain.rejected = {signed[4][2].rawTransaction.hex()}
+
+        self.assertEqual(self.send(signed), 4)
+        self.assertEqual(self.sender.reverted, [4])
+        self.assertEqual(self.sender.signed_nonces, [])
+        self.assertEqual(self.sender.nonce.sync(5, 5), 5)
+        self.assertEqual(self.sender.nonce.sync(5, 6), 9)
+
+    def test_lost_response(self):
+        signed = self.sign_batch()
+        self.chain.dropped = {signed[1][2].rawTransaction.hex(), signed[4][2].rawTransaction.hex()}
+        self.chain.errors = {signed[3][2].rawTransaction.hex(): 'nonce too low'}
+
+        self.assertEqual(self.send(signed), 2)
+        # txs could be accepted by node, so they are not signed again
+        self.assertEqual(self.sender.reverted, [])
+        self.assertEqual(self.sender.signed_nonces, [])
+        self.assertEqual(self.sender.nonce.sync(5, 6), 10)
+
+    def test_gap_already_taken(self):
+        signed = self.sign_batch()
+        self.chain.rejected = {signed[1][2].rawTransaction.hex()}
+        self.chain.errors = {signed[2][2].rawTransaction.hex(): 'already known'}
+
+        def respond(body):
+            if len(self.server.requests) > 1:
+                return 200, [
+                    {'jsonrpc': '2.0', 'id': call['id'],
+                     'error': {'code': -32000, 'message': 'replacement transaction underpriced'}}
+                    for call in body
+                ]
+            return self.chain.respond(body)
+
+        self.server.respond = respond
+        self.assertEqual(self.send(signed), 4)
+        self.assertEqual(self.sender.signed_nonces, [6])
+        self.assertEqual(self.sender.nonce.sync(5, 6), 10)
+
+    def test_gap_not_filled(self):
+        signed = self.sign_batch()
+        self.chain.rejected = {signed[0][2].rawTransaction.hex()}
+
+        def respond(body):
+            if len(self.server.requests) > 1:
+                return 200, [
+                    {'jsonrpc': '2.0', 'id': call['id'], 'error': {'code': -32000, 'message': 'intrinsic gas too low'}}
+                    for call in body
+                ]
+            return self.chain.respond(body)
+
+        self.server.respond = respond
+        self.assertEqual(self.send(signed), 4)
+        # next batch takes nonce from chain and fills the gap
+        self.assertEqual(self.sender.nonce.sync(5, 5), 5)
+
+    def test_all_rejected(self):
+        signed = self.sign_batch(count=2)
+        self.sender.nonce.save(7)
+        self.chain.rejected = {signed_tx.rawTransaction.hex() for _, _, signed_tx in signed}
+
+        self.assertEqual(self.send(signed), 0)
+        self.assertEqual(self.sender.reverted, [0, 1])
+        self.assertEqual(self.sender.nonce.sync(5, 6), 6)
+
+
+@override_settings(
+    BTC_ACCUMULATION_BATCH_MAX_INPUTS=20,
+    BTC_ACCUMULATION_BATCH_MAX_SAT_PER_BYTE=20,
+    BTC_ACCUMULATION_BATCH_MAX_WAIT=60 * 60,
+)
+class BTCAccumulationTest(SimpleTestCase):
+
+    def test_batched_sends_fewer_txs(self):
+        single = run_accumulation('single', 50, sat_per_byte=10)
+        batched = run_accumulation('batched', 50, sat_per_byte=10)
+
+        self.assertEqual((single['accumulated'], single['txs']), (50, 50))
+        self.assertEqual((batched['accumulated'], batched['txs']), (50, 3))
+        self.assertLess(batched['vbytes'], single['vbytes'])
+        self.assertLess(Decimal(batched['fee']), Decimal(single['fee']))
+
+    def test_high_fee_accumulates_only_overdue_deposits(self):
+        now = timezone.now()
+        overdue = LocalDeposit(1, 'addr1', '0.01', created=now - datetime.timedelta(hours=2))
+        recent = LocalDeposit(2, 'addr2', '0.01', created=now - datetime.timedelta(minutes=5))
+        service = LocalBTCCoinService([overdue, recent], sat_per_byte=50)
+
+        service.accumulate_batched([overdue, recent])
+        self.assertEqual(len(service.node.sent), 1)
+        self.assertEqual(overdue.state, 'accumulation_in_progress')
+        self.assertEqual(recent.state, 'ready')
@@ -2,8 +2,6 @@ import datetime
 import logging
 from decimal import Decimal
 
-from django.db import models
-from django.db.models import Sum, Case, When, F, Count, Q
 from django.utils import timezone
 from rest_framework.response import Response
 
@@ -11,11 +9,14 @@ from admin_rest import restful_admin as api_admin
 from admin_rest.mixins import ReadOnlyMixin, NonPaginatedListMixin
 from admin_rest.restful_admin import DefaultApiAdmin
 from core.consts.currencies import ALL_CURRENCIES
-from core.enums.profile import UserTypeEnum
-from core.models import Order
 from core.models.inouts.pair import Pair
 from core.utils.stats.counters import CurrencyStats
 from core.utils.stats.lib import get_prices_in_usd
+from dashboard_rest.stats import parse_bound
+from dashboard_rest.stats import topups_stat
+from dashboard_rest.stats import trade_volume_stat
+from dashboard_rest.stats import users_joined_stat
+from dashboard_rest.stats import withdrawals_stat
 from dashboard_rest.models import CommonInouts, CommonUsersStats, TradeVolume
 from dashboard_rest.models import Topups
 from dashboard_rest.models import TradeFee
@@ -86,17 +87,9 @@ class CommonUsersStatsAdmin(ReadOnlyMixin, NonPaginatedListMixin, DefaultApiAdmi
         pass
 
     def list(self, request, *args, **kwargs):
-        now = timezone.now()
-        interval = {
-            'start': request.query_params.get('date_joined[start]') or now - datetime.timedelta(days=1),
-            'end': request.query_params.get('date_joined[end]') or datetime.date(datetime.MAXYEAR, 1, 1)
-        }
-        total_users = CommonUsersStats.objects.filter(
-            date_joined__gte=interval['start'],
-            date_joined__lte=interval['end'],
-        ).aggregate(
-            total_users=Count('id'),
-        )['total_users'] or 0
+        start = parse_bound(request.query_params.get('date_joined[start]'), timezone.now() - datetime.timedelta(days=1))
+        end = parse_bound(request.query_params.get('date_joined[end]'))
+        total_users = users_joined_stat.get(start, end).get((), {}).get('count') or 0
         res = [
             {
                 'stat_name': 'Users count',
@@ -122,29 +115,12 @@ class CommonInoutsAdmin(ReadOnlyMixin, NonPaginatedListMixin, DefaultApiAdmin):
 
     def list(self, request, *args, **kwargs):
         res = []
-        now = timezone.now()
-        interval = {
-            'start': request.query_params.get('created[start]') or now - datetime.timedelta(days=1),
-            'end': request.query_params.get('created[end]') or datetime.date(datetime.MAXYEAR, 1, 1)
-        }
+        start = parse_bound(request.query_params.get('created[start]'), timezone.now() - datetime.timedelta(days=1))
+        end = parse_bound(request.query_params.get('created[end]'))
 
         prices_in_usd = get_prices_in_usd()
-        topups = CurrencyStats.topups(
-            interval,
-            filter_qs=[~Q(
-                Q(user__profile__user_type=UserTypeEnum.staff.value)
-                | Q(user__profile__user_type=UserTypeEnum.bot.value)
-                | Q(user__email__endswith='@bot.com')
-            )],
-        )
-        withdrawals = CurrencyStats.withdrawals_and_fees(
-            interval,
-            filter_qs=[~Q(
-                Q(user__profile__user_type=UserTypeEnum.staff.value)
-                | Q(user__profile__user_type=UserTypeEnum.bot.value)
-                | Q(user__email__endswith='@bot.com')
-            )],
-        )
+        topups = {currency: row for (currency,), row in topups_stat.get(start, end).items()}
+        withdrawals = {currency: row for (currency,), row in withdrawals_stat.get(start, end).items()}
 
         total_topus = 0
         total_withdrawals = 0
@@ -152,9 +128,9 @@ class CommonInoutsAdmin(ReadOnlyMixin, NonPaginatedListMixin, DefaultApiAdmin):
         for currency in ALL_CURRENCIES:
             usd_price = prices_in_usd.get(currency) or 0
 
-            topups_amount = round(topups.get(currency, {}).get('total_amount') or Decimal('0'), 8)
+            topups_amount = round(topups.get(currency, {}).get('amount') or Decimal('0'), 8)
             topups_amount_usd = round(topups_amount * usd_price, 2)
-            withdrawals_amount = round(withdrawals.get(currency, {}).get('total_amount') or Decimal('0'), 8)
+            withdrawals_amount = round(withdrawals.get(currency, {}).get('amount') or Decimal('0'), 8)
             withdrawals_amount_usd = round(withdrawals_amount * usd_price, 2)
 
             total_topus += topups_amount_usd
@@ -188,44 +164,16 @@ class TradeVolumeAdmin(ReadOnlyMixin, NonPaginatedListMixin, DefaultApiAdmin):
         pass
 
     def list(self, request, *args, **kwargs):
-        interval = {
-            'start': request.query_params.get('created[start]') or datetime.date(datetime.MINYEAR, 1, 1),
-            'end': request.query_params.get('created[end]') or datetime.date(datetime.MAXYEAR, 1, 1)
-        }
-        qs = TradeVolume.objects.filter(
-            ~Q(
-                Q(user__profile__user_type=UserTypeEnum.staff.value)
-                | Q(user__profile__user_type=UserTypeEnum.bot.value)
-                | Q(user__email__endswith='@bot.com')
-            ),
-            created__gte=interval['start'],
-            created__lte=interval['end'],
-            cancelled=False,
-        ).values('pair').annotate(
-            base_volume=Sum(
-                Case(
-                    When(order__operation=Order.OPERATION_BUY, then=F('quantity')),
-                    default=0,
-                    output_field=models.DecimalField(),
-                )
-            ),
-            quote_volume=Sum(
-                Case(
-                    When(order__operation=Order.OPERATION_BUY, then=F('quantity') * F('price')),
-                    default=0,
-                    output_field=models.DecimalField(),
-                )
-            ),
-        ).order_by('pair')
-
-        volumes_dict = {p['pair']: p for p in qs}
+        start = parse_bound(request.query_params.get('created[start]'))
+        end = parse_bound(request.query_params.get('created[end]'))
+        volumes_dict = {pair_id: row for (pair_id,), row in trade_volume_stat.get(start, end).items()}
 
         volumes = []
         for pair in Pair.objects.all():
             volumes.append({
                 'pair': pair.code,
-                'base_volume': round(volumes_dict.get(pair, {}).get('base_volume', 0), 8),
-                'quote_volume': round(volumes_dict.get(pair, {}).get('quote_volume', 0), 8),
+                'base_volume': round(volumes_dict.get(pair.id, {}).get('base_volume', 0), 8),
+                'quote_volume': round(volumes_dict.get(pair.id, {}).get('quote_volume', 0), 8),
             })
 
         total = Decimal(0)
@@ -0,0 +1,63 @@
+# Generated by Django 3.2.7 on 2026-10-19 10:00
+
+import core.currency
+import core.models.inouts.pair
+from django.db import migrations, models
+import django.db.models.deletion
+import lib.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_userpairdailystat_last_execution_result_id'),
+        ('dashboard_rest', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HourlyTopups',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('currency', core.currency.CurrencyModelField()),
+                ('amount', lib.fields.MoneyField(decimal_places=8, default=0, max_digits=32)),
+            ],
+            options={
+                'unique_together': {('hour', 'currency')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyUsersJoined',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HourlyWithdrawals',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('currency', core.currency.CurrencyModelField()),
+                ('amount', lib.fields.MoneyField(decimal_places=8, default=0, max_digits=32)),
+            ],
+            options={
+                'unique_together': {('hour', 'currency')},
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyTradeVolume',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('base_volume', lib.fields.MoneyField(decimal_places=8, default=0, max_digits=32)),
+                ('quote_volume', lib.fields.MoneyField(decimal_places=8, default=0, max_digits=32)),
+                ('pair', core.models.inouts.pair.PairModelField(on_delete=django.db.models.deletion.CASCADE, to='core.pair')),
+            ],
+            options={
+                'unique_together': {('hour', 'pair')},
+            },
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.contrib.auth.models import User
+from django.db import models
 
+from core.currency import CurrencyModelField
+from core.models.inouts.pair import Pair
+from core.models.inouts.pair import PairModelField
 from core.models.inouts.wallet import WalletTransactions
 from core.models.inouts.withdrawal import WithdrawalRequest
 from core.models.orders import ExecutionResult
+from lib.fields import MoneyField
 
 
 class Topups(WalletTransactions):
@@ -38,3 +43,36 @@ class CommonInouts(WalletTransactions):
 class TradeVolume(ExecutionResult):
     class Meta:
         proxy = True
+
+
+class HourlyTradeVolume(models.Model):
+    hour = models.DateTimeField()
+    pair = PairModelField(Pair, on_delete=models.CASCADE)
+    base_volume = MoneyField(default=0)
+    quote_volume = MoneyField(default=0)
+
+    class Meta:
+        unique_together = (('hour', 'pair'),)
+
+
+class HourlyTopups(models.Model):
+    hour = models.DateTimeField()
+    currency = CurrencyModelField()
+    amount = MoneyField(default=0)
+
+    class Meta:
+        unique_together = (('hour', 'currency'),)
+
+
+class HourlyWithdrawals(models.Model):
+    hour = models.DateTimeField()
+    currency = CurrencyModelField()
+    amount = MoneyField(default=0)
+
+    class Meta:
+        unique_together = (('hour', 'currency'),)
+
+
+class HourlyUsersJoined(models.Model):
+    hour = models.DateTimeField(unique=True)
+    count = models.PositiveIntegerField(default=0)
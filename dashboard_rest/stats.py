@@ -0,0 +1,274 @@
+import datetime
+import logging
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Q
+from django.db.models import Sum
+from django.db.models import When
+from django.db.models.functions import TruncHour
+from django.db.transaction import atomic
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.dateparse import parse_datetime
+
+from core.cache import dashboard_stats_cache
+from core.enums.profile import UserTypeEnum
+from core.models import Order
+from core.models.inouts.transaction import REASON_TOPUP
+from core.models.inouts.transaction import Transaction
+from core.models.inouts.withdrawal import COMPLETED
+from core.models.inouts.withdrawal import WithdrawalRequest
+from core.models.orders import ExecutionResult
+from dashboard_rest.models import HourlyTopups
+from dashboard_rest.models import HourlyTradeVolume
+from dashboard_rest.models import HourlyUsersJoined
+from dashboard_rest.models import HourlyWithdrawals
+
+log = logging.getLogger(__name__)
+
+HOUR = datetime.timedelta(hours=1)
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def not_staff_or_bot(prefix='user__'):
+    return ~Q(
+        Q(**{f'{prefix}profile__user_type': UserTypeEnum.staff.value})
+        | Q(**{f'{prefix}profile__user_type': UserTypeEnum.bot.value})
+        | Q(**{f'{prefix}email__endswith': '@bot.com'})
+    )
+
+
+def floor_hour(dt):
+    # hours are cut in current time zone like TruncHour does
+    return timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+
+
+def ceil_hour(dt):
+    floored = floor_hour(dt)
+    return floored if floored == dt else floored + HOUR
+
+
+def parse_bound(value, default=None):
+    """
+    Datetime from query param value, date means its midnight
+    """
+    if not value:
+        return default
+    if isinstance(value, str):
+        value = parse_datetime(value) or parse_date(value)
+        if value is None:
+            return default
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+class HourlyStat:
+    """
+    Sums of source rows kept by hour in summary model.
+    Full hours up to refresh checkpoint are read from summary,
+    edges of interval and hours not refreshed yet are counted from source
+    """
+    name = None
+    model = None
+    time_field = 'created'
+    group_by = ()
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_aggregates(self) -> dict:
+        raise NotImplementedError
+
+    def source(self, start, end):
+        return self.get_queryset().filter(**{
+            f'{self.time_field}__gte': start,
+            f'{self.time_field}__lt': end,
+        })
+
+    def group(self, qs, aggregates) -> dict:
+        if not self.group_by:
+            return {(): qs.aggregate(**aggregates)}
+        qs = qs.values(*self.group_by).annotate(**aggregates).order_by()
+        return {tuple(row[f] for f in self.group_by): row for row in qs}
+
+    def count_live(self, start, end) -> dict:
+        if start >= end:
+            return {}
+        return self.group(self.source(start, end), self.get_aggregates())
+
+    def count_summary(self, start, end) -> dict:
+        qs = self.model.objects.filter(hour__gte=start, hour__lt=end)
+        return self.group(qs, {f: Sum(f) for f in self.get_aggregates()})
+
+    def get_refreshed_to(self):
+        return dashboard_stats_cache.get(self.name)
+
+    def get(self, start=None, end=None) -> dict:
+        """
+        Sums for [start, end) grouped by group_by fields
+        """
+        now = timezone.now()
+        start = max(start, EPOCH) if start else EPOCH
+        end = min(end, now) if end else now
+        if start >= end:
+            return {}
+
+        summary_start, summary_end = ceil_hour(start), floor_hour(end)
+        refreshed_to = self.get_refreshed_to()
+        if refreshed_to:
+            summary_end = min(summary_end, refreshed_to)
+
+        if not refreshed_to or summary_start >= summary_end:
+            parts = [self.count_live(start, end)]
+        else:
+            parts = [
+                self.count_live(start, summary_start),
+                self.count_summary(summary_start, summary_end),
+                self.count_live(summary_end, end),
+            ]
+
+        result = {}
+        for part in parts:
+            for key, row in part.items():
+                total = result.setdefault(key, {f: 0 for f in self.get_aggregates()})
+                for field in total:
+                    total[field] += row[field] or 0
+        return result
+
+    def get_first(self):
+        first = self.get_queryset().order_by(self.time_field).values_list(self.time_field, flat=True).first()
+        return floor_hour(first) if first else None
+
+    def refresh(self, start, end):
+        """
+        Recounts summary rows of hours in [start, end)
+        """
+        rows = self.source(start, end).annotate(
+            hour=TruncHour(self.time_field),
+        ).values('hour', *self.group_by).annotate(**self.get_aggregates()).order_by()
+
+        objects = []
+        for row in rows:
+            objects.append(self.model(**{self.model._meta.get_field(f).attname: v for f, v in row.items()}))
+
+        with atomic():
+            self.model.objects.filter(hour__gte=start, hour__lt=end).delete()
+            self.model.objects.bulk_create(objects, batch_size=1000)
+
+    def refresh_recent(self, recount_hours=None, chunk_hours=None):
+        """
+        Recounts last complete hours, on first run fills summary from the first source row
+        """
+        recount_hours = recount_hours or settings.DASHBOARD_STATS_RECOUNT_HOURS
+        chunk_hours = chunk_hours or settings.DASHBOARD_STATS_CHUNK_HOURS
+
+        end = floor_hour(timezone.now())
+        refreshed_to = self.get_refreshed_to()
+        if refreshed_to:
+            start = min(refreshed_to, end) - recount_hours * HOUR
+        else:
+            start = self.get_first() or end
+
+        while start < end:
+            chunk_end = min(start + chunk_hours * HOUR, end)
+            self.refresh(start, chunk_end)
+            dashboard_stats_cache.set(self.name, max(chunk_end, refreshed_to or chunk_end), timeout=None)
+            log.info('%s refreshed from %s to %s', self.name, start, chunk_end)
+            start = chunk_end
+
+        if not refreshed_to:
+            dashboard_stats_cache.set(self.name, end, timeout=None)
+
+
+class TradeVolumeStat(HourlyStat):
+    name = 'trade-volume'
+    model = HourlyTradeVolume
+    group_by = ('pair',)
+
+    def get_queryset(self):
+        return ExecutionResult.objects.filter(not_staff_or_bot(), cancelled=False)
+
+    def get_aggregates(self):
+        return {
+            'base_volume': Sum(
+                Case(
+                    When(order__operation=Order.OPERATION_BUY, then=F('quantity')),
+                    default=0,
+                    output_field=models.DecimalField(),
+                )
+            ),
+            'quote_volume': Sum(
+                Case(
+                    When(order__operation=Order.OPERATION_BUY, then=F('quantity') * F('price')),
+                    default=0,
+                    output_field=models.DecimalField(),
+                )
+            ),
+        }
+
+
+class TopupsStat(HourlyStat):
+    name = 'topups'
+    model = HourlyTopups
+    group_by = ('currency',)
+
+    def get_queryset(self):
+        return Transaction.objects.filter(not_staff_or_bot(), reason=REASON_TOPUP)
+
+    def get_aggregates(self):
+        return {'amount': Sum('amount')}
+
+
+class WithdrawalsStat(HourlyStat):
+    # bucketed by completion time, new name makes summary of former updated buckets rebuilt
+    name = 'withdrawals-completed'
+    model = HourlyWithdrawals
+    time_field = 'completed'
+    group_by = ('currency',)
+
+    def get_queryset(self):
+        return WithdrawalRequest.objects.filter(
+            not_staff_or_bot(),
+            approved=True,
+            confirmed=True,
+            state=COMPLETED,
+        )
+
+    def get_aggregates(self):
+        return {'amount': Sum('amount')}
+
+
+class UsersJoinedStat(HourlyStat):
+    name = 'users-joined'
+    model = HourlyUsersJoined
+    time_field = 'date_joined'
+
+    def get_queryset(self):
+        return User.objects.all()
+
+    def get_aggregates(self):
+        return {'count': Count('id')}
+
+
+trade_volume_stat = TradeVolumeStat()
+topups_stat = TopupsStat()
+withdrawals_stat = WithdrawalsStat()
+users_joined_stat = UsersJoinedStat()
+
+HOURLY_STATS = [trade_volume_stat, topups_stat, withdrawals_stat, users_joined_stat]
+
+
+def refresh_dashboard_stats():
+    for stat in HOURLY_STATS:
+        try:
+            stat.refresh_recent()
+        except Exception:
+            log.exception('Unable to refresh %s dashboard stats', stat.name)
@@ -0,0 +1,8 @@
+from celery.app import shared_task
+
+from dashboard_rest import stats
+
+
+@shared_task
+def refresh_dashboard_stats():
+    stats.refresh_dashboard_stats()
@@ -18,6 +18,7 @@ from django.conf import settings
 from celery.schedules import crontab
 from celery import Celery
 from celery.signals import worker_ready
+from celery.signals import worker_process_init
 
 
 # @worker_ready.connect
@@ -26,6 +27,12 @@ from celery.signals import worker_ready
 #          sender.app.send_task('inouts.tasks.sync_currencies_with_db', (), connection=conn)
 
 
+@worker_process_init.connect
+def start_worker_metrics(**kwargs):
+    from lib.metrics import start_metrics_server
+    start_metrics_server()
+
+
 def is_section_enabled(name):
     return env(f'COMMON_TASKS_{name.upper()}', default=True)
 
@@ -132,11 +139,6 @@ if is_section_enabled('notifications'):
             'queue': 'notifications',
         },
     })
-    app.conf.task_routes.update({
-        'core.tasks.orders.send_order_changed_api_callback_request': {
-            'queue': 'notifications',
-        }
-    })
     app.conf.task_routes.update({
         'core.tasks.inouts.withdrawal_failed_email': {
             'queue': 'notifications',
@@ -227,6 +229,24 @@ if is_section_enabled('kyc'):
     })
     app.conf.task_queues += (Queue('kyc'),)
 
+app.conf.beat_schedule.update({
+    'check_balance_cache': {
+        'task': 'core.tasks.inouts.check_balance_cache',
+        'schedule': crontab(minute='*/30'),
+        'options': {
+            'queue': 'default',
+        },
+    },
+    'flush_access_logs': {
+        'task': 'core.tasks.facade.flush_access_logs',
+        'schedule': settings.ACCESS_LOG_FLUSH_PERIOD,
+        'options': {
+            'expires': settings.ACCESS_LOG_FLUSH_PERIOD * 2,
+            'queue': 'default',
+        },
+    },
+})
+
 if is_section_enabled('cleanup'):
     app.conf.beat_schedule.update({
         'bot_matches_cleanup': {
@@ -349,6 +369,15 @@ if is_section_enabled('stats'):
         }
     })
     app.conf.beat_schedule.update({
+        'accumulate_user_stats': {
+            'task': 'core.tasks.stats.accumulate_user_stats',
+            'schedule': crontab(minute='*'),
+            'args': (),
+            'options': {
+                'expires': 50,
+                'queue': 'stats',
+            }
+        },
         'make_user_stats': {
             'task': 'core.tasks.stats.make_user_stats',
             'schedule': crontab(minute='1', hour='5'),
@@ -359,8 +388,8 @@ if is_section_enabled('stats'):
         },
         'aggregate_fee': {
             'task': 'core.tasks.orders.aggregate_fee',
-            'schedule': crontab(minute='1', hour='4'),
-            'args': (),
+            'schedule': crontab(minute='1'),
+            'args': (False,),
             'options': {
                 'queue': 'stats',
             }
@@ -434,6 +463,14 @@ if is_section_enabled('stats'):
             },
 
         },
+        'refresh_dashboard_stats': {
+            'task': 'dashboard_rest.tasks.refresh_dashboard_stats',
+            'schedule': crontab(minute='*/5'),
+            'options': {
+                'expires': 290,
+                'queue': 'stats',
+            },
+        },
     })
     app.conf.task_queues += (Queue('stats'),)
 
@@ -21,9 +21,12 @@ from core.serializers.wallet_history import WalletHistoryItemSerializer
 from core.utils.stats.daily import get_filtered_pairs_24h_stats
 from core.views.stats import PairTradeChartDataWithPreAggregattion
 from core.views.stats import StatsSerializer
+from lib.countless_pagination import keyset_page
 from lib.helpers import dt_from_js
 from lib.helpers import find_similar_entry_by_field
 from lib.helpers import normalize_data
+from lib.metrics import notifications_group_send
+from lib.metrics import notifications_group_send_seconds
 
 channel_layer = get_channel_layer()
 MSG_TYPE = 'exchange.message'
@@ -51,7 +54,9 @@ class BaseNotificator:
 
     def notify(self, data, **kwargs):
         data = self.prepare_data(data, is_notification=True, **kwargs)
-        async_to_sync(channel_layer.group_send)(self.gen_channel(**kwargs), data)
+        with notifications_group_send_seconds.labels(self.MSG_KIND).time():
+            async_to_sync(channel_layer.group_send)(self.gen_channel(**kwargs), data)
+        notifications_group_send.labels(self.MSG_KIND).inc()
 
     def get_data(self, **kwargs):
         raise NotImplementedError
@@ -219,17 +224,23 @@ class BasePaginatedNotificator(BaseNotificator):
         key = f'wsdata-' + self.gen_channel(**kwargs)
         cache.set(key, data, timeout=60)
 
-    def get_paginated_data(self, new_data=None, page=1, limit=0, **kwargs):
+    def get_paginated_data(self, new_data=None, page=1, limit=0, cursor=None, **kwargs):
+        """
+        Pages are selected by offset, or by keyset if cursor is passed (empty for the first page)
+        """
         limit = limit or self.LIMIT
 
-        cached_data = self.get_cache(**kwargs)
-        delete = kwargs.get('delete')
-
         if page < 1:
             page = 1
         if limit < 1:
             limit = 1
 
+        if cursor is not None:
+            return self.get_keyset_data(cursor, limit, **kwargs)
+
+        cached_data = self.get_cache(**kwargs)
+        delete = kwargs.get('delete')
+
         if page == 1 and cached_data and len(cached_data['results']) >= limit:
             data = cached_data
             if new_data:
@@ -271,14 +282,26 @@ class BasePaginatedNotificator(BaseNotificator):
 
     def _get_qs_data(self, page=1, limit=10, **kwargs):
         qs = self.get_queryset(**kwargs)
-        total_entries = qs.count()
         offset = (page - 1) * limit
-        serialized_data = self.SERIALIZER(qs[offset:offset + limit], many=True).data
+        items = list(qs[offset:offset + limit])
+        if len(items) < limit and (items or not offset):
+            # last page, count is known without COUNT query
+            total_entries = offset + len(items)
+        else:
+            total_entries = qs.count()
+        serialized_data = self.SERIALIZER(items, many=True).data
         data = {'results': serialized_data, 'total_entries': total_entries}
         if page == 1:
             self.set_cache(data, **kwargs)
         return data
 
+    def get_keyset_data(self, cursor, limit, **kwargs):
+        items, next_cursor = keyset_page(self.get_queryset(**kwargs), limit, cursor)
+        return {
+            'results': self.SERIALIZER(items, many=True).data,
+            'next_cursor': next_cursor,
+        }
+
     def get_queryset(self, **kwargs):
         raise NotImplementedError
 
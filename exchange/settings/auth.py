@@ -20,3 +20,6 @@ IP_MASK = env('CAPTCHA_ALLOWED_IP_MASK', default=r'172.\d{1,3}.\d{1,3}.\d{1,3}')
 CAPTCHA_ALLOWED_IP_MASK = fr"{IP_MASK}"
 
 DISALLOW_COUNTRY = ('', 'US', 'BS', 'BW', 'KH', 'KP', 'ET', 'GH', 'IR', 'RS', 'LK', 'SY', 'TT', 'TN', 'YE')
+
+HMAC_CREDENTIALS_CACHE_SIZE = 10000  # api keys kept in process memory
+HMAC_CREDENTIALS_CACHE_TTL = 60  # seconds, profile changes are picked up earlier by redis version check
@@ -2,3 +2,4 @@ from exchange.settings import env
 
 BOTS_API_BASE_URL = env('BOTS_API_BASE_URL')
 BOT_PASSWORD = env('BOT_PASSWORD', default='123456')
+BOTS_IN_PROCESS_EXCHANGE = env.bool('BOTS_IN_PROCESS_EXCHANGE', default=False)  # use db and stack queue instead of api
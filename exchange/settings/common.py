@@ -87,6 +87,20 @@ MIDDLEWARE = [
     'django_otp.middleware.OTPMiddleware',
 ]
 
+# access logs are queued in redis and written to db by flush_access_logs task
+ACCESS_LOG_QUEUE_MAX_SIZE = 500_000
+ACCESS_LOG_FLUSH_BATCH_SIZE = 5000
+ACCESS_LOG_FLUSH_PERIOD = 5  # seconds
+
+# process metrics, disabled by default.
+# celery worker processes serve own metrics on METRICS_ADDR and the first free port from METRICS_PORT.
+# web /metrics is served only with METRICS_TOKEN set and PROMETHEUS_MULTIPROC_DIR env shared by web workers
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=False)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')  # bearer token required by web /metrics
+METRICS_ADDR = env('METRICS_ADDR', default='127.0.0.1')
+METRICS_PORT = env.int('METRICS_PORT', default=9400)
+METRICS_PORTS_COUNT = 32
+
 
 TEMPLATES = [
     {
@@ -153,6 +167,13 @@ STATIC_URL = '/staticfiles/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/upload/'
 
+# admin exports are written by celery workers to default storage and downloaded through admin api,
+# storage must be shared by workers and web (e.g. MEDIA_ROOT on a shared volume or object storage).
+# keep EXPORTS_DIR out of public media serving
+EXPORTS_DIR = 'exports'
+EXPORT_CHUNK_SIZE = 2000  # rows fetched from db cursor at once
+EXPORT_KEEP_HOURS = 24
+
 
 MAINTENANCE_MODE = None
 MAINTENANCE_MODE_STATE_BACKEND = 'maintenance_mode.backends.LocalFileBackend'
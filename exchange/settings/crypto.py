@@ -24,6 +24,15 @@ SAT_PER_BYTES_UPDATE_PERIOD = 120  # 2min
 SAT_PER_BYTES_MIN_LIMIT = 3
 SAT_PER_BYTES_MAX_LIMIT = 60
 SAT_PER_BYTES_RATIO = 1
+BTC_ACCUMULATION_BATCH = False  # consolidate deposits into multi-input transactions
+BTC_ACCUMULATION_BATCH_MAX_INPUTS = 100
+BTC_ACCUMULATION_BATCH_MAX_VBYTES = 20000
+BTC_ACCUMULATION_BATCH_MAX_SAT_PER_BYTE = 20  # postpone consolidation while fee rate is higher
+BTC_ACCUMULATION_BATCH_MAX_WAIT = 24 * 60 * 60  # seconds, older deposits are accumulated one by one at any fee rate
+
+EVM_WITHDRAWAL_BATCH = False  # sign withdrawals with local nonces and submit them in JSON-RPC batches
+EVM_WITHDRAWAL_BATCH_SIZE = 100
+EVM_WITHDRAWAL_RESEND_AFTER = 5 * 60  # seconds, batch withdrawals pending longer are checked and sent again
 
 # TRRXITTE Ethereum and ETX20
 
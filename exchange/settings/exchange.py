@@ -33,6 +33,8 @@ PAYOUTS_PROCESSING_ENABLED = True  # Flag to disable any payouts processing
 EXTERNAL_PRICES_DEVIATION_PERCENTS = 10
 CRYPTOCOMPARE_DEVIATION_PERCENTS = 2
 EXTERNAL_PRICES_FETCH_PERIOD = env('EXTERNAL_PRICE_FETCH_PERIOD', default=15)  # every N seconds
+EXTERNAL_PRICES_SOURCE_TIMEOUT = 5  # seconds to wait for each prices source
+EXTERNAL_PRICES_LOCAL_CACHE_TTL = 1  # seconds to keep external prices in process memory
 
 FEE_USER = env('FEE_USER', default='fee@exchange.net')
 
@@ -54,11 +56,32 @@ PRICE_UPDATE_CACHES = {
 ERROR_LOG_ON_AVG_TOTAL_LESS_0 = False  # avg price ounter
 
 ORDER_DELETE_ATTEMPT_CACHE = True
+ORDERS_BATCH_MAX_SIZE = 100  # max orders in bulk create request
 
 CRYPTOCOMPARE_API_KEY = env('CRYPTOCOMPARE_API_KEY')
 
 STATS_CLEANUP_MINUTE_INTERVAL_DAYS_AGO = 7  # days
 
+# order changed callbacks dispatcher.
+# callbacks are only queued in redis by stack workers, one long-running
+# `manage.py api_callback_dispatcher` process must be deployed to send them
+API_CALLBACK_RATE_LIMIT = 20  # requests per second for each endpoint host
+API_CALLBACK_CONCURRENCY = 200  # open connections in total
+API_CALLBACK_CONNECTIONS_PER_HOST = 10
+API_CALLBACK_MAX_IN_FLIGHT = 5000
+API_CALLBACK_RETRIES = 3
+API_CALLBACK_TIMEOUT = 5  # seconds
+API_CALLBACK_POLL_INTERVAL = 0.2  # seconds
+
+BALANCE_CACHE_TTL = 60 * 60  # seconds, user balances cache filled on read
+
+USER_STATS_RANGE_SIZE = 100_000  # ExecutionResult ids per accumulation transaction
+USER_STATS_LAG = 10  # seconds, matches newer than this are accumulated on next run
+USER_STATS_RECONCILE_DAYS = 1  # days recounted by nightly make_user_stats
+
+DASHBOARD_STATS_RECOUNT_HOURS = 2  # complete hours recounted into dashboard summaries on each refresh
+DASHBOARD_STATS_CHUNK_HOURS = 24 * 7  # hours refreshed in one transaction while filling summaries
+
 EXCHANGE_DESCRIPTION = 'Exchange description'
 EXCHANGE_INFO = {
     "name": "Exchange",
@@ -5,3 +5,6 @@ SCORECHAIN_BITCOIN_TOKEN = env('SCORECHAIN_BITCOIN_TOKEN')
 SCORECHAIN_ETHEREUM_TOKEN = env('SCORECHAIN_ETHEREUM_TOKEN')
 SCORECHAIN_TRON_TOKEN = env('SCORECHAIN_TRON_TOKEN')
 SCORECHAIN_BNB_TOKEN = env('SCORECHAIN_BNB_TOKEN')
+SCORING_RATE_LIMIT = 5  # requests per second for each scoring provider
+SCORING_CONCURRENCY = 10
+SCORING_CACHE_TTL = 60 * 10  # seconds to reuse address score
@@ -13,6 +13,7 @@ from tablib import Dataset
 from core.currency import Currency
 from core.models import Order, Transaction, ExecutionResult
 from core.models.inouts.pair import Pair
+from lib.batch import chunks
 
 log = logging.getLogger(__name__)
 
@@ -62,18 +63,27 @@ def backup_qs_to_csv(queryset):
     return res
 
 
-def queryset_to_csv(queryset, filename):
+def queryset_to_csv(queryset, filename, chunk_size=None):
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
     resource = create_import_export_resource(queryset.model)
-    dataset = resource.export(queryset)
-    csv = dataset.csv
-
-    # delete header if file already exists
-    if os.path.exists(filename):
-        csv = csv.split('\r\n',1)[1]
+    # header only for new file
+    with_header = not os.path.exists(filename)
+    rows = 0
 
     with open(filename, 'a') as csvfile:
-        csvfile.write(csv)
-    log.info(f'{len(dataset)} rows written to {filename}')
+        # objects fetched by chunks with server side cursor and exported chunk by chunk
+        for chunk in chunks(queryset.iterator(chunk_size=chunk_size), chunk_size):
+            csv = resource.export(chunk).csv
+            if not with_header:
+                csv = csv.split('\r\n', 1)[1]
+            with_header = False
+            csvfile.write(csv)
+            rows += len(chunk)
+
+        if with_header:
+            csvfile.write(resource.export([]).csv)
+
+    log.info(f'{rows} rows written to {filename}')
     return filename
 
 
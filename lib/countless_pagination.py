@@ -1,10 +1,39 @@
+import base64
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
 from django.core.paginator import Paginator
+from django.db.models import F
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.expressions import OrderBy
+from rest_framework.pagination import CursorPagination
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.utils.urls import replace_query_param
 
 
+class CountLessCursorPaginator(CursorPagination):
+    """
+    Keyset pagination: page is selected by position of the previous page last row instead of OFFSET,
+    so deep pages cost the same as the first one and COUNT is never made
+    """
+    ordering = '-id'
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+
 class CountLessPaginator(LimitOffsetPagination):
+    # requests with cursor param (empty for the first page) are paginated by keyset
+    cursor_paginator_class = CountLessCursorPaginator
+
     def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.cursor_paginator_class.cursor_query_param in request.query_params:
+            self.cursor_paginator = self.cursor_paginator_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
         self.count = None
         self.limit = self.get_limit(request)
         if self.limit is None:
@@ -17,6 +46,11 @@ class CountLessPaginator(LimitOffsetPagination):
 
         return list(queryset[self.offset:self.offset + self.limit])
 
+    def get_paginated_response(self, data):
+        if self.cursor_paginator:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
     def get_next_link(self):
         url = self.request.build_absolute_uri()
         url = replace_query_param(url, self.limit_query_param, self.limit)
@@ -29,3 +63,85 @@ class CountLessPaginatorAdmin(Paginator):
     @property
     def count(self):
         return 100000
+
+
+def _cursor_default(value):
+    # values are filtered back as strings, model fields convert them
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not cursor serializable')
+
+
+def encode_keyset_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(list(values), default=_cursor_default).encode()).decode()
+
+
+def decode_keyset_cursor(cursor):
+    values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(values, list):
+        raise ValueError('invalid cursor')
+    return values
+
+
+def get_keyset_ordering(qs) -> list:
+    """
+    [(field name, descending)] of queryset ordering, id is added last to break ties
+    """
+    ordering = []
+    for item in qs.query.order_by or qs.model._meta.ordering or ['-id']:
+        if isinstance(item, OrderBy) and isinstance(item.expression, F):
+            item = f'-{item.expression.name}' if item.descending else item.expression.name
+        if not isinstance(item, str) or item == '?':
+            raise ValueError(f'keyset pagination supports field ordering only, got {item}')
+        name = item.lstrip('-')
+        ordering.append(('id' if name == 'pk' else name, item.startswith('-')))
+        if ordering[-1][0] == 'id':
+            return ordering
+    ordering.append(('id', ordering[-1][1] if ordering else True))
+    return ordering
+
+
+def get_keyset_value(obj, name):
+    for attr in name.split(LOOKUP_SEP):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def keyset_page(qs, limit, cursor=None):
+    """
+    Page of queryset, rows after cursor of the previous page.
+    Cursor keeps values of all ordering fields of the last row, id breaks ties.
+    Ordering fields must not be null.
+    Returns (items, next page cursor or None)
+    """
+    ordering = get_keyset_ordering(qs)
+    qs = qs.order_by(*[f'-{name}' if desc else name for name, desc in ordering])
+
+    values = None
+    if cursor:
+        try:
+            values = decode_keyset_cursor(cursor)
+        except Exception:
+            # invalid cursor, start from the first page
+            pass
+        if values is not None and len(values) != len(ordering):
+            values = None
+
+    if values is not None:
+        # (a, b, id) after (x, y, z): a > x or a = x and b > y or a = x and b = y and id > z
+        condition = Q()
+        equal = {}
+        for (name, desc), value in zip(ordering, values):
+            condition |= Q(**equal, **{f'{name}__{"lt" if desc else "gt"}': value})
+            equal[name] = value
+        qs = qs.filter(condition)
+
+    items = list(qs[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_keyset_cursor(get_keyset_value(last, name) for name, _ in ordering)
+    return items, next_cursor
@@ -0,0 +1,149 @@
+import csv
+import datetime
+import json
+import re
+import tempfile
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import DefaultStorage
+from django.utils import timezone
+from openpyxl import Workbook
+
+from core.currency import Currency
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+
+class Echo:
+    """
+    File-like object for csv writer, returns written line instead of storing it
+    """
+
+    def write(self, value):
+        return value
+
+
+def get_export_fields(model, fields=None):
+    if fields:
+        return list(fields)
+    return [f.attname for f in model._meta.concrete_fields]
+
+
+def to_cell(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, Currency):
+        return value.code
+    if isinstance(value, datetime.datetime):
+        # xlsx does not keep time zone
+        if timezone.is_aware(value):
+            value = timezone.localtime(value).replace(tzinfo=None)
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value
+    return str(value)
+
+
+def iter_rows(queryset, fields, chunk_size=None):
+    """
+    Rows fetched by chunks with server side cursor, model instances are not created
+    """
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    for row in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        yield [to_cell(value) for value in row]
+
+
+def iter_csv(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='') as f:
+        for line in iter_csv(header, rows):
+            f.write(line)
+
+
+def write_xlsx(path, header, rows):
+    # write only workbook keeps rows in temp file instead of memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(header)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+
+WRITERS = {
+    'csv': write_csv,
+    'xlsx': write_xlsx,
+}
+
+
+def new_export_id():
+    return uuid.uuid4().hex
+
+
+def get_export_name(export_id, file_format, suffix=''):
+    if not EXPORT_ID_RE.match(export_id) or file_format not in EXPORT_FORMATS:
+        raise ValueError('Wrong export')
+    return f'{settings.EXPORTS_DIR}/{export_id}.{file_format}{suffix}'
+
+
+def export_queryset(queryset, fields, file_format, export_id):
+    """
+    Writes export to local temp file and saves it to default storage shared with web.
+    Done marker is saved after the file, so partially saved file is never served
+    """
+    storage = DefaultStorage()
+    name = get_export_name(export_id, file_format)
+    try:
+        with tempfile.NamedTemporaryFile(suffix=f'.{file_format}') as tmp:
+            WRITERS[file_format](tmp.name, fields, iter_rows(queryset, fields))
+            with open(tmp.name, 'rb') as f:
+                storage.save(name, File(f))
+        storage.save(get_export_name(export_id, file_format, '.done'), ContentFile(b''))
+    except Exception as e:
+        storage.save(get_export_name(export_id, file_format, '.error'), ContentFile(str(e).encode()))
+        raise
+    return name
+
+
+def get_export_state(export_id, file_format):
+    """
+    (state, storage name of file or error)
+    """
+    storage = DefaultStorage()
+    if storage.exists(get_export_name(export_id, file_format, '.done')):
+        return 'ready', get_export_name(export_id, file_format)
+    error_name = get_export_name(export_id, file_format, '.error')
+    if storage.exists(error_name):
+        with storage.open(error_name) as f:
+            return 'failed', f.read().decode()
+    return 'pending', None
+
+
+def open_export(name):
+    return DefaultStorage().open(name, 'rb')
+
+
+def cleanup_exports(keep_hours=None):
+    keep_hours = keep_hours or settings.EXPORT_KEEP_HOURS
+    storage = DefaultStorage()
+    try:
+        _, file_names = storage.listdir(settings.EXPORTS_DIR)
+    except FileNotFoundError:
+        return
+    min_modified = timezone.now() - datetime.timedelta(hours=keep_hours)
+    for file_name in file_names:
+        name = f'{settings.EXPORTS_DIR}/{file_name}'
+        if storage.get_modified_time(name) < min_modified:
+            storage.delete(name)
@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+
+from django.conf import settings
+from prometheus_client import CollectorRegistry
+from prometheus_client import Counter
+from prometheus_client import Histogram
+from prometheus_client import multiprocess
+from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+
+stack_place_order_seconds = Histogram(
+    'stack_place_order_seconds',
+    'Time of placed order matching in stack processor',
+    ['pair'],
+    buckets=LATENCY_BUCKETS,
+)
+stack_set_cache_seconds = Histogram(
+    'stack_set_cache_seconds',
+    'Time of stack export to cache and notification',
+    ['pair'],
+    buckets=LATENCY_BUCKETS,
+)
+notifications_group_send = Counter(
+    'notifications_group_send',
+    'Messages sent to channel layer groups',
+    ['kind'],
+)
+notifications_group_send_seconds = Histogram(
+    'notifications_group_send_seconds',
+    'Time of channel layer group_send',
+    ['kind'],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+class OrdersQueueCollector:
+    """
+    Messages waiting in orders.{PAIR} broker queues, read on scrape and reused for ttl seconds
+    """
+
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self.updated = 0
+        self.depths = {}
+
+    def read_depths(self) -> dict:
+        from exchange.celery_app import app
+        from core.models.inouts.pair import Pair
+
+        depths = {}
+        with app.connection_for_read() as connection:
+            channel = connection.channel()
+            for pair in Pair.objects.all():
+                try:
+                    _, depth, _ = channel.queue_declare(queue=f'orders.{pair.code.upper()}', passive=True)
+                except connection.channel_errors:
+                    # broker closes channel when queue does not exist
+                    channel = connection.channel()
+                    continue
+                depths[pair.code] = depth
+        return depths
+
+    def get_depths(self) -> dict:
+        if time.time() - self.updated > self.ttl:
+            try:
+                self.depths = self.read_depths()
+            except Exception as e:
+                log.warning('Unable to read orders queues depth: %s', e)
+            self.updated = time.time()
+        return self.depths
+
+    def collect(self):
+        gauge = GaugeMetricFamily('orders_queue_depth', 'Messages waiting in orders queue', labels=['pair'])
+        for pair_code, depth in self.get_depths().items():
+            gauge.add_metric([pair_code], depth)
+        yield gauge
+
+
+orders_queue_collector = OrdersQueueCollector()
+
+
+def get_web_registry():
+    """
+    Registry with metrics of all web worker processes, None if multiprocess mode is not set up
+    """
+    multiproc_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+    if not multiproc_dir:
+        return None
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry, path=multiproc_dir)
+    registry.register(orders_queue_collector)
+    return registry
+
+
+def start_metrics_server():
+    """
+    Serves metrics of current process on METRICS_ADDR and the first free port of METRICS_PORT range
+    """
+    if not settings.METRICS_ENABLED:
+        return None
+
+    for port in range(settings.METRICS_PORT, settings.METRICS_PORT + settings.METRICS_PORTS_COUNT):
+        try:
+            start_http_server(port, addr=settings.METRICS_ADDR)
+        except OSError:
+            continue
+        log.info('Metrics served on %s:%s', settings.METRICS_ADDR, port)
+        return port
+    log.warning('No free port for metrics in range from %s', settings.METRICS_PORT)
+    return None
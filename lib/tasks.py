@@ -1,9 +1,11 @@
 import enum
 import logging
 import pickle
+import uuid
 
 from celery.utils.serialization import b64encode, b64decode
 
+from .cache import redis_client
 from .exceptions import BaseError
 
 
@@ -24,6 +26,23 @@ class WrappedTaskManager:
         except Exception as exc:
             return WrappedTaskManager.pack_exception(exc)
 
+    @classmethod
+    def wrap_fn_and_reply(cls, reply_to, fn, *args, **kwargs):
+        """
+        wrap_fn with result sent to reply channel, if any.
+        Unknown exceptions are replied as RuntimeError and reraised
+        """
+        try:
+            result = cls.wrap_fn(fn, *args, **kwargs)
+        except Exception as exc:
+            if reply_to:
+                TaskReply.send(reply_to, cls.pack_unknown_exception(exc))
+            raise
+
+        if reply_to:
+            TaskReply.send(reply_to, result)
+        return result
+
     @classmethod
     def pack_result(cls, data=None) -> dict:
         return {
@@ -49,6 +68,15 @@ class WrappedTaskManager:
             'kwargs': cls._pack_object(kwargs),
         }
 
+    @classmethod
+    def pack_unknown_exception(cls, exc) -> dict:
+        return {
+            'status': WrappedTaskResultStatus.ERROR.value,
+            'type': cls._pack_object(RuntimeError),
+            'args': cls._pack_object((str(exc),)),
+            'kwargs': cls._pack_object({}),
+        }
+
     @classmethod
     def unpack_result_or_raise(cls, result: dict):
         print(result)
@@ -69,3 +97,36 @@ class WrappedTaskManager:
     @staticmethod
     def _unpack_object(packed_obj):
         return pickle.loads(b64decode(packed_obj))
+
+
+class TaskReply:
+    """
+    Task result delivered through per-request redis list instead of celery result backend,
+    caller blocks on BLPOP and wakes up as soon as task replies
+    """
+    KEY_PREFIX = 'task-reply-'
+    TTL = 60  # seconds, reply not taken in time is dropped
+
+    @classmethod
+    def make_key(cls):
+        return f'{cls.KEY_PREFIX}{uuid.uuid4().hex}'
+
+    @classmethod
+    def call(cls, task, args, queue, timeout):
+        reply_to = cls.make_key()
+        task.apply_async(args, kwargs={'reply_to': reply_to}, queue=queue, ignore_result=True)
+        return cls.wait(reply_to, timeout)
+
+    @classmethod
+    def send(cls, reply_to, result):
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.rpush(reply_to, pickle.dumps(result))
+        pipe.expire(reply_to, cls.TTL)
+        pipe.execute()
+
+    @classmethod
+    def wait(cls, reply_to, timeout):
+        item = redis_client.blpop([reply_to], timeout=timeout)
+        if item is None:
+            raise TimeoutError(f'No reply in {timeout} seconds')
+        return pickle.loads(item[1])
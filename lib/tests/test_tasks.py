@@ -0,0 +1,48 @@
+import threading
+import time
+
+import pytest
+
+from lib.exceptions import BaseError
+from lib.tasks import TaskReply
+from lib.tasks import WrappedTaskManager
+
+
+class ReplyTestError(BaseError):
+    default_detail = 'Reply test error'
+
+
+def fail_with(exc):
+    raise exc
+
+
+class TestTaskReply:
+
+    def test_reply(self):
+        reply_to = TaskReply.make_key()
+        sender = threading.Timer(0.1, TaskReply.send, [reply_to, WrappedTaskManager.pack_result({'id': 1})])
+        sender.start()
+
+        started = time.time()
+        result = TaskReply.wait(reply_to, timeout=5)
+        assert time.time() - started < 5
+        assert WrappedTaskManager.unpack_result_or_raise(result) == {'id': 1}
+
+    def test_timeout(self):
+        with pytest.raises(TimeoutError):
+            TaskReply.wait(TaskReply.make_key(), timeout=1)
+
+    def test_known_error_reply(self):
+        reply_to = TaskReply.make_key()
+        WrappedTaskManager.wrap_fn_and_reply(reply_to, fail_with, ReplyTestError('known'))
+
+        with pytest.raises(ReplyTestError):
+            WrappedTaskManager.unpack_result_or_raise(TaskReply.wait(reply_to, timeout=1))
+
+    def test_unknown_error_reply(self):
+        reply_to = TaskReply.make_key()
+        with pytest.raises(ValueError):
+            WrappedTaskManager.wrap_fn_and_reply(reply_to, fail_with, ValueError('unknown'))
+
+        with pytest.raises(RuntimeError, match='unknown'):
+            WrappedTaskManager.unpack_result_or_raise(TaskReply.wait(reply_to, timeout=1))
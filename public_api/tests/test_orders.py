@@ -11,6 +11,8 @@ PASSWORD = 'admin'
 OWN_ORDERS_URL = '/api/public/orders'
 ORDER_URL = '/api/public/order/'
 UPDATE_ORDER_URL = '/api/public/order/update'
+BULK_ORDERS_URL = '/api/public/order/bulk'
+BULK_CANCEL_ORDERS_URL = '/api/public/order/bulk_cancel'
 
 
 def test_create_limit_order():
@@ -227,3 +229,51 @@ def test_update_limit_order():
     })
 
     # todo: fix filter
+
+
+def test_bulk_create_and_cancel_orders():
+    """
+    Create orders batch and cancel them by ids
+    """
+    c = Client()
+
+    orders_data = [{
+        'pair': 'BTC-USD',
+        'type': Order.ORDER_TYPE_LIMIT,
+        'operation': Order.OPERATION_BUY,
+        'quantity': 0.001,
+        'price': 1 + i * 0.01,
+    } for i in range(5)]
+
+    # not authorized
+    res = c.post(BULK_ORDERS_URL, data=orders_data)
+    assert res.status_code == status.HTTP_403_FORBIDDEN
+
+    # authorized
+    c.login(USERNAME, PASSWORD)
+    res = c.post(BULK_ORDERS_URL, data=orders_data)
+    assert res.status_code == status.HTTP_201_CREATED
+
+    created_order_ids = [i['id'] for i in res.json()]
+    assert len(created_order_ids) == len(orders_data)
+
+    res = c.get(OWN_ORDERS_URL)
+    assert res.status_code == status.HTTP_200_OK
+
+    order_ids = [i['id'] for i in res.json()]
+    for order_id in created_order_ids:
+        assert order_id in order_ids
+
+    res = c.post(BULK_CANCEL_ORDERS_URL, data={'ids': created_order_ids})
+    assert res.status_code == status.HTTP_200_OK
+    assert sorted(res.json()['cancelled']) == sorted(created_order_ids)
+
+    # wait cancel
+    time.sleep(1)
+
+    res = c.get(OWN_ORDERS_URL)
+    assert res.status_code == status.HTTP_200_OK
+
+    for i in res.json():
+        if i.get('id') in created_order_ids:
+            assert i.get('state') == Order.STATE_CANCELLED